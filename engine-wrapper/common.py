@@ -1,5 +1,7 @@
+import json
 import os
 import socket
+import struct
 import subprocess
 import sys
 from pathlib import Path
@@ -125,8 +127,67 @@ def get_pc_url_config(bind_address, server_port, disable_auto_origins, allowed_o
         return candidate_pc_url, False
 
 
+def list_processes():
+    """Linux: /proc を走査して {pid: (ppid, pgid, sid)} を返す。/proc がない環境では空の辞書"""
+    processes = {}
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return processes
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # comm (2番目のフィールド) は空白や括弧を含みうるため、最後の ')' 以降を解析する
+        fields = stat[stat.rindex(")") + 2 :].split()
+        processes[int(entry.name)] = (int(fields[1]), int(fields[2]), int(fields[3]))
+    return processes
+
+
+def get_descendant_pids(pid, processes=None):
+    """指定したプロセスの子孫プロセスの PID を返す (Linux のみ)"""
+    if processes is None:
+        processes = list_processes()
+    children = {}
+    for child, (ppid, _pgid, _sid) in processes.items():
+        children.setdefault(ppid, []).append(child)
+    descendants = []
+    stack = [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            descendants.append(child)
+            stack.append(child)
+    return descendants
+
+
+def unix_listener_pid(path):
+    """Linux: Unix ドメインソケット (SOCK_SEQPACKET) で待ち受けているプロセスの PID を返す。待ち受けがなければ None"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as sock:
+        try:
+            sock.connect(str(path))
+            creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        except OSError:
+            return None
+    pid, _uid, _gid = struct.unpack("3i", creds)
+    return pid
+
+
+def get_rss_kb(pid, field="VmRSS"):
+    """プロセスの常駐メモリ量 (VmRSS, KB) を返す。field="VmHWM" でピーク値。取得できない場合は 0"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
 def kill_proc_tree(pid):
-    """Windows環境でプロセスツリー全体を強制終了する。Unix系ではSIGKILLを送信"""
+    """プロセスツリー全体を強制終了する。Unix系では子孫プロセス (Linux) と本体に SIGKILL を送信"""
     if os.name == "nt":
         startupinfo = subprocess.STARTUPINFO()
         startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
@@ -140,9 +201,64 @@ def kill_proc_tree(pid):
         except Exception:
             pass
     else:
-        try:
-            import signal
+        import signal
 
-            os.kill(pid, signal.SIGKILL)
-        except Exception:
-            pass
+        # エンジンは独自のプロセスグループで動くため、グループではなく親子関係をたどる
+        for target in [pid, *get_descendant_pids(pid)]:
+            try:
+                os.kill(target, signal.SIGKILL)
+            except Exception:
+                pass
+
+
+def validate_engine_list(data):
+    """engines.json の内容を検証する。不正な場合は ValueError"""
+    # Basic structure validation
+    if not isinstance(data, list):
+        raise ValueError("Root must be a list")
+
+    # Validate each entry
+    for i, entry in enumerate(data):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Entry at index {i} must be an object")
+
+        # Required fields
+        for field in ["id", "name", "path"]:
+            if field not in entry:
+                raise ValueError(f"Missing required field '{field}' in entry {i}")
+            if not isinstance(entry[field], str):
+                raise ValueError(f"Field '{field}' in entry {i} must be a string")
+
+        if not entry["id"].strip():
+            raise ValueError(f"Engine ID in entry {i} cannot be empty")
+
+        # Optional fields validation
+        if "type" in entry:
+            if not isinstance(entry["type"], str):
+                raise ValueError(f"Field 'type' in entry {i} must be a string")
+            if entry["type"] not in ["game", "research", "both"]:
+                raise ValueError(f"Invalid type '{entry['type']}' in entry {i}")
+
+        if "options" in entry and not isinstance(entry["options"], dict):
+            raise ValueError(f"Field 'options' in entry {i} must be an object")
+
+        if "limits" in entry:
+            limits = entry["limits"]
+            if not isinstance(limits, dict):
+                raise ValueError(f"Field 'limits' in entry {i} must be an object")
+            for key, value in limits.items():
+                if key not in ("memory_mb", "nice", "cpu_seconds"):
+                    raise ValueError(f"Unknown limit '{key}' in entry {i}")
+                if not isinstance(value, int) or isinstance(value, bool):
+                    raise ValueError(f"Limit '{key}' in entry {i} must be an integer")
+            if not -20 <= limits.get("nice", 0) <= 19:
+                raise ValueError(f"Limit 'nice' in entry {i} must be between -20 and 19")
+            if limits.get("memory_mb", 1) <= 0 or limits.get("cpu_seconds", 1) <= 0:
+                raise ValueError(f"Limits 'memory_mb' and 'cpu_seconds' in entry {i} must be positive")
+
+
+def save_engine_list(path, data):
+    """engines.json の内容を検証してから書き込む"""
+    validate_engine_list(data)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,85 @@
+"""
+Compressed wrapper-to-client stream ('run <id> compress=zlib').
+
+Everything the wrapper sends after the 'run' command is one zlib stream (RFC 1950).
+Each flush ends with Z_SYNC_FLUSH, so the client can decompress all lines received so
+far at any time (e.g. zlib.createInflate() in Node.js). Commands from the client stay
+plain text; they are short and rare compared to 'info' output.
+
+With COMPRESS_FLUSH_MS=0 the stream is flushed at every line end. A larger value
+collects the lines written within that time into one flush, which compresses better
+(long PVs repeat between MultiPV lines) at the cost of up to that much added latency.
+"""
+
+import asyncio
+import zlib
+
+COMPRESSION_MODES = ("none", "zlib")
+
+
+class LineCompressor:
+    """A zlib stream that can be flushed at line boundaries."""
+
+    def __init__(self, level: int = zlib.Z_DEFAULT_COMPRESSION):
+        self._compressor = zlib.compressobj(level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class CompressedWriter:
+    """
+    Wraps the asyncio.StreamWriter of a client socket and compresses what is written to it.
+    Provides the part of StreamWriter that the wrapper uses; the rest is delegated.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, level: int, flush_interval: float):
+        self._writer = writer
+        self._compressor = LineCompressor(level)
+        self.flush_interval = flush_interval
+        self._pending = False
+        self._timer = None
+        # Bytes before and after compression
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.bytes_in += len(data)
+        self._send(self._compressor.compress(data))
+        self._pending = True
+        if self.flush_interval <= 0 and data.endswith(b"\n"):
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending and not self._writer.is_closing():
+            self._pending = False
+            self._send(self._compressor.flush())
+
+    def _send(self, data: bytes):
+        if data:
+            self.bytes_out += len(data)
+            self._writer.write(data)
+
+    async def drain(self):
+        await self._writer.drain()
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def ratio(self) -> float:
+        """Compressed size relative to the original (0.25 means 75% saved)."""
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
@@ -1,14 +1,14 @@
 import json
 import os
 import queue
-import shlex
 import subprocess
 import sys
 import threading
 import time
 from pathlib import Path
 
-from common import BASE_DIR, is_bundled
+from common import BASE_DIR, is_bundled, save_engine_list
+from usi_parser import OPTION_KEYWORDS, iter_fields
 
 # --- pythonnet / clr-loader initialization ---
 # For bundled environment, explicitly set the Python DLL path for pythonnet
@@ -39,31 +39,28 @@ def parse_usi_option_line(line):
     format: option name <Name> type <Type> [default <Default>] [min <Min>] [max <Max>] [var <Var>]...
     """
     try:
-        parts = shlex.split(line)
-        if not parts or parts[0] != "option":
+        if not line.startswith("option"):
             return None, None
 
-        it = iter(parts[1:])
         name = None
         option_data = {}
         combo_vars = []
 
-        for part in it:
-            if part == "name":
-                name = next(it)
-            elif part == "type":
-                option_data["type"] = next(it)
-            elif part == "default":
-                default_val = next(it)
-                if default_val == "<empty>":
-                    default_val = ""
-                option_data["default"] = default_val
-            elif part == "min":
-                option_data["min"] = int(next(it))
-            elif part == "max":
-                option_data["max"] = int(next(it))
-            elif part == "var":
-                combo_vars.append(next(it))
+        for keyword, values in iter_fields(line, OPTION_KEYWORDS):
+            # Only 'default' may contain spaces (string options)
+            value = " ".join(values) if keyword == "default" else next(iter(values))
+            if keyword == "name":
+                name = value
+            elif keyword == "type":
+                option_data["type"] = value
+            elif keyword == "default":
+                option_data["default"] = "" if value == "<empty>" else value
+            elif keyword == "min":
+                option_data["min"] = int(value)
+            elif keyword == "max":
+                option_data["max"] = int(value)
+            elif keyword == "var":
+                combo_vars.append(value)
 
         if not name or "type" not in option_data:
             return None, None
@@ -107,39 +104,7 @@ class Api:
 
     def save(self, data):
         try:
-            # Basic structure validation
-            if not isinstance(data, list):
-                raise ValueError("Root must be a list")
-
-            # Validate each entry
-            for i, entry in enumerate(data):
-                if not isinstance(entry, dict):
-                    raise ValueError(f"Entry at index {i} must be an object")
-
-                # Required fields
-                for field in ["id", "name", "path"]:
-                    if field not in entry:
-                        raise ValueError(f"Missing required field '{field}' in entry {i}")
-                    if not isinstance(entry[field], str):
-                        raise ValueError(f"Field '{field}' in entry {i} must be a string")
-
-                if not entry["id"].strip():
-                    raise ValueError(f"Engine ID in entry {i} cannot be empty")
-
-                # Optional fields validation
-                if "type" in entry:
-                    if not isinstance(entry["type"], str):
-                        raise ValueError(f"Field 'type' in entry {i} must be a string")
-                    if entry["type"] not in ["game", "research", "both"]:
-                        raise ValueError(f"Invalid type '{entry['type']}' in entry {i}")
-
-                if "options" in entry and not isinstance(entry["options"], dict):
-                    raise ValueError(f"Field 'options' in entry {i} must be an object")
-
-            # Write to file
-            with open(ENGINES_JSON_PATH, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-
+            save_engine_list(ENGINES_JSON_PATH, data)
             return {"status": "ok"}
         except Exception as e:
             return {"error": str(e)}
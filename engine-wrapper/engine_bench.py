@@ -0,0 +1,267 @@
+"""
+Engine benchmark and regression tracker.
+
+Starts each engine of engines.json with its "options", as the wrapper does, and searches
+BENCH_POSITIONS for a fixed time ('go byoyomi <ms>') or a fixed number of nodes
+('go nodes <n>'). For every engine it measures:
+
+  readyok   time from the start of the process to 'readyok' (weights, hash allocation)
+  nps       total nodes / total search time of the positions, from the last 'info' lines
+  peak RSS  high-water mark of the engine's resident memory (Linux only)
+
+Results are appended to bench_history.jsonl and compared with the last run of the same
+engine with the same search settings; a change for the worse beyond --threshold is
+reported as a regression (exit code 1).
+
+Usage: uv run python engine_bench.py [engine ids] [--movetime 3000 | --nodes 2000000] [--threshold 0.1]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from common import BASE_DIR, get_rss_kb
+from engine_wrapper import engine_option_lines, get_engine_list, resolve_engine_path, start_engine_process, stop_engine_process
+from usi_parser import parse_info
+
+# Opening and middle game positions of common strategies, from the start position
+BENCH_POSITIONS = [
+    "startpos",
+    "startpos moves 7g7f 3c3d 2g2f 8c8d 2f2e 8d8e 6i7h 4a3b 2e2d 2c2d 2h2d 8e8f 8g8f 8b8f 2d3d 2b3c",
+    "startpos moves 7g7f 8c8d 7i6h 3c3d 6h7g 7a6b 2g2f 5a4b 5g5f 5c5d",
+    "startpos moves 7g7f 3c3d 6g6f 8c8d 2h6h 8d8e 8h7g 7a6b 5i4h 5a4b",
+    "startpos moves 2g2f 8c8d 2f2e 8d8e 6i7h 4a3b 2e2d 2c2d 2h2d P*2c 2d2f 8e8f 8g8f 8b8f",
+]
+
+HISTORY_FILE = BASE_DIR / "bench_history.jsonl"
+DEFAULT_MOVETIME_MS = 3000
+DEFAULT_THRESHOLD = 0.1
+# Time allowed for 'usiok' and 'readyok' (NN weights may take a while to load)
+READY_TIMEOUT = 120.0
+# Extra time after the expected end of a search before it is stopped
+SEARCH_GRACE = 10.0
+
+
+class BenchError(Exception):
+    pass
+
+
+async def read_until(engine_process, token: str, timeout: float, on_line=None) -> str:
+    """Read engine stdout until a line starting with token. on_line gets every line."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        try:
+            line_bytes = await asyncio.wait_for(engine_process.stdout.readline(), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            raise BenchError(f"No '{token}' within {timeout:g}s") from None
+        if not line_bytes:
+            raise BenchError(f"Engine exited before '{token}' (exit code {engine_process.returncode})")
+        line = line_bytes.decode(errors="ignore").strip()
+        if on_line:
+            on_line(line)
+        if line.split(maxsplit=1)[:1] == [token]:
+            return line
+
+
+async def send(engine_process, *commands: str):
+    engine_process.stdin.write("".join(f"{command}\n" for command in commands).encode())
+    await engine_process.stdin.drain()
+
+
+async def search_position(engine_process, position: str, go_command: str, timeout: float) -> dict:
+    """Search one position. Returns nodes, time (ms), depth and the time each depth was first reported."""
+    result = {"nodes": 0, "time_ms": None, "depth": 0, "depth_times": {}}
+    started = time.monotonic()
+
+    def on_line(line: str):
+        if not line.startswith("info"):
+            return
+        info = parse_info(line)
+        elapsed = info.get("time", round((time.monotonic() - started) * 1000))
+        if "nodes" in info:
+            result["nodes"] = info["nodes"]
+            result["time_ms"] = elapsed
+        depth = info.get("depth")
+        if depth and depth not in result["depth_times"]:
+            result["depth_times"][depth] = elapsed
+            result["depth"] = max(result["depth"], depth)
+
+    await send(engine_process, f"position {position}", go_command)
+    try:
+        await read_until(engine_process, "bestmove", timeout, on_line)
+    except BenchError:
+        # Engines that ignore 'go nodes' search until they are stopped
+        await send(engine_process, "stop")
+        await read_until(engine_process, "bestmove", SEARCH_GRACE, on_line)
+    if result["time_ms"] is None:
+        result["time_ms"] = round((time.monotonic() - started) * 1000)
+    return result
+
+
+async def run_bench(engine_def: dict, go_command: str, positions: list = BENCH_POSITIONS, search_timeout: float = 60.0) -> dict:
+    """Benchmark one engines.json entry. Raises BenchError when the engine does not cooperate."""
+    engine_path = resolve_engine_path(engine_def["path"])
+    if not engine_path.is_file():
+        raise BenchError(f"Engine not found at {engine_path}")
+    started = time.monotonic()
+    engine_process = await start_engine_process(engine_path, limits=engine_def.get("limits"))
+    # stderr is not used, but must not fill up
+    stderr_task = asyncio.create_task(engine_process.stderr.read())
+    usi_options = []
+
+    def on_usi_line(line: str):
+        tokens = line.split()
+        if tokens[:2] == ["option", "name"] and len(tokens) > 2:
+            usi_options.append(tokens[2])
+
+    try:
+        await send(engine_process, "usi")
+        await read_until(engine_process, "usiok", READY_TIMEOUT, on_usi_line)
+        await send(engine_process, *engine_option_lines(engine_def.get("options")), "isready")
+        await read_until(engine_process, "readyok", READY_TIMEOUT)
+        readyok_ms = round((time.monotonic() - started) * 1000)
+        await send(engine_process, "usinewgame")
+
+        searches = [await search_position(engine_process, position, go_command, search_timeout) for position in positions]
+        peak_rss_kb = get_rss_kb(engine_process.pid, "VmHWM")
+    finally:
+        await stop_engine_process(engine_process)
+        stderr_task.cancel()
+
+    nodes = sum(search["nodes"] for search in searches)
+    seconds = sum(search["time_ms"] for search in searches) / 1000
+    return {
+        "readyok_ms": readyok_ms,
+        "nps": round(nodes / seconds) if seconds > 0 else 0,
+        "nodes": nodes,
+        "peak_rss_kb": peak_rss_kb or None,
+        "searches": searches,
+        "usi_options": usi_options,
+    }
+
+
+def load_history(path: Path) -> list:
+    if not path.exists():
+        return []
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def append_history(path: Path, record: dict):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def find_baseline(history: list, record: dict) -> dict | None:
+    """The last run of the same engine with the same search settings on the same host."""
+    for previous in reversed(history):
+        if all(previous.get(key) == record.get(key) for key in ("engine", "go", "positions", "host")):
+            return previous
+    return None
+
+
+def regressions(record: dict, baseline: dict, threshold: float) -> list[str]:
+    """Measurements that got worse than the baseline by more than threshold (a fraction)."""
+    found = []
+    if baseline.get("nps") and record["nps"] < baseline["nps"] * (1 - threshold):
+        found.append(f"NPS {baseline['nps']:,} -> {record['nps']:,}")
+    # Lower is better for these
+    for key, label in (("readyok_ms", "readyok"), ("peak_rss_kb", "peak RSS")):
+        if baseline.get(key) and record.get(key) and record[key] > baseline[key] * (1 + threshold):
+            found.append(f"{label} {baseline[key]:,} -> {record[key]:,}")
+    return found
+
+
+def format_change(value, previous) -> str:
+    if not value or not previous:
+        return ""
+    return f" ({(value - previous) / previous:+.1%})"
+
+
+async def bench_engines(engines: list, args) -> bool:
+    """Benchmark the engines and print the results. Returns False if there was a regression or an error."""
+    go_command = f"go nodes {args.nodes}" if args.nodes else f"go btime 0 wtime 0 byoyomi {args.movetime}"
+    search_timeout = 60.0 if args.nodes else args.movetime / 1000 + SEARCH_GRACE
+    history = load_history(args.history)
+    ok = True
+    for engine_def in engines:
+        engine_id = engine_def.get("id")
+        print(f"{engine_id}: {len(BENCH_POSITIONS)} positions, '{go_command}'", flush=True)
+        try:
+            result = await run_bench(engine_def, go_command, search_timeout=search_timeout)
+        except (BenchError, OSError) as e:
+            print(f"  failed: {e}")
+            ok = False
+            continue
+
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "engine": engine_id,
+            "go": go_command,
+            "positions": len(BENCH_POSITIONS),
+            "host": platform.node(),
+            "options": engine_def.get("options") or {},
+            **{key: result[key] for key in ("readyok_ms", "nps", "nodes", "peak_rss_kb")},
+        }
+        baseline = find_baseline(history, record)
+        previous = baseline or {}
+        rss = f"{record['peak_rss_kb'] // 1024:,} MB" if record["peak_rss_kb"] else "-"
+        print(f"  readyok   {record['readyok_ms']:,} ms{format_change(record['readyok_ms'], previous.get('readyok_ms'))}")
+        print(f"  nps       {record['nps']:,}{format_change(record['nps'], previous.get('nps'))}")
+        print(f"  peak RSS  {rss}{format_change(record['peak_rss_kb'], previous.get('peak_rss_kb'))}")
+        if baseline:
+            if baseline.get("options") != record["options"]:
+                print("  (options changed since the last run)")
+            found = regressions(record, baseline, args.threshold)
+            if found:
+                print(f"  REGRESSION against {baseline['time']}: {', '.join(found)}")
+                ok = False
+        else:
+            print("  (no previous run to compare with)")
+        if not args.no_save:
+            append_history(args.history, record)
+            history.append(record)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("engines", nargs="*", help="engine ids (default: all engines in engines.json)")
+    search = parser.add_mutually_exclusive_group()
+    search.add_argument("--movetime", type=int, default=DEFAULT_MOVETIME_MS, help="search time per position (ms)")
+    search.add_argument("--nodes", type=int, help="search a fixed number of nodes per position instead")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="change reported as a regression (fraction)")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    parser.add_argument("--no-save", action="store_true", help="do not append the results to the history")
+    args = parser.parse_args()
+    # The engine start/stop messages of the wrapper functions are not interesting here
+    logging.getLogger().setLevel(logging.WARNING)
+
+    engines = get_engine_list()
+    if args.engines:
+        unknown = set(args.engines) - {e.get("id") for e in engines}
+        if unknown:
+            print(f"Unknown engine id(s): {', '.join(sorted(unknown))}", file=sys.stderr)
+            sys.exit(2)
+        engines = [e for e in engines if e.get("id") in args.engines]
+    if not engines:
+        print("No engines to benchmark.", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(0 if asyncio.run(bench_engines(engines, args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Threads / USI_Hash / DNN_Batch_Size1 tuner for the local machine.
+
+Sweeps one option at a time on the positions of engine_bench.py, keeping the chosen
+value of each option for the sweeps after it:
+
+  Threads           time to the reference depth
+  USI_Hash          time to the reference depth
+  DNN_Batch_Size1   NPS (only for engines that have the option, e.g. FukauraOu)
+
+The reference depth is the deepest one that the current settings reach on every
+position. Among the values within --tolerance of the best, the smallest is chosen:
+fewer threads leave room for other sessions and a smaller hash saves memory. With
+--apply the chosen values are written to the engine's "options" in engines.json, with
+the same validation as the config editor.
+
+Usage: uv run python engine_tuner.py <engine id> [--threads 1 2 4 8] [--hash 256 1024 4096]
+                                     [--batch 64 128 256] [--movetime 3000] [--apply]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from common import BASE_DIR, save_engine_list
+from engine_bench import BENCH_POSITIONS, DEFAULT_MOVETIME_MS, SEARCH_GRACE, BenchError, run_bench
+from engine_wrapper import get_engine_list
+
+ENGINES_JSON_PATH = BASE_DIR / "engines.json"
+DEFAULT_TOLERANCE = 0.03
+HASH_CANDIDATES_MB = [256, 1024, 4096, 16384]
+BATCH_CANDIDATES = [64, 128, 256, 512]
+
+
+def default_thread_candidates() -> list[int]:
+    cpus = os.cpu_count() or 1
+    candidates = {cpus}
+    threads = 1
+    while threads < cpus:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+
+def default_hash_candidates() -> list[int]:
+    """Hash sizes up to half of the physical memory (all of them where it cannot be told)."""
+    try:
+        memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return HASH_CANDIDATES_MB
+    return [size for size in HASH_CANDIDATES_MB if size <= memory_mb // 2] or HASH_CANDIDATES_MB[:1]
+
+
+def reference_depth(result: dict) -> int:
+    return min((search["depth"] for search in result["searches"]), default=0)
+
+
+def time_to_depth(result: dict, depth: int, penalty_ms: float) -> float:
+    """Mean time (ms) to reach depth over the positions; a position that did not reach it counts as penalty_ms."""
+    times = [search["depth_times"].get(depth, penalty_ms) for search in result["searches"]]
+    return sum(times) / len(times)
+
+
+def choose(scores: dict, higher_is_better: bool, tolerance: float):
+    """The smallest value whose score is within tolerance of the best one."""
+    best = max(scores.values()) if higher_is_better else min(scores.values())
+    for value in sorted(scores):
+        score = scores[value]
+        if (score >= best * (1 - tolerance)) if higher_is_better else (score <= best * (1 + tolerance)):
+            return value
+    return None
+
+
+async def tune(engine_def: dict, sweeps: list, movetime: int, tolerance: float) -> dict:
+    """Run the sweeps [(option name, candidates)] and return the tuned options."""
+    options = dict(engine_def.get("options") or {})
+    go_command = f"go btime 0 wtime 0 byoyomi {movetime}"
+    timeout = movetime / 1000 + SEARCH_GRACE
+    penalty_ms = movetime * 2
+
+    current = await run_bench({**engine_def, "options": options}, go_command, search_timeout=timeout)
+    depth = reference_depth(current)
+    print(f"current options: nps {current['nps']:,}, reference depth {depth}", flush=True)
+
+    for name, candidates in sweeps:
+        if name not in current["usi_options"]:
+            print(f"{name}: not an option of this engine, skipped")
+            continue
+        # NPS for the batch size, and for engines that do not report depths
+        by_nps = name == "DNN_Batch_Size1" or depth == 0
+        scores = {}
+        for value in candidates:
+            try:
+                result = await run_bench({**engine_def, "options": {**options, name: value}}, go_command, search_timeout=timeout)
+            except (BenchError, OSError) as e:
+                print(f"{name} {value}: failed ({e})", flush=True)
+                continue
+            scores[value] = result["nps"] if by_nps else time_to_depth(result, depth, penalty_ms)
+            rss = f"{result['peak_rss_kb'] // 1024:,} MB" if result["peak_rss_kb"] else "-"
+            reached = time_to_depth(result, depth, penalty_ms)
+            print(f"{name} {value}: nps {result['nps']:,}, depth {depth} in {reached:,.0f} ms, peak RSS {rss}", flush=True)
+        if not scores:
+            print(f"{name}: no value worked, keeping {options.get(name, 'the default')}")
+            continue
+        options[name] = choose(scores, by_nps, tolerance)
+        print(f"{name}: {options[name]}", flush=True)
+    return options
+
+
+def apply_options(path, engine_id: str, options: dict):
+    """Write the options of one engine to engines.json."""
+    with open(path, encoding="utf-8") as f:
+        engines = json.load(f)
+    for entry in engines:
+        if isinstance(entry, dict) and entry.get("id") == engine_id:
+            entry["options"] = {**(entry.get("options") or {}), **options}
+            break
+    else:
+        raise ValueError(f"Engine '{engine_id}' not found in {path}")
+    save_engine_list(path, engines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("engine", help="engine id in engines.json")
+    parser.add_argument("--threads", nargs="+", type=int, default=default_thread_candidates())
+    parser.add_argument("--hash", nargs="+", type=int, default=default_hash_candidates(), help="USI_Hash values (MB)")
+    parser.add_argument("--batch", nargs="+", type=int, default=BATCH_CANDIDATES, help="DNN_Batch_Size1 values")
+    parser.add_argument("--movetime", type=int, default=DEFAULT_MOVETIME_MS, help="search time per position (ms)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="scores this close to the best count as equal")
+    parser.add_argument("--apply", action="store_true", help="write the chosen values to engines.json")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    engine_def = next((e for e in get_engine_list() if e.get("id") == args.engine), None)
+    if engine_def is None:
+        print(f"Unknown engine id: {args.engine}", file=sys.stderr)
+        sys.exit(2)
+    sweeps = [("Threads", args.threads), ("USI_Hash", args.hash), ("DNN_Batch_Size1", args.batch)]
+    runs = 1 + sum(len(candidates) for _, candidates in sweeps)
+    print(f"{args.engine}: up to {runs} runs of {len(BENCH_POSITIONS)} positions x {args.movetime} ms", flush=True)
+    try:
+        options = asyncio.run(tune(engine_def, sweeps, args.movetime, args.tolerance))
+    except (BenchError, OSError) as e:
+        print(f"Failed with the current options: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    tuned = {name: options[name] for name, _ in sweeps if name in options}
+    print(f"tuned options: {json.dumps(tuned)}")
+    if args.apply:
+        apply_options(ENGINES_JSON_PATH, args.engine, tuned)
+        print(f"Written to {ENGINES_JSON_PATH}")
+
+
+if __name__ == "__main__":
+    main()
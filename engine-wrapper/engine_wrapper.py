@@ -1,19 +1,52 @@
+import argparse
 import asyncio
 import hashlib
 import hmac
+import ipaddress
+import itertools
 import json
 import logging
+import multiprocessing
 import os
 import secrets
+import signal
+import socket
+import stat
 import subprocess
 import sys
+import time
+import weakref
+from collections import Counter, deque
 from datetime import datetime, timezone
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
 from dotenv import load_dotenv
 
-from common import BASE_DIR, is_bundled
+from common import BASE_DIR, get_descendant_pids, get_rss_kb, is_bundled, kill_proc_tree, list_processes
+from compression import COMPRESSION_MODES, CompressedWriter
+from handoff import (
+    HANDOFF_SUPPORTED,
+    MAX_MESSAGE_SIZE,
+    AdoptedProcess,
+    drain_reader,
+    flush_writer,
+    open_client_socket,
+    open_pipe_reader,
+    open_pipe_writer,
+    pipe_transports,
+    recv_message,
+    send_message,
+    transport_fileno,
+)
+from latency_trace import SessionTrace, start_trace_writer, stop_trace_writer, trace_enabled
+from profiler import PROFILE_MODES, ProfilerBusyError, format_tasks, run_profile
+from root_split import RootSplitSession, split_engine_options, token_value
+from search_health import SEARCH_PROFILES, SearchSampler
+from session_ticket import TicketBook
+from time_margin import CLIENT_RTT_COMMAND, NetworkTimeKeeper
+from transcript import SessionTranscript, start_transcript_writer, stop_transcript_writer, transcripts_enabled
+from usi_parser import OUTPUT_FORMATS, info_frame
 
 # Configure logging
 log_handlers = []
@@ -48,6 +81,238 @@ load_dotenv(dotenv_path=BASE_DIR / ".env")
 HOST = os.getenv("BIND_ADDRESS", "127.0.0.1")
 PORT = int(os.getenv("LISTEN_PORT", "4082"))
 
+# Optional Unix domain socket for a co-located server.ts (Linux/macOS only)
+UNIX_SOCKET_PATH = os.getenv("LISTEN_UNIX", "")
+
+# Event loop: "auto" uses uvloop when it is installed (not available on Windows), "asyncio" forces the default loop
+EVENT_LOOP = os.getenv("WRAPPER_EVENT_LOOP", "auto").lower()
+
+# Client socket buffer sizes in bytes (0 = OS default; Linux auto-tunes unless these are set)
+SOCKET_SNDBUF = int(os.getenv("SOCKET_SNDBUF", "0"))
+SOCKET_RCVBUF = int(os.getenv("SOCKET_RCVBUF", "0"))
+
+# Zero-copy relay of engine stdout to the client socket with splice() (Linux only, experimental).
+# Engine output lines are not logged in this mode.
+ZERO_COPY_RELAY = os.getenv("ZERO_COPY_RELAY", "false").lower() == "true"
+SPLICE_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of concurrent engine sessions across all workers (0 = unlimited)
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "0"))
+
+# Connection flood protection, checked before a connection gets a nonce (0 disables each limit):
+# new connections per client IP within CONN_RATE_WINDOW seconds (loopback is exempt: a co-located
+# server.ts opens one connection per browser request), connections that are still in the handshake
+# (authentication and first command) and the time allowed for the handshake
+CONN_RATE_LIMIT = int(os.getenv("CONN_RATE_LIMIT", "30"))
+CONN_RATE_WINDOW = float(os.getenv("CONN_RATE_WINDOW", "10"))
+MAX_HANDSHAKES = int(os.getenv("MAX_HANDSHAKES", "64"))
+HANDSHAKE_TIMEOUT = float(os.getenv("HANDSHAKE_TIMEOUT", "10"))
+
+# Number of worker processes sharing the port with SO_REUSEPORT (Linux only, 1 = single process)
+WORKERS = int(os.getenv("WRAPPER_WORKERS", "1"))
+
+# Socket used to hand listeners and live sessions over to a new process started with --takeover (Linux only)
+HANDOFF_SOCKET_PATH = os.getenv("HANDOFF_SOCKET", str(BASE_DIR / "engine_wrapper.handoff.sock"))
+HANDOFF_TIMEOUT = 30.0
+
+# Seconds that all engines together get to exit after 'quit' on shutdown (SIGTERM/SIGINT) before they are killed
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "5"))
+
+# Periodic scan for orphaned engine processes and the memory they hold (Linux only, seconds, 0 = off)
+ORPHAN_REAP_INTERVAL = float(os.getenv("ORPHAN_REAP_INTERVAL", "300"))
+# Kill the orphans found instead of only reporting them
+ORPHAN_REAP_KILL = os.getenv("ORPHAN_REAP_KILL", "false").lower() == "true"
+# Set in the environment of every engine started by start_engine_process(), so that the orphan
+# scan never touches engine processes of other programs (a GUI, a benchmark, tests)
+ENGINE_MARKER_ENV = "SHOGIHOME_WRAPPER_ENGINE"
+
+# Deadline for 'bestmove' after 'stop' (seconds, 0 disables the watchdog). At the deadline the client gets
+# 'bestmove resign'; an engine that is still silent after a second period is killed and respawned.
+STOP_TIMEOUT = float(os.getenv("STOP_TIMEOUT", "0"))
+
+# End-to-end latency tracing of USI commands to a rotating JSONL file (see latency_trace.py)
+LATENCY_TRACE = os.getenv("LATENCY_TRACE", "false").lower() == "true"
+# Relative paths are relative to the wrapper directory
+LATENCY_TRACE_FILE = str(BASE_DIR / os.getenv("LATENCY_TRACE_FILE", "engine_wrapper.trace.jsonl"))
+
+# Gzip transcript of every engine session, for replay with scripts/replay_transcript.py (see transcript.py).
+# Relative paths are relative to the wrapper directory; only the newest TRANSCRIPT_KEEP files are kept (0 = all).
+SESSION_TRANSCRIPTS = os.getenv("SESSION_TRANSCRIPTS", "false").lower() == "true"
+TRANSCRIPT_DIR = str(BASE_DIR / os.getenv("TRANSCRIPT_DIR", "transcripts"))
+TRANSCRIPT_KEEP = int(os.getenv("TRANSCRIPT_KEEP", "500"))
+
+# Compressed output ('run <id> compress=zlib', see compression.py): zlib level (1-9) and how long
+# output may be collected before a sync flush (milliseconds, 0 flushes at every line end)
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESS_FLUSH_MS = float(os.getenv("COMPRESS_FLUSH_MS", "0"))
+
+# Safety margin for timed 'go' commands (milliseconds, 0 disables it). byoyomi/btime/wtime are
+# lowered by the p99 RTT to the browser (TCP_INFO plus the 'client_rtt' reports of server.ts) plus this
+# margin (see time_margin.py).
+NETWORK_TIME_MARGIN_MS = float(os.getenv("NETWORK_TIME_MARGIN_MS", "0"))
+
+# Rolling hashfull/NPS profile per engine id from 'info' output, with warnings for a saturated hash
+# and collapsing NPS (see search_health.py)
+SEARCH_HEALTH = os.getenv("SEARCH_HEALTH", "false").lower() == "true"
+
+# Crashed engines of sessions with "respawn": true are restarted at most this often per window
+MAX_RESPAWNS = 3
+RESPAWN_WINDOW = 60.0
+# Time allowed for a respawned engine to answer 'usiok' and 'readyok' (NN weights may take a while to load)
+RESPAWN_TIMEOUT = 60.0
+
+# Lifetime of session tickets (seconds, 0 disables them; see session_ticket.py)
+AUTH_TICKET_TTL = float(os.getenv("AUTH_TICKET_TTL", "300"))
+
+# How often engines.json is checked for changes while a client is connected with 'watch' (seconds)
+ENGINE_LIST_POLL_INTERVAL = 1.0
+
+# Default number of engine processes for 'run-split <id>' (experimental)
+DEFAULT_SPLIT_PROCESSES = 2
+MAX_SPLIT_PROCESSES = max(DEFAULT_SPLIT_PROCESSES, os.cpu_count() or 1)
+
+
+class SessionCounter:
+    """
+    Counts live engine sessions for admission control.
+    In --workers mode, each worker owns one slot of a shared array so that the
+    supervisor can reset the slot of a crashed worker.
+    """
+
+    def __init__(self, shared=None, slot: int = 0):
+        self.shared = shared
+        self.slot = slot
+        self.local = 0
+
+    def total(self) -> int:
+        if self.shared is None:
+            return self.local
+        return sum(self.shared)
+
+    def try_acquire(self, limit: int) -> bool:
+        if self.shared is None:
+            if limit and self.local >= limit:
+                return False
+            self.local += 1
+            return True
+        with self.shared.get_lock():
+            if limit and sum(self.shared) >= limit:
+                return False
+            self.shared[self.slot] += 1
+        return True
+
+    def release(self):
+        if self.shared is None:
+            self.local -= 1
+            return
+        with self.shared.get_lock():
+            self.shared[self.slot] -= 1
+
+
+SESSION_COUNTER = SessionCounter()
+
+
+def is_loopback(ip: str) -> bool:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    # IPv4 clients of a dual-stack listener show up as ::ffff:127.0.0.1
+    mapped = getattr(address, "ipv4_mapped", None)
+    return (mapped or address).is_loopback
+
+
+class ConnectionGuard:
+    """
+    Cheap admission of new connections, before any nonce, log line or engine registry work:
+    per-IP connection rate and the number of handshakes in progress. Per process.
+    """
+
+    # Tracked IPs are pruned when there are more than this
+    MAX_TRACKED_IPS = 1024
+
+    def __init__(self):
+        # IP -> accept times within CONN_RATE_WINDOW
+        self.recent = {}
+        # IP -> when the rejection of that IP was last logged
+        self.warned = {}
+        self.handshakes = 0
+        self.counters = Counter()
+
+    def admit(self, ip: str | None) -> str | None:
+        """Returns None if the connection may proceed (call handshake_done() later), otherwise why it was rejected."""
+        now = time.monotonic()
+        if CONN_RATE_LIMIT > 0 and ip is not None and not is_loopback(ip):
+            if len(self.recent) > self.MAX_TRACKED_IPS:
+                self.prune(now)
+            times = self.recent.setdefault(ip, deque())
+            while times and times[0] <= now - CONN_RATE_WINDOW:
+                times.popleft()
+            if len(times) >= CONN_RATE_LIMIT:
+                self.counters["rejected_rate"] += 1
+                return self.rejected(ip, now, f"more than {CONN_RATE_LIMIT} connections in {CONN_RATE_WINDOW:g}s")
+            times.append(now)
+        if MAX_HANDSHAKES > 0 and self.handshakes >= MAX_HANDSHAKES:
+            self.counters["rejected_handshakes"] += 1
+            return self.rejected(ip, now, f"{MAX_HANDSHAKES} handshakes in progress")
+        self.handshakes += 1
+        self.counters["accepted"] += 1
+        return None
+
+    def rejected(self, ip: str | None, now: float, reason: str) -> str:
+        # One warning per IP and window, so that a flood does not flood the log as well
+        if now - self.warned.get(ip, -CONN_RATE_WINDOW) >= CONN_RATE_WINDOW:
+            self.warned[ip] = now
+            logging.warning(f"Rejecting connections from {ip or 'unix socket'}: {reason}.")
+        return reason
+
+    def handshake_done(self):
+        self.handshakes -= 1
+
+    def prune(self, now: float):
+        self.recent = {ip: times for ip, times in self.recent.items() if times and times[-1] > now - CONN_RATE_WINDOW}
+        self.warned = {ip: t for ip, t in self.warned.items() if t > now - CONN_RATE_WINDOW}
+
+    def to_dict(self) -> dict:
+        return {
+            "accepted": self.counters["accepted"],
+            "rejected_rate": self.counters["rejected_rate"],
+            "rejected_handshakes": self.counters["rejected_handshakes"],
+            "handshake_timeouts": self.counters["handshake_timeouts"],
+            "auth_failures": self.counters["auth_failures"],
+            "handshakes_in_progress": self.handshakes,
+            "tracked_ips": len(self.recent),
+        }
+
+
+CONNECTION_GUARD = ConnectionGuard()
+
+
+class DrainState:
+    """
+    Set by the 'drain' admin command: new 'run' commands are refused while it is active.
+    In --workers mode the flag is shared by all workers.
+    """
+
+    def __init__(self, shared=None):
+        self.shared = shared
+        self.local = False
+
+    @property
+    def active(self) -> bool:
+        if self.shared is None:
+            return self.local
+        return bool(self.shared.value)
+
+    def set(self, active: bool):
+        if self.shared is None:
+            self.local = active
+        else:
+            self.shared.value = int(active)
+
+
+DRAIN = DrainState()
+
 
 def get_engine_list():
     engines_json_path = BASE_DIR / "engines.json"
@@ -65,7 +330,129 @@ def get_engine_list():
     return engines
 
 
-async def pipe_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, log_prefix: str):
+def engine_list_delta(old: list, new: list) -> dict | None:
+    """Changes between two engine lists by id, or None if they are equal."""
+    old_by_id = {e.get("id"): e for e in old}
+    new_by_id = {e.get("id"): e for e in new}
+    added = [e for e in new if e.get("id") not in old_by_id]
+    changed = [e for e in new if e.get("id") in old_by_id and old_by_id[e.get("id")] != e]
+    removed = [engine_id for engine_id in old_by_id if engine_id not in new_by_id]
+    order = [e.get("id") for e in new]
+    if not added and not changed and not removed and order == [e.get("id") for e in old]:
+        return None
+    return {"added": added, "changed": changed, "removed": removed, "order": order}
+
+
+class EngineListWatch:
+    """
+    Pushes the changes of engines.json to the clients of the 'watch' command.
+    The file is polled (stat only, unless it changed) while at least one client is watching.
+    """
+
+    def __init__(self):
+        self.queues = set()
+        self.engines = []
+        self.signature = None
+        self.task = None
+
+    def subscribe(self) -> tuple[asyncio.Queue, list]:
+        """Returns a queue of deltas (None when the wrapper stops serving) and the current list."""
+        if not self.queues:
+            self.signature = self.stat()
+            self.engines = get_engine_list()
+            self.task = start_background_task(self.poll())
+        queue = asyncio.Queue()
+        self.queues.add(queue)
+        return queue, self.engines
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.queues.discard(queue)
+        if not self.queues and self.task:
+            self.task.cancel()
+            self.task = None
+
+    def close(self):
+        """End all watch connections (shutdown, or the listeners were handed over to a new process)."""
+        for queue in self.queues:
+            queue.put_nowait(None)
+
+    @staticmethod
+    def stat():
+        try:
+            st = os.stat(BASE_DIR / "engines.json")
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    async def poll(self):
+        while True:
+            await asyncio.sleep(ENGINE_LIST_POLL_INTERVAL)
+            signature = self.stat()
+            if signature == self.signature:
+                continue
+            try:
+                with open(BASE_DIR / "engines.json", encoding="utf-8") as f:
+                    engines = json.load(f)
+            except FileNotFoundError:
+                engines = []
+            except (OSError, ValueError):
+                # Still being written; read it again at the next poll
+                continue
+            self.signature = signature
+            delta = engine_list_delta(self.engines, engines)
+            self.engines = engines
+            if delta:
+                logging.info(f"engines.json changed, notifying {len(self.queues)} watchers.")
+                for queue in self.queues:
+                    queue.put_nowait(delta)
+
+
+ENGINE_LIST_WATCH = EngineListWatch()
+
+# Session tickets of this process (replaced in each worker in --workers mode, see worker_main)
+TICKETS = TicketBook(AUTH_TICKET_TTL)
+
+
+async def serve_engine_watch(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+    """'watch': send the engine list as 'list' does, then one JSON line per change until the client disconnects."""
+    queue, engines = ENGINE_LIST_WATCH.subscribe()
+
+    async def wait_disconnect():
+        while await client_reader.read(1024):
+            pass
+
+    disconnected = asyncio.create_task(wait_disconnect())
+    try:
+        client_writer.write(json.dumps(engines).encode() + b"\n")
+        await client_writer.drain()
+        while True:
+            delta = asyncio.create_task(queue.get())
+            await asyncio.wait([delta, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if not delta.done():
+                delta.cancel()
+                break
+            if delta.result() is None:
+                break
+            client_writer.write(json.dumps(delta.result(), separators=(",", ":")).encode() + b"\n")
+            await client_writer.drain()
+    finally:
+        disconnected.cancel()
+        ENGINE_LIST_WATCH.unsubscribe(queue)
+
+
+class RelayCounters:
+    """Traffic relayed by one session."""
+
+    def __init__(self):
+        self.commands = 0
+        self.bytes_to_engine = 0
+        self.bytes_to_client = 0
+
+    def to_dict(self) -> dict:
+        return {"commands": self.commands, "bytes_to_engine": self.bytes_to_engine, "bytes_to_client": self.bytes_to_client}
+
+
+async def pipe_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, log_prefix: str, counters: RelayCounters | None = None):
     try:
         while not reader.at_eof():
             data = await reader.read(1024)
@@ -81,6 +468,8 @@ async def pipe_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter
 
             writer.write(data)
             await writer.drain()
+            if counters:
+                counters.bytes_to_client += len(data)
     except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError, ConnectionAbortedError):
         pass
     except Exception as e:
@@ -89,11 +478,84 @@ async def pipe_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter
         pass
 
 
-async def apply_engine_options(stdin: asyncio.StreamWriter, options: dict):
-    """Apply engine options from engines.json configuration."""
+def zero_copy_eligible(engine_def: dict, output_format: str = "usi", compressed: bool = False) -> bool:
+    """The splice() fast path is used only when nothing needs to look at engine output."""
+    if not ZERO_COPY_RELAY or sys.platform != "linux" or not hasattr(os, "splice"):
+        return False
+    # Structured output rewrites 'info' lines, compression rewrites everything
+    if output_format != "usi" or compressed:
+        return False
+    # 'info' lines are logged at DEBUG level
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        return False
+    # The warm-up reads engine stdout until 'readyok'
+    if engine_def.get("eager_init") is True:
+        return False
+    # Respawn, the stop watchdog, tracing and the network time margin need to see 'readyok' and 'bestmove'
+    if engine_def.get("respawn") is True or STOP_TIMEOUT > 0 or LATENCY_TRACE or NETWORK_TIME_MARGIN_MS > 0:
+        return False
+    # Transcripts record every line, search health parses 'info' lines
+    if SESSION_TRANSCRIPTS or SEARCH_HEALTH:
+        return False
+    return True
+
+
+async def splice_stream(read_fd: int, writer: asyncio.StreamWriter, log_prefix: str, counters: RelayCounters | None = None):
+    """
+    Move engine stdout to the client socket with splice() without copying through Python.
+    Falls back to read()/write() for a chunk whenever the socket is full, so backpressure
+    is still handled by the transport.
+    """
+    loop = asyncio.get_running_loop()
+    sock_fd = writer.get_extra_info("socket").fileno()
+    # Make drain() wait until the transport buffer is empty, so that spliced bytes never overtake buffered ones
+    writer.transport.set_write_buffer_limits(high=0)
+    readable = asyncio.Event()
+    loop.add_reader(read_fd, readable.set)
+    total = 0
+    try:
+        while True:
+            await readable.wait()
+            readable.clear()
+            while True:
+                if writer.transport.get_write_buffer_size():
+                    await writer.drain()
+                try:
+                    n = os.splice(read_fd, sock_fd, SPLICE_CHUNK_SIZE, flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+                except BlockingIOError:
+                    # Either the pipe is empty or the socket is full
+                    try:
+                        data = os.read(read_fd, SPLICE_CHUNK_SIZE)
+                    except BlockingIOError:
+                        break
+                    if not data:
+                        return
+                    writer.write(data)
+                    await writer.drain()
+                    total += len(data)
+                    if counters:
+                        counters.bytes_to_client += len(data)
+                    continue
+                if n == 0:
+                    return
+                total += n
+                if counters:
+                    counters.bytes_to_client += n
+    except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError, ConnectionAbortedError):
+        pass
+    except Exception as e:
+        logging.error(f"Unexpected error in {log_prefix}: {e}", exc_info=True)
+    finally:
+        loop.remove_reader(read_fd)
+        logging.info(f"{log_prefix} zero-copy relay finished ({total} bytes).")
+
+
+def engine_option_lines(options: dict) -> list[str]:
+    """Turn engine options from engines.json into 'setoption' commands (without line terminators)."""
     if not options or not isinstance(options, dict):
-        return
+        return []
 
+    lines = []
     for name, value in options.items():
         # Normalize boolean values to lowercase 'true'/'false' for USI compatibility
         if isinstance(value, bool):
@@ -106,78 +568,1452 @@ async def apply_engine_options(stdin: asyncio.StreamWriter, options: dict):
             logging.warning(f"Skipping option with invalid characters: {name_str}")
             continue
 
-        command = f"setoption name {name_str} value {value_str}\n"
-        logging.info(f"Applying option: {command.strip()}")
+        lines.append(f"setoption name {name_str} value {value_str}")
+    return lines
+
+
+async def apply_engine_options(stdin: asyncio.StreamWriter, options: dict):
+    """Apply engine options from engines.json configuration."""
+    for command in engine_option_lines(options):
+        logging.info(f"Applying option: {command}")
 
         try:
-            stdin.write(command.encode())
+            stdin.write(command.encode() + b"\n")
             await stdin.drain()
         except (BrokenPipeError, ConnectionResetError) as e:
-            logging.error(f"Failed to write option '{name}': {e}")
+            logging.error(f"Failed to write option '{command}': {e}")
             raise
         except Exception as e:
-            logging.error(f"Unexpected error writing option '{name}': {e}", exc_info=True)
+            logging.error(f"Unexpected error writing option '{command}': {e}", exc_info=True)
             raise
 
 
-async def handle_client(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
-    peername = client_writer.get_extra_info("peername")
-    logging.info(f"Client connected from {peername}")
-    engine_process = None
-    tasks_to_cancel = []
+def tune_client_socket(writer: asyncio.StreamWriter):
+    """Disable Nagle so that single-line replies such as 'bestmove' are sent immediately, and apply buffer sizes."""
+    sock = writer.get_extra_info("socket")
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if SOCKET_SNDBUF > 0:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF)
+    except OSError as e:
+        logging.debug(f"Failed to tune client socket: {e}")
 
-    access_token = os.getenv("WRAPPER_ACCESS_TOKEN")
 
+def tune_listening_sockets(server: asyncio.AbstractServer):
+    """Receive buffers must be sized on the listening socket so that accepted sockets inherit them."""
+    if SOCKET_RCVBUF <= 0:
+        return
+    for sock in server.sockets:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+        except OSError as e:
+            logging.warning(f"Failed to set SO_RCVBUF on {sock.getsockname()}: {e}")
+
+
+def resolve_engine_path(engine_path_str: str) -> Path:
+    """Resolve an engine path from engines.json (relative paths are relative to BASE_DIR)."""
+    engine_path = Path(engine_path_str)
+    if not engine_path.is_absolute():
+        engine_path = (BASE_DIR / engine_path).resolve()
+    return engine_path
+
+
+def renice_process(pid: int, nice: int):
+    """
+    Set the nice value of every thread of a process. On Linux setpriority() only changes the
+    thread with the given id, so the threads listed in /proc/<pid>/task are set one by one (the
+    main thread first; threads created later inherit the value of the thread that creates them).
+    """
+    os.setpriority(os.PRIO_PROCESS, pid, nice)
+    done = {pid}
+    while True:
+        try:
+            tids = {int(tid) for tid in os.listdir(f"/proc/{pid}/task")} - done
+        except OSError:
+            return
+        if not tids:
+            return
+        for tid in tids:
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, nice)
+            except ProcessLookupError:
+                # The thread has exited
+                pass
+        done |= tids
+
+
+def apply_engine_limits(pid: int, limits: dict | None):
+    """
+    Apply the "limits" of an engines.json entry to a freshly started engine (Linux only):
+    memory_mb (address space), nice and cpu_seconds. They are set with prlimit()/setpriority()
+    right after the spawn instead of in a preexec_fn, which is unsafe in a process that runs
+    threads. Engines only allocate their hash after 'isready', so the limits are in place in time.
+    """
+    if not limits:
+        return
+    if sys.platform != "linux":
+        logging.warning("Engine limits are only supported on Linux. Ignoring.")
+        return
+    import resource
+
+    try:
+        if limits.get("memory_mb"):
+            size = int(limits["memory_mb"]) * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (size, size))
+        if limits.get("cpu_seconds"):
+            # SIGXCPU at the soft limit, SIGKILL at the hard limit
+            seconds = int(limits["cpu_seconds"])
+            resource.prlimit(pid, resource.RLIMIT_CPU, (seconds, seconds + 5))
+        if limits.get("nice") is not None:
+            renice_process(pid, int(limits["nice"]))
+        logging.info(f"Applied engine limits to PID {pid}: {limits}")
+    except (OSError, ValueError, TypeError) as e:
+        logging.warning(f"Failed to apply engine limits {limits} to PID {pid}: {e}")
+
+
+def limit_exit_message(limits: dict | None, returncode: int | None) -> str | None:
+    """Return the WRAPPER_ERROR message for an engine exit that was certainly caused by one of its limits."""
+    if not limits or not returncode:
+        return None
+    # SIGXCPU is only sent for RLIMIT_CPU (a SIGKILL may come from anywhere, e.g. the stop watchdog)
+    if limits.get("cpu_seconds") and hasattr(signal, "SIGXCPU") and returncode == -signal.SIGXCPU:
+        return f"Engine exceeded its CPU time limit ({limits['cpu_seconds']} s)."
+    return None
+
+
+def limit_exit_hint(limits: dict | None, returncode: int | None) -> str | None:
+    """Return a possible cause among the limits for an abnormal exit that limit_exit_message() cannot attribute."""
+    if not limits or not returncode or limit_exit_message(limits, returncode):
+        return None
+    if limits.get("memory_mb"):
+        # A failed allocation usually ends in abort() or an error exit, there is no dedicated signal
+        return f"may have been caused by its memory limit ({limits['memory_mb']} MB)"
+    return None
+
+
+# Every engine process owned by this wrapper process (used to stop them all on shutdown)
+ENGINE_PROCESSES = weakref.WeakSet()
+# Set by shutdown_engines(): engines that exit from then on are not respawned
+SHUTTING_DOWN = False
+
+
+async def start_engine_process(engine_path: Path, stdout=asyncio.subprocess.PIPE, limits: dict | None = None) -> asyncio.subprocess.Process:
+    """Start an engine process with piped stdio in its own directory. stdout may be a raw pipe fd."""
+    # Prevent new console window on Windows
+    creationflags = 0
+    if sys.platform == "win32":
+        creationflags = subprocess.CREATE_NO_WINDOW
+
+    engine_process = await asyncio.create_subprocess_exec(
+        str(engine_path),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=stdout,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=engine_path.parent,
+        creationflags=creationflags,
+        # Own session and process group, so that helper processes can be killed together with the engine
+        start_new_session=sys.platform != "win32",
+        env={**os.environ, ENGINE_MARKER_ENV: "1"},
+    )
+    ENGINE_PROCESSES.add(engine_process)
+    apply_engine_limits(engine_process.pid, limits)
+    return engine_process
+
+
+def kill_process_group(engine_process):
+    """Kill the helper processes left in the process group of an engine started by start_engine_process (POSIX)."""
+    if sys.platform == "win32" or engine_process not in ENGINE_PROCESSES:
+        return
     try:
+        os.killpg(engine_process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def wait_engine_exit(engine_process: asyncio.subprocess.Process, timeout: float) -> bool:
+    """
+    Wait until the engine process itself has exited. Unlike wait(), this does not also wait
+    for the pipes to close, which helper processes of the engine may keep open.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    waiter = asyncio.ensure_future(engine_process.wait())
+    try:
+        while engine_process.returncode is None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            await asyncio.wait([waiter], timeout=min(remaining, 0.05))
+        return True
+    finally:
+        waiter.cancel()
+
+
+async def stop_engine_process(engine_process: asyncio.subprocess.Process):
+    """Shut down an engine process ('quit' first, then terminate, then kill) together with its process group."""
+    try:
+        await stop_engine_leader(engine_process)
+    finally:
+        kill_process_group(engine_process)
+    # Helpers have gone with the group, so the pipes close now
+    try:
+        await asyncio.wait_for(engine_process.wait(), timeout=1.0)
+    except asyncio.TimeoutError:
+        logging.warning(f"Pipes of engine process (PID: {engine_process.pid}) are still held by processes outside its group.")
+
+
+async def stop_engine_leader(engine_process: asyncio.subprocess.Process):
+    if engine_process.returncode is not None:
+        logging.info(f"Engine process (PID: {engine_process.pid}) already exited with code {engine_process.returncode}.")
+        return
+
+    logging.info(f"Cleaning up engine process (PID: {engine_process.pid}).")
+    try:
+        # Send 'quit' command
+        if engine_process.stdin and not engine_process.stdin.is_closing():
+            logging.info("Sending 'quit' command to engine.")
+            engine_process.stdin.write(b"quit\n")
+            await engine_process.stdin.drain()
+            engine_process.stdin.close()
+
+        # Wait for engine to exit
+        if await wait_engine_exit(engine_process, 5.0):
+            logging.info(f"Engine process (PID: {engine_process.pid}) exited gracefully.")
+        else:
+            logging.warning("Engine did not exit after 'quit' command. Terminating.")
+            engine_process.terminate()
+            if not await wait_engine_exit(engine_process, 3.0):
+                logging.warning(f"Engine process (PID: {engine_process.pid}) did not terminate gracefully, killing.")
+                engine_process.kill()
+                await wait_engine_exit(engine_process, 3.0)
+    except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+        logging.warning("Engine stdin pipe already closed, could not send 'quit'.")
+    except ProcessLookupError:
+        pass
+
+
+class EngineWarmup:
+    """
+    Eager engine initialization ("eager_init": true in engines.json).
+
+    Sends 'usi', the configured options and 'isready' as soon as the process starts,
+    so that heavy initialization (e.g. NN weight loading) overlaps with the client handshake.
+    The client's first 'usi' and 'isready' are then answered from the absorbed replies.
+    """
+
+    def __init__(self, engine_process: asyncio.subprocess.Process, options: dict):
+        self.engine_process = engine_process
+        self.options = options
+        self.usi_lines = []
+        self.usi_done = asyncio.Event()
+        self.ready_done = asyncio.Event()
+        self.usi_replied = False
+        self.ready_replied = False
+        # Set when the client changes options after the warm-up 'isready' (a real 'isready' is then needed)
+        self.dirty = False
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        stdin = self.engine_process.stdin
+        stdout = self.engine_process.stdout
         try:
-            if access_token:
-                nonce = secrets.token_hex(16)
-                client_writer.write(f"auth_cram_sha256 {nonce}\n".encode())
-                await client_writer.drain()
+            stdin.write(b"usi\n")
+            await stdin.drain()
+            while True:
+                line = await stdout.readline()
+                if not line:
+                    logging.warning("Engine exited during warm-up (before 'usiok').")
+                    return
+                self.usi_lines.append(line)
+                if line.strip() == b"usiok":
+                    break
+            self.usi_done.set()
 
-                # Wait for auth command
-                auth_line = await client_reader.readline()
-                if not auth_line:
-                    logging.warning("Client disconnected during auth.")
+            await apply_engine_options(stdin, self.options)
+            stdin.write(b"isready\n")
+            await stdin.drain()
+            while True:
+                line = await stdout.readline()
+                if not line:
+                    logging.warning("Engine exited during warm-up (before 'readyok').")
                     return
+                if line.strip() == b"readyok":
+                    break
+                logging.info(f"[Engine warm-up] {line.decode(errors='ignore').strip()}")
+            logging.info(f"Engine warm-up completed in {loop.time() - started:.2f}s (PID: {self.engine_process.pid}).")
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError) as e:
+            logging.warning(f"Engine warm-up failed: {e}")
+        finally:
+            # Never leave the client waiting; on failure the relay sees EOF and the session ends
+            self.usi_done.set()
+            self.ready_done.set()
+
+
+class SessionReplay:
+    """
+    USI state of a session with "respawn": true in engines.json, recorded from the relayed
+    commands so that a crashed engine can be replaced by a new process in the same state.
+    """
+
+    # Attributes carried over when the session is handed over to a new wrapper process
+    STATE_FIELDS = ("options", "ready", "newgame", "position", "go", "searching", "stop_sent", "ponderhit", "awaiting_ready", "quitting")
+
+    def __init__(self):
+        # 'setoption' lines by option name, in the order in which they were last set
+        self.options = {}
+        # The handshake ('isready' -> 'readyok') has completed once
+        self.ready = False
+        self.newgame = False
+        self.position = None
+        self.go = None
+        self.searching = False
+        self.stop_sent = False
+        self.ponderhit = False
+        self.awaiting_ready = False
+        self.quitting = False
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.STATE_FIELDS}
+
+    def load(self, state: dict):
+        for name in self.STATE_FIELDS:
+            if name in state:
+                setattr(self, name, state[name])
+
+    def record_option(self, line: str):
+        name = token_value(line.split(), "name")
+        if name is None:
+            return
+        # Re-insert so that the replay order matches the order of the last assignments
+        self.options.pop(name, None)
+        self.options[name] = line
+
+    def record_client(self, command: str):
+        """Record a command on its way to the engine."""
+        name = command.split(maxsplit=1)[0] if command else ""
+        if name == "setoption":
+            self.record_option(command)
+        elif name == "isready":
+            self.awaiting_ready = True
+        elif name == "usinewgame":
+            self.newgame = True
+        elif name == "position":
+            self.position = command
+        elif name == "go":
+            self.go = command
+            self.searching = True
+            self.stop_sent = False
+            self.ponderhit = False
+        elif name == "stop":
+            self.stop_sent = self.searching
+        elif name == "ponderhit":
+            self.ponderhit = self.searching
+        elif name == "gameover":
+            self.newgame = False
+            self.searching = False
+        elif name == "quit":
+            self.quitting = True
+
+    def record_engine(self, line: str):
+        """Record a line of engine output on its way to the client."""
+        if line.startswith("bestmove"):
+            self.searching = False
+        elif line == "readyok":
+            self.ready = True
+            self.awaiting_ready = False
+
+    def replay_lines(self) -> list[str]:
+        """Commands that bring a freshly handshaken engine back to the recorded state."""
+        lines = []
+        if self.newgame:
+            lines.append("usinewgame")
+        if self.position:
+            lines.append(self.position)
+        if self.searching and self.go:
+            lines.append(self.go)
+            if self.ponderhit:
+                lines.append("ponderhit")
+            if self.stop_sent:
+                lines.append("stop")
+        if self.awaiting_ready:
+            # The client is still waiting for 'readyok' from the crashed engine
+            lines.append("isready")
+        return lines
+
+
+class RespawnStats:
+    """Crash and recovery counters of one engine id (sessions with "respawn": true only)."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.crashes = 0
+        self.respawns = 0
+        self.failures = 0
+        self.recovery_total = 0.0
+        self.recovery_max = 0.0
+
+    def record_recovery(self, seconds: float):
+        self.respawns += 1
+        self.recovery_total += seconds
+        self.recovery_max = max(self.recovery_max, seconds)
+
+    def summary(self) -> str:
+        average = self.recovery_total / self.respawns if self.respawns else 0.0
+        return (
+            f"crashes: {self.crashes} in {self.sessions} sessions, respawned: {self.respawns}, failed: {self.failures}, "
+            f"recovery avg {average:.2f}s / max {self.recovery_max:.2f}s"
+        )
+
+
+# RespawnStats by engine id
+RESPAWN_STATS = {}
+
+
+def respawn_stats(engine_id: str) -> RespawnStats:
+    return RESPAWN_STATS.setdefault(engine_id, RespawnStats())
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed millisecond buckets."""
+
+    BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        # The last count is for latencies above the largest bucket
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total = 0
+        self.max_ms = 0.0
+        # Deadlines that passed without an answer
+        self.timeouts = 0
+
+    def record(self, seconds: float):
+        ms = seconds * 1000
+        index = next((i for i, bound in enumerate(self.BUCKETS_MS) if ms <= bound), len(self.BUCKETS_MS))
+        self.counts[index] += 1
+        self.total += 1
+        self.max_ms = max(self.max_ms, ms)
+
+    @classmethod
+    def labels(cls) -> list[str]:
+        return [f"<={bound}ms" for bound in cls.BUCKETS_MS] + [f">{cls.BUCKETS_MS[-1]}ms"]
+
+    def percentile(self, fraction: float) -> str:
+        """Label of the bucket holding the given fraction of the samples."""
+        seen = 0
+        for label, count in zip(self.labels(), self.counts, strict=True):
+            seen += count
+            if seen and seen >= fraction * self.total:
+                return label
+        return "-"
+
+    def summary(self) -> str:
+        buckets = ", ".join(f"{label}: {count}" for label, count in zip(self.labels(), self.counts, strict=True) if count)
+        return (
+            f"n={self.total} p50 {self.percentile(0.5)} p99 {self.percentile(0.99)} max {self.max_ms:.0f}ms "
+            f"timeouts {self.timeouts} [{buckets}]"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.total,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 1),
+            "timeouts": self.timeouts,
+            "buckets": {label: count for label, count in zip(self.labels(), self.counts, strict=True) if count},
+        }
+
+
+# 'stop' -> 'bestmove' LatencyHistogram by engine id
+STOP_LATENCY = {}
+
+
+class StopWatchdog:
+    """
+    Times 'stop' -> 'bestmove' for one session and escalates when the engine does not answer
+    within STOP_TIMEOUT: first 'bestmove resign' is sent to the client (the late bestmove of the
+    engine is then dropped), then the engine is killed so that the session respawns it.
+    """
+
+    def __init__(self, session: "EngineSession"):
+        self.session = session
+        self.histogram = STOP_LATENCY.setdefault(session.engine_id, LatencyHistogram())
+        self.searching = False
+        self.stop_time = None
+        self.resigned = False
+        self.killed = False
+        self.task = None
+
+    def on_client_command(self, command: str):
+        name = command.split(maxsplit=1)[0] if command else ""
+        if name == "go":
+            self.searching = True
+        elif name == "stop" and self.searching and self.stop_time is None:
+            self.stop_time = asyncio.get_running_loop().time()
+            self.task = asyncio.create_task(self.escalate())
+
+    def on_engine_line(self, line: str) -> bool:
+        """Returns False for lines that must not reach the client."""
+        if not line.startswith("bestmove"):
+            return True
+        self.searching = False
+        if self.stop_time is not None:
+            self.histogram.record(asyncio.get_running_loop().time() - self.stop_time)
+            self.stop_time = None
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.resigned:
+            # The client has already been given 'bestmove resign'
+            self.resigned = False
+            logging.info(f"Dropped late '{line}' of engine '{self.session.engine_id}'.")
+            return False
+        return True
+
+    def reset(self, searching: bool):
+        """Forget the stalled search after the engine has been replaced."""
+        self.cancel()
+        self.searching = searching
+        self.stop_time = None
+        self.resigned = False
+        self.killed = False
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def escalate(self):
+        session = self.session
+        await asyncio.sleep(STOP_TIMEOUT)
+        self.histogram.timeouts += 1
+        logging.warning(
+            f"Engine '{session.engine_id}' (PID: {session.engine_process.pid}) did not answer 'stop' within {STOP_TIMEOUT:g}s. "
+            "Sending 'bestmove resign' to the client."
+        )
+        self.resigned = True
+        self.searching = False
+        if session.replay:
+            session.replay.record_engine("bestmove resign")
+        try:
+            session.client_writer.write(b"bestmove resign\n")
+            await session.client_writer.drain()
+        except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError):
+            pass
+
+        await asyncio.sleep(STOP_TIMEOUT)
+        logging.error(f"Engine '{session.engine_id}' (PID: {session.engine_process.pid}) is still not answering. Killing it.")
+        self.killed = True
+        kill_process_group(session.engine_process)
+        try:
+            session.engine_process.kill()
+        except ProcessLookupError:
+            pass
+
+
+# Session ids ('<pid>-<n>'), shared by single-engine and run-split sessions. The counter starts
+# again in every worker process (--workers) and after a takeover; the pid keeps the ids unique
+# among the processes that serve the same port.
+SESSION_IDS = itertools.count(1)
+
+
+def next_session_id() -> str:
+    return f"{os.getpid()}-{next(SESSION_IDS)}"
+
+
+# Live single-engine sessions by session id
+LIVE_SESSIONS = {}
+# Live run-split sessions (SplitSessionEntry) by session id
+SPLIT_SESSIONS = {}
+# Client handler tasks (including adopted sessions)
+CLIENT_TASKS = set()
+# Long-running tasks that nothing else awaits (the event loop only keeps weak references to tasks)
+BACKGROUND_TASKS = set()
+# Engines handed over to a new wrapper process. Kept referenced so that their transports are never finalized.
+HANDED_OFF_PROCESSES = []
+
+
+def start_background_task(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    return task
+
+
+def terminate_client(client_writer: asyncio.StreamWriter, message: str):
+    """Tell the client why and close its connection. The session then ends as if the client had disconnected."""
+    if client_writer.is_closing():
+        return
+    client_writer.write(f"WRAPPER_ERROR: {message}\n".encode())
+    if client_writer.transport.get_write_buffer_size():
+        # The client is not reading
+        client_writer.transport.abort()
+    else:
+        client_writer.close()
+
+
+class EngineSession:
+    """One client connection relayed to one engine process."""
+
+    def __init__(
+        self,
+        engine_def: dict,
+        engine_process,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter,
+        peername,
+        zero_copy_fd: int | None = None,
+        output_format: str = "usi",
+    ):
+        self.id = next_session_id()
+        self.engine_def = engine_def
+        self.engine_id = engine_def["id"]
+        self.engine_process = engine_process
+        self.client_reader = client_reader
+        self.client_writer = client_writer
+        self.peername = peername
+        self.zero_copy_fd = zero_copy_fd
+        # 'json': 'info' lines are sent to the client as JSON frames (see usi_parser.py)
+        self.output_format = output_format
+        self.warmup = None
+        self.options_applied = False  # Track if options have been applied
+        self.tasks = []
+        self.started = time.monotonic()
+        self.counters = RelayCounters()
+        # Best knowledge of whether the engine is searching. Without a line-based relay 'bestmove' is not
+        # seen, so a search that ends by itself is only noticed at the next command.
+        self.searching = False
+        self.last_command = None
+        # Set while the session is being handed over to a new wrapper process
+        self.handing_over = None
+        self.handed_off = False
+        # Crash recovery ("respawn": true in engines.json). The stop watchdog respawns the engines it kills.
+        self.respawn_enabled = engine_def.get("respawn") is True
+        self.watchdog = StopWatchdog(self) if STOP_TIMEOUT > 0 else None
+        self.replay = SessionReplay() if self.respawn_enabled or self.watchdog else None
+        self.trace = SessionTrace(self.id, self.engine_id, peername) if trace_enabled() else None
+        self.time_keeper = NetworkTimeKeeper(NETWORK_TIME_MARGIN_MS) if NETWORK_TIME_MARGIN_MS > 0 else None
+        self.transcript = SessionTranscript(self.id, self.engine_id, peername, output_format) if transcripts_enabled() else None
+        self.search_health = SearchSampler(self.engine_id) if SEARCH_HEALTH else None
+        self.respawn_times = []
+        # Cleared while a crashed engine is being replaced
+        self.engine_ready = asyncio.Event()
+        self.engine_ready.set()
+
+    def state(self) -> str:
+        if self.handing_over:
+            return "handing_over"
+        if not self.engine_ready.is_set():
+            return "respawning"
+        if self.warmup and not self.warmup.ready_done.is_set():
+            return "warming_up"
+        if self.searching:
+            return "stopping" if self.last_command == "stop" else "searching"
+        return "idle"
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": "single",
+            "peer": str(self.peername),
+            "engine": self.engine_id,
+            "pid": self.engine_process.pid,
+            "uptime": round(time.monotonic() - self.started, 1),
+            "state": self.state(),
+            "format": self.output_format,
+            **self.counters.to_dict(),
+            **compression_info(self.client_writer),
+            **(self.time_keeper.to_dict() if self.time_keeper else {}),
+            **(self.search_health.to_dict() if self.search_health else {}),
+        }
+
+    def start_warmup(self):
+        options = self.engine_def.get("options")
+        self.warmup = EngineWarmup(self.engine_process, options)
+        self.options_applied = True
+        self.record_engine_options(options)
+        self.warmup.start()
+
+    def record_engine_options(self, options):
+        """Record the engines.json options for the replay, so that a respawned engine gets them too."""
+        if self.replay:
+            for option_line in engine_option_lines(options):
+                self.replay.record_option(option_line)
+
+    async def run(self):
+        """Relay until the client, the engine or one of the pipes goes away."""
+        LIVE_SESSIONS[self.id] = self
+        if self.replay:
+            respawn_stats(self.engine_id).sessions += 1
+        client_task = asyncio.create_task(self.client_to_engine())
+        self.tasks = [
+            client_task,
+            asyncio.create_task(self.engine_stdout_to_client()),
+            asyncio.create_task(pipe_stream(self.engine_process.stderr, self.client_writer, "[Engine ERROR]", self.counters)),
+            asyncio.create_task(self.engine_process.wait()),
+        ]
+        try:
+            while True:
+                done, _ = await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+                if self.handing_over:
+                    # The relay was stopped by hand_over(), which still needs the transports
+                    await self.handing_over
+                    break
+                if client_task in done:
+                    break
+                # The engine went away while the client is still connected
+                if self.watchdog and self.watchdog.killed:
+                    reason = f"did not answer 'stop' within {STOP_TIMEOUT:g}s"
+                elif await self.report_engine_exit() or not self.respawn_enabled or self.engine_exited_cleanly():
+                    break
+                elif isinstance(self.engine_process, AdoptedProcess):
+                    reason = "crashed (exit code unknown)"
+                else:
+                    returncode = self.engine_process.returncode
+                    hint = limit_exit_hint(self.engine_def.get("limits"), returncode)
+                    reason = f"crashed (exit code {returncode}; {hint})" if hint else f"crashed (exit code {returncode})"
+                if not await self.respawn(reason):
+                    break
+                self.tasks = [
+                    client_task,
+                    asyncio.create_task(self.relay_engine_lines()),
+                    asyncio.create_task(pipe_stream(self.engine_process.stderr, self.client_writer, "[Engine ERROR]", self.counters)),
+                    asyncio.create_task(self.engine_process.wait()),
+                ]
+        finally:
+            for task in self.tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def close(self):
+        """Stop the engine and release the session's resources."""
+        LIVE_SESSIONS.pop(self.id, None)
+        for task in self.tasks:
+            if not task.done():
+                task.cancel()
+        if self.watchdog:
+            self.watchdog.cancel()
+            if self.watchdog.histogram.total or self.watchdog.histogram.timeouts:
+                logging.info(f"'stop' -> 'bestmove' latency of '{self.engine_id}': {self.watchdog.histogram.summary()}")
+        if self.time_keeper and self.time_keeper.adjusted:
+            logging.info(f"Network time margin of '{self.engine_id}': {self.time_keeper.summary()}")
+        if self.transcript:
+            self.transcript.close()
+        if self.handed_off:
+            ENGINE_PROCESSES.discard(self.engine_process)
+            HANDED_OFF_PROCESSES.append(self.engine_process)
+        else:
+            await stop_engine_process(self.engine_process)
+        if self.zero_copy_fd is not None:
+            os.close(self.zero_copy_fd)
+            self.zero_copy_fd = None
+        if isinstance(self.client_writer, CompressedWriter):
+            writer = self.client_writer
+            logging.info(f"Compressed output of '{self.engine_id}': {writer.bytes_in} -> {writer.bytes_out} bytes ({writer.ratio():.0%}).")
+
+    def engine_exited_cleanly(self) -> bool:
+        """Whether the engine exited on purpose ('quit' or its own decision) rather than crashed."""
+        if isinstance(self.engine_process, AdoptedProcess):
+            # The exit status of an adopted engine is unknown: only a 'quit' from the client is a clean exit
+            return bool(self.replay and self.replay.quitting)
+        return self.engine_process.returncode == 0
+
+    async def report_engine_exit(self) -> bool:
+        """Tell the client when the engine was stopped by one of its limits. Returns True if it was."""
+        if not await wait_engine_exit(self.engine_process, 1.0):
+            return False
+        limits = self.engine_def.get("limits")
+        returncode = self.engine_process.returncode
+        message = limit_exit_message(limits, returncode)
+        if not message:
+            hint = limit_exit_hint(limits, returncode)
+            if hint:
+                logging.warning(f"Engine '{self.engine_id}' (PID: {self.engine_process.pid}) exited with code {returncode}; it {hint}.")
+            return False
+        logging.warning(f"Engine '{self.engine_id}' (PID: {self.engine_process.pid}): {message}")
+        try:
+            self.client_writer.write(f"WRAPPER_ERROR: {message}\n".encode())
+            await self.client_writer.drain()
+        except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError):
+            pass
+        return True
+
+    async def respawn(self, reason: str) -> bool:
+        """
+        Replace a crashed engine with a new process and replay the recorded options, position
+        and search, so that the client keeps its session. Returns False if the session should end.
+        """
+        replay = self.replay
+        # Crashes during the handshake are most likely permanent (e.g. missing eval files)
+        if not replay or replay.quitting or not replay.ready or self.client_writer.is_closing():
+            return False
+        # The engines are being stopped on purpose
+        if SHUTTING_DOWN:
+            return False
+
+        stats = respawn_stats(self.engine_id)
+        stats.crashes += 1
+        crashed = self.engine_process
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.respawn_times = [t for t in self.respawn_times if started - t < RESPAWN_WINDOW]
+        if len(self.respawn_times) >= MAX_RESPAWNS:
+            stats.failures += 1
+            logging.error(f"Engine '{self.engine_id}' keeps crashing ({MAX_RESPAWNS} respawns within {RESPAWN_WINDOW:.0f}s). Giving up.")
+            logging.error(f"Respawn stats for '{self.engine_id}': {stats.summary()}")
+            await self.report_respawn_failure()
+            return False
+        self.respawn_times.append(started)
+        logging.warning(f"Engine '{self.engine_id}' (PID: {crashed.pid}) {reason}. Respawning.")
+
+        self.engine_ready.clear()
+        try:
+            for task in self.tasks[1:]:
+                task.cancel()
+            await stop_engine_process(crashed)
+            if self.zero_copy_fd is not None:
+                os.close(self.zero_copy_fd)
+                self.zero_copy_fd = None
+            self.warmup = None
+
+            engine_path = resolve_engine_path(self.engine_def["path"])
+            self.engine_process = await start_engine_process(engine_path, limits=self.engine_def.get("limits"))
+            await asyncio.wait_for(self.replay_state(), RESPAWN_TIMEOUT)
+        except Exception as e:
+            stats.failures += 1
+            logging.error(f"Failed to respawn engine '{self.engine_id}': {e!r} ({stats.summary()})")
+            await self.report_respawn_failure()
+            return False
+        finally:
+            if self.watchdog:
+                self.watchdog.reset(replay.searching)
+            self.engine_ready.set()
+
+        elapsed = loop.time() - started
+        stats.record_recovery(elapsed)
+        logging.warning(f"Engine '{self.engine_id}' respawned in {elapsed:.2f}s (PID: {self.engine_process.pid}). ({stats.summary()})")
+        message = f"info string Engine {reason} and was restarted in {elapsed:.2f}s"
+        if replay.searching:
+            message += "; search resumed"
+        try:
+            self.client_writer.write(f"{message}.\n".encode())
+            await self.client_writer.drain()
+        except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError):
+            return False
+        return True
+
+    async def report_respawn_failure(self):
+        try:
+            self.client_writer.write(b"WRAPPER_ERROR: Engine crashed and could not be restarted.\n")
+            await self.client_writer.drain()
+        except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError):
+            pass
+
+    async def replay_state(self):
+        """Handshake with the respawned engine without showing it to the client, then replay the recorded state."""
+        stdin = self.engine_process.stdin
+        stdout = self.engine_process.stdout
+        for command, reply in (("usi", b"usiok"), ("isready", b"readyok")):
+            if command == "isready":
+                for line in self.replay.options.values():
+                    stdin.write(line.encode() + b"\n")
+            stdin.write(command.encode() + b"\n")
+            await stdin.drain()
+            while True:
+                line = await stdout.readline()
+                if not line:
+                    raise ConnectionResetError(f"engine exited before '{reply.decode()}'")
+                if line.strip() == reply:
+                    break
+        for command in self.replay.replay_lines():
+            logging.info(f"[Respawn -> Engine] {command}")
+            stdin.write(command.encode() + b"\n")
+        await stdin.drain()
+
+    def can_hand_off(self) -> bool:
+        # The state of the zlib stream cannot be handed over
+        if isinstance(self.client_writer, CompressedWriter):
+            return False
+        # A warm-up that has not answered the client yet stays with the old process
+        if self.warmup and not (self.warmup.usi_replied and self.warmup.ready_replied):
+            return False
+        if not self.engine_ready.is_set() or (self.watchdog and self.watchdog.stop_time is not None):
+            return False
+        return self.engine_process.returncode is None and not self.client_writer.is_closing()
 
-                auth_cmd = auth_line.decode().strip()
-                if auth_cmd.startswith("auth "):
-                    digest = auth_cmd[5:].strip()
-                    expected_digest = hmac.new(access_token.encode(), nonce.encode(), hashlib.sha256).hexdigest()
+    async def hand_over(self, conn: socket.socket):
+        """
+        Stop relaying and send the client socket, the engine pipes and a pidfd of the engine
+        to a new wrapper process. Bytes that were read but not relayed yet are forwarded
+        first, so that nothing is lost or reordered.
+        """
+        pidfd = os.pidfd_open(self.engine_process.pid)
+        self.handing_over = asyncio.get_running_loop().create_future()
+        try:
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+            stdin_pipe, stdout_pipe, stderr_pipe = pipe_transports(self.engine_process)
+            self.client_writer.transport.pause_reading()
+            for pipe in (stdout_pipe, stderr_pipe):
+                if pipe:
+                    pipe.pause_reading()
+
+            pending = await drain_reader(self.client_reader)
+            if pending:
+                self.engine_process.stdin.write(pending)
+            for reader in (self.engine_process.stdout, self.engine_process.stderr):
+                if reader:
+                    pending = await drain_reader(reader)
+                    if pending:
+                        self.client_writer.write(pending)
+            await flush_writer(self.engine_process.stdin)
+            await flush_writer(self.client_writer)
 
-                    # Use timing-safe comparison to prevent timing attacks
-                    if hmac.compare_digest(digest, expected_digest):
-                        logging.info(f"Client authenticated successfully from {peername}")
-                        client_writer.write(b"auth_ok\n")
+            fds = [
+                self.client_writer.get_extra_info("socket").fileno(),
+                transport_fileno(stdin_pipe),
+                self.zero_copy_fd if self.zero_copy_fd is not None else transport_fileno(stdout_pipe),
+                transport_fileno(stderr_pipe),
+                pidfd,
+            ]
+            message = {
+                "type": "session",
+                "engine_def": self.engine_def,
+                "pid": self.engine_process.pid,
+                "peername": str(self.peername),
+                "options_applied": self.options_applied,
+                "replay": self.replay.to_dict() if self.replay else None,
+                "format": self.output_format,
+            }
+            send_message(conn, message, fds)
+            self.handed_off = True
+        finally:
+            os.close(pidfd)
+            self.handing_over.set_result(None)
+
+    async def client_to_engine(self):
+        warmup = self.warmup
+        client_writer = self.client_writer
+        replay = self.replay
+        try:
+            while True:
+                line_bytes = await self.client_reader.readline()
+                if not line_bytes:
+                    break
+                command = line_bytes.decode().strip()
+                if command.split(maxsplit=1)[:1] == [CLIENT_RTT_COMMAND]:
+                    # Browser RTT measured by server.ts: kept for the time margin, never sent to the engine
+                    if self.time_keeper and not self.time_keeper.report_client_rtt(command):
+                        logging.warning(f"Ignoring malformed '{command}'.")
+                    continue
+                trace_seq = self.trace.received(command) if self.trace else None
+                if self.transcript:
+                    self.transcript.client(command)
+                if self.time_keeper:
+                    self.time_keeper.sample(client_writer.get_extra_info("socket"))
+
+                if warmup:
+                    # Answer the first 'usi'/'isready' from the warm-up instead of the engine
+                    if command == "usi" and not warmup.usi_replied:
+                        await warmup.usi_done.wait()
+                        warmup.usi_replied = True
+                        logging.info("[Client -> Engine] usi (answered from warm-up)")
+                        if self.transcript:
+                            for usi_line in warmup.usi_lines:
+                                self.transcript.engine(usi_line.decode(errors="ignore").strip())
+                        client_writer.write(b"".join(warmup.usi_lines))
                         await client_writer.drain()
+                        if self.trace:
+                            self.trace.answered(trace_seq, command)
+                        continue
+                    await warmup.ready_done.wait()
+                    if command == "isready" and not warmup.ready_replied:
+                        warmup.ready_replied = True
+                        if not warmup.dirty:
+                            logging.info("[Client -> Engine] isready (answered from warm-up)")
+                            if replay:
+                                replay.ready = True
+                            if self.transcript:
+                                self.transcript.engine("readyok")
+                            client_writer.write(b"readyok\n")
+                            await client_writer.drain()
+                            if self.trace:
+                                self.trace.answered(trace_seq, command)
+                            continue
+                    elif command.startswith("setoption"):
+                        warmup.dirty = True
+
+                # Wait while a crashed engine is being replaced (the command then goes to the new one)
+                await self.engine_ready.wait()
+                stdin = self.engine_process.stdin
+
+                try:
+                    # Inject options immediately BEFORE 'isready' command (only once)
+                    if command == "isready" and not self.options_applied:
+                        options = self.engine_def.get("options")
+                        if options:
+                            logging.info(f"Detected 'isready', applying engine options for '{self.engine_id}'...")
+                            self.record_engine_options(options)
+                            await apply_engine_options(stdin, options)
+                            self.options_applied = True
+
+                    if self.time_keeper:
+                        forwarded = self.time_keeper.on_client_command(command)
+                        if forwarded != command:
+                            logging.info(f"[Client -> Engine] {command} (sent as '{forwarded}')")
+                            command = forwarded
+                            line_bytes = f"{command}\n".encode()
+                        else:
+                            logging.info(f"[Client -> Engine] {command}")
                     else:
-                        logging.warning(f"Authentication failed from {peername}")
-                        client_writer.write(b"WRAPPER_ERROR: Authentication failed\n")
-                        await client_writer.drain()
-                        client_writer.close()
-                        await client_writer.wait_closed()
-                        return
+                        logging.info(f"[Client -> Engine] {command}")
+                    if replay:
+                        replay.record_client(command)
+                    if self.watchdog:
+                        self.watchdog.on_client_command(command)
+                    stdin.write(line_bytes)
+                    await stdin.drain()
+                    self.counters.commands += 1
+                    self.counters.bytes_to_engine += len(line_bytes)
+                    name = command.split(maxsplit=1)[0] if command else ""
+                    if name == "go":
+                        self.searching = True
+                    elif name not in ("stop", "ponderhit"):
+                        self.searching = False
+                    self.last_command = name
+                    if trace_seq is not None:
+                        self.trace.sent(trace_seq, command)
+                except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+                    if not replay or replay.quitting or not (self.respawn_enabled or self.watchdog.killed):
+                        raise
+                    # The engine has crashed. The command is part of the recorded state replayed after the respawn.
+                    logging.info(f"Engine pipe closed while sending '{command}'.")
+        except Exception as e:
+            logging.debug(f"Client to engine pipe closed: {e}")
+
+    async def engine_stdout_to_client(self):
+        # The warm-up owns engine stdout until 'readyok'
+        if self.warmup:
+            await self.warmup.task
+        if self.zero_copy_fd is not None:
+            await splice_stream(self.zero_copy_fd, self.client_writer, "[Engine -> Client]", self.counters)
+        elif self.follows_engine_output():
+            await self.relay_engine_lines()
+        else:
+            await pipe_stream(self.engine_process.stdout, self.client_writer, "[Engine -> Client]", self.counters)
+
+    def follows_engine_output(self) -> bool:
+        """Whether a feature of the session needs engine stdout line by line."""
+        features = (self.replay, self.watchdog, self.trace, self.time_keeper, self.transcript, self.search_health)
+        return any(features) or self.output_format != "usi"
+
+    async def relay_engine_lines(self):
+        """
+        Line-based relay of engine stdout for the features that follow the engine output
+        (replay, stop watchdog, tracing, network time margin, transcripts, search health, structured output).
+        """
+        reader = self.engine_process.stdout
+        try:
+            while True:
+                line_bytes = await reader.readline()
+                if not line_bytes:
+                    break
+                line = line_bytes.decode(errors="ignore").strip()
+                if self.trace:
+                    self.trace.engine_line(line)
+                if self.transcript:
+                    self.transcript.engine(line)
+                if self.search_health:
+                    for warning in self.search_health.on_line(line):
+                        logging.warning(warning)
+                if line.startswith("info"):
+                    logging.debug(f"[Engine -> Client] {line}")
                 else:
-                    logging.warning(f"Unexpected command during auth from {peername}: {auth_cmd}")
-                    client_writer.write(b"WRAPPER_ERROR: Authentication required\n")
-                    await client_writer.drain()
-                    client_writer.close()
-                    await client_writer.wait_closed()
-                    return
+                    logging.info(f"[Engine -> Client] {line}")
+                if self.watchdog and not self.watchdog.on_engine_line(line):
+                    continue
+                if self.replay:
+                    self.replay.record_engine(line)
+                if line.startswith("bestmove"):
+                    self.searching = False
+                    message = self.time_keeper.on_bestmove() if self.time_keeper else None
+                    if message:
+                        logging.info(f"Network time margin of '{self.engine_id}': {message}")
+                elif self.output_format == "json" and line.startswith("info"):
+                    line_bytes = info_frame(line)
+                self.client_writer.write(line_bytes)
+                await self.client_writer.drain()
+                self.counters.bytes_to_client += len(line_bytes)
+                if self.trace:
+                    self.trace.forwarded(line)
+        except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError, ConnectionAbortedError):
+            pass
+        except Exception as e:
+            logging.error(f"Unexpected error in [Engine -> Client]: {e}", exc_info=True)
+
+
+def compression_info(client_writer) -> dict:
+    if not isinstance(client_writer, CompressedWriter):
+        return {}
+    return {"compressed_bytes_to_client": client_writer.bytes_out}
+
+
+class SplitSessionEntry:
+    """Admin view of a run-split session."""
+
+    def __init__(self, engine_id: str, split: RootSplitSession, peername):
+        self.id = next_session_id()
+        self.engine_id = engine_id
+        self.split = split
+        self.peername = peername
+        self.started = time.monotonic()
+
+    def info(self) -> dict:
+        split = self.split
+        return {
+            "id": self.id,
+            "kind": "split",
+            "peer": str(self.peername),
+            "engine": self.engine_id,
+            "pid": [process.pid for process in split.processes],
+            "uptime": round(time.monotonic() - self.started, 1),
+            "state": "searching" if any(split.searching) else "idle",
+            "format": split.output_format,
+            "commands": split.commands,
+            "bytes_to_engine": split.bytes_to_engine,
+            "bytes_to_client": split.bytes_to_client,
+            **compression_info(split.client_writer),
+        }
+
+
+async def run_split_session(
+    engine_def: dict,
+    engine_path: Path,
+    split_count: int,
+    client_reader: asyncio.StreamReader,
+    client_writer: asyncio.StreamWriter,
+    output_format: str = "usi",
+):
+    """Serve one client with several processes of the same engine (see root_split.py)."""
+    engine_id = engine_def["id"]
+    options = split_engine_options(engine_def.get("options"), split_count)
+    processes = []
+    try:
+        try:
+            for _ in range(split_count):
+                processes.append(await start_engine_process(engine_path, limits=engine_def.get("limits")))
+        except Exception as e:
+            logging.error(f"Failed to start split engine processes: {e}", exc_info=True)
+            client_writer.write(b"WRAPPER_ERROR: Failed to start engine process.\n")
+            await client_writer.drain()
+            return
+
+        pids = ", ".join(str(p.pid) for p in processes)
+        logging.info(f"Started split engine: {engine_def.get('name', 'Unknown')} (ID: {engine_id[:5]}...) x{split_count} (PIDs: {pids})")
+
+        async def apply_options(stdin, index):
+            if options:
+                logging.info(f"Applying engine options for '{engine_id}' (split #{index})...")
+                await apply_engine_options(stdin, options)
+
+        split = RootSplitSession(processes, client_reader, client_writer, apply_options, output_format)
+        entry = SplitSessionEntry(engine_id, split, client_writer.get_extra_info("peername") or "unix socket")
+        SPLIT_SESSIONS[entry.id] = entry
+        try:
+            await split.run()
+        finally:
+            SPLIT_SESSIONS.pop(entry.id, None)
+    finally:
+        await asyncio.gather(*(stop_engine_process(p) for p in processes), return_exceptions=True)
+
+
+MAX_PROFILE_SECONDS = 300.0
+
+
+async def admin_profile(args: list) -> dict:
+    """profile [seconds] [cprofile|sample]: profile the live process and dump its tasks and session counters."""
+    try:
+        seconds = float(args[0]) if args else 10.0
+    except ValueError:
+        return {"error": f"Invalid duration '{args[0]}'"}
+    mode = args[1] if len(args) > 1 else "cprofile"
+    if mode not in PROFILE_MODES:
+        return {"error": f"Unknown profile mode '{mode}'. Use one of: {', '.join(PROFILE_MODES)}"}
+    seconds = max(0.1, min(seconds, MAX_PROFILE_SECONDS))
+
+    # Next to engine_wrapper.log
+    stem = BASE_DIR / f"engine_wrapper.profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    logging.info(f"Profiling for {seconds:g}s ({mode}).")
+    try:
+        profile_path, summary = await run_profile(mode, seconds, str(stem))
+    except ProfilerBusyError as e:
+        return {"error": str(e)}
+
+    sessions = [session.info() for session in all_sessions()]
+    report_path = f"{stem}.txt"
+    report = "\n\n".join([summary, format_tasks(), "sessions:\n" + "\n".join(json.dumps(info) for info in sessions)])
+    await asyncio.to_thread(Path(report_path).write_text, report, encoding="utf-8")
+    logging.info(f"Profile written to {profile_path} and {report_path}.")
+    return {"status": "ok", "mode": mode, "seconds": seconds, "profile": profile_path, "report": report_path, "sessions": sessions}
+
+
+def all_sessions() -> list:
+    return sorted([*LIVE_SESSIONS.values(), *SPLIT_SESSIONS.values()], key=lambda session: session.started)
+
 
-            first_line = await client_reader.readline()
+async def admin_sessions(args: list) -> dict:
+    """sessions: the live sessions of this process."""
+    return {"sessions": [session.info() for session in all_sessions()], "draining": DRAIN.active}
+
+
+async def admin_kill(args: list) -> dict:
+    """kill <session id>: disconnect the client of a session, which stops its engine."""
+    try:
+        session_id = args[0]
+        pid = int(session_id.split("-")[0])
+    except (IndexError, ValueError):
+        return {"error": "Usage: kill <session id>"}
+    if pid != os.getpid():
+        # With --workers, each admin connection is served by one of the worker processes
+        return {"error": f"Session {session_id} is not served by this process (PID {os.getpid()}). Retry to reach its worker."}
+    session = LIVE_SESSIONS.get(session_id) or SPLIT_SESSIONS.get(session_id)
+    if session is None:
+        return {"error": f"Session {session_id} not found"}
+    client_writer = session.client_writer if isinstance(session, EngineSession) else session.split.client_writer
+    logging.warning(f"Killing session {session_id} of {session.peername} (engine '{session.engine_id}') by admin command.")
+    terminate_client(client_writer, "Session terminated by the administrator.")
+    return {"status": "ok", "killed": session_id}
+
+
+async def admin_drain(args: list) -> dict:
+    """drain [on|off]: refuse (or accept again) new engine sessions, e.g. before maintenance."""
+    mode = args[0] if args else "on"
+    if mode not in ("on", "off"):
+        return {"error": "Usage: drain [on|off]"}
+    DRAIN.set(mode == "on")
+    logging.warning(f"Draining {'enabled' if DRAIN.active else 'disabled'} by admin command.")
+    return {"status": "ok", "draining": DRAIN.active, "sessions": SESSION_COUNTER.total()}
+
+
+async def admin_pool(args: list) -> dict:
+    """pool: busy (searching) and idle engine processes per engine id."""
+    pool = {engine["id"]: {"busy": 0, "idle": 0} for engine in get_engine_list() if "id" in engine}
+    for session in LIVE_SESSIONS.values():
+        counts = pool.setdefault(session.engine_id, {"busy": 0, "idle": 0})
+        counts["busy" if session.state() in ("searching", "stopping") else "idle"] += 1
+    for entry in SPLIT_SESSIONS.values():
+        counts = pool.setdefault(entry.engine_id, {"busy": 0, "idle": 0})
+        busy = sum(entry.split.searching)
+        counts["busy"] += busy
+        counts["idle"] += len(entry.split.processes) - busy
+    return {"pool": pool, "sessions": SESSION_COUNTER.total(), "max_sessions": MAX_SESSIONS, "draining": DRAIN.active}
+
+
+async def admin_connections(args: list) -> dict:
+    """connections: counters of the connection flood protection (per worker in --workers mode)."""
+    return {"connections": CONNECTION_GUARD.to_dict(), "pid": os.getpid()}
+
+
+async def admin_health(args: list) -> dict:
+    """
+    health: rolling hashfull/NPS profile (SEARCH_HEALTH=true) and 'stop' -> 'bestmove' latency
+    histogram per engine id (per worker in --workers mode).
+    """
+    profiles = {engine_id: profile.to_dict() for engine_id, profile in SEARCH_PROFILES.items()}
+    stop_latency = {engine_id: histogram.to_dict() for engine_id, histogram in STOP_LATENCY.items()}
+    return {"health": profiles, "enabled": SEARCH_HEALTH, "stop_latency": stop_latency, "pid": os.getpid()}
+
+
+# Admin commands (only with WRAPPER_ACCESS_TOKEN): name -> coroutine function (args) -> JSON reply
+ADMIN_COMMANDS = {
+    "sessions": admin_sessions,
+    "kill": admin_kill,
+    "drain": admin_drain,
+    "pool": admin_pool,
+    "connections": admin_connections,
+    "health": admin_health,
+    "profile": admin_profile,
+}
+
+
+# Per-connection options appended to 'run'/'run-split' as key=value, e.g. 'run <id> format=json'
+CONNECTION_OPTIONS = {"format": OUTPUT_FORMATS, "compress": COMPRESSION_MODES}
+
+
+def parse_connection_options(command_line: str) -> tuple[str, dict]:
+    """Split the trailing key=value options off a command. Raises ValueError for unknown options or values."""
+    tokens = command_line.split()
+    options = {}
+    while len(tokens) > 1 and "=" in tokens[-1]:
+        key, _, value = tokens.pop().partition("=")
+        if value not in CONNECTION_OPTIONS.get(key, ()):
+            raise ValueError(f"Invalid connection option '{key}={value}'")
+        options[key] = value
+    if not options:
+        return command_line, options
+    return " ".join(tokens), options
+
+
+async def reject_client(client_writer: asyncio.StreamWriter, message: str):
+    client_writer.write(f"WRAPPER_ERROR: {message}\n".encode())
+    await client_writer.drain()
+    client_writer.close()
+    await client_writer.wait_closed()
+
+
+async def authenticate_client(
+    client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter, access_token: str, peername
+) -> tuple[bool, bytes | None]:
+    """
+    HMAC-SHA256 challenge-response, or a session ticket sent together with the first command
+    (see session_ticket.py). Returns (authenticated, first command line if it came with a ticket).
+    """
+    nonce = secrets.token_hex(16)
+    client_writer.write(f"auth_cram_sha256 {nonce}\n".encode())
+    await client_writer.drain()
+
+    # Wait for auth command
+    auth_line = await client_reader.readline()
+    if not auth_line:
+        logging.warning("Client disconnected during auth.")
+        return False, None
+
+    auth_cmd = auth_line.decode().strip()
+    first_line = None
+    if auth_cmd.startswith("resume "):
+        # resume <ticket> <proof> <first command>
+        parts = auth_cmd.split(maxsplit=3)
+        if len(parts) < 4:
+            logging.warning(f"Malformed resume from {peername}")
+            CONNECTION_GUARD.counters["auth_failures"] += 1
+            await reject_client(client_writer, "Authentication failed")
+            return False, None
+        first_line = parts[3].encode() + b"\n"
+        reason = TICKETS.redeem(parts[1], parts[2], access_token) if AUTH_TICKET_TTL > 0 else "disabled"
+        if reason is None:
+            logging.info(f"Client authenticated with a session ticket from {peername}")
+            client_writer.write(f"auth_ok {TICKETS.issue()}\n".encode())
+            await client_writer.drain()
+            return True, first_line
+        # Fall back to the challenge-response on the nonce sent above
+        logging.info(f"Session ticket from {peername} rejected ({reason}), falling back to challenge-response.")
+        client_writer.write(b"auth_ticket_rejected\n")
+        await client_writer.drain()
+        auth_line = await client_reader.readline()
+        if not auth_line:
+            logging.warning("Client disconnected during auth.")
+            return False, None
+        auth_cmd = auth_line.decode().strip()
+
+    if not auth_cmd.startswith("auth "):
+        logging.warning(f"Unexpected command during auth from {peername}: {auth_cmd}")
+        CONNECTION_GUARD.counters["auth_failures"] += 1
+        await reject_client(client_writer, "Authentication required")
+        return False, None
+
+    # 'auth <digest> ticket' also asks for a session ticket
+    digest, _, request = auth_cmd[5:].strip().partition(" ")
+    expected_digest = hmac.new(access_token.encode(), nonce.encode(), hashlib.sha256).hexdigest()
+
+    # Use timing-safe comparison to prevent timing attacks
+    if not hmac.compare_digest(digest, expected_digest):
+        logging.warning(f"Authentication failed from {peername}")
+        CONNECTION_GUARD.counters["auth_failures"] += 1
+        await reject_client(client_writer, "Authentication failed")
+        return False, None
+
+    logging.info(f"Client authenticated successfully from {peername}")
+    if request.strip() == "ticket" and AUTH_TICKET_TTL > 0:
+        client_writer.write(f"auth_ok {TICKETS.issue()}\n".encode())
+    else:
+        client_writer.write(b"auth_ok\n")
+    await client_writer.drain()
+    return True, first_line
+
+
+async def read_first_command(
+    client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter, access_token: str | None, peername
+) -> bytes | None:
+    """Authenticate (if a token is set) and read the first command line. Returns None if authentication failed."""
+    first_line = None
+    if access_token:
+        authenticated, first_line = await authenticate_client(client_reader, client_writer, access_token, peername)
+        if not authenticated:
+            return None
+    if first_line is None:
+        first_line = await client_reader.readline()
+    return first_line
+
+
+async def handle_client(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+    # Unix domain socket peers have no address
+    peername = client_writer.get_extra_info("peername") or "unix socket"
+    if CONNECTION_GUARD.admit(peername[0] if isinstance(peername, tuple) else None):
+        client_writer.write(b"WRAPPER_ERROR: Too many connections.\n")
+        client_writer.close()
+        return
+    logging.info(f"Client connected from {peername}")
+    CLIENT_TASKS.add(asyncio.current_task())
+    tune_client_socket(client_writer)
+    engine_process = None
+    session = None
+    session_admitted = False
+    zero_copy_fd = None
+
+    access_token = os.getenv("WRAPPER_ACCESS_TOKEN")
+
+    try:
+        try:
+            first_line = await asyncio.wait_for(
+                read_first_command(client_reader, client_writer, access_token, peername), HANDSHAKE_TIMEOUT or None
+            )
+            if first_line is None:
+                return
             if not first_line:
                 logging.warning("Client disconnected before sending command.")
                 return
+        except asyncio.TimeoutError:
+            CONNECTION_GUARD.counters["handshake_timeouts"] += 1
+            logging.warning(f"Handshake with {peername} timed out after {HANDSHAKE_TIMEOUT:g}s.")
+            client_writer.write(b"WRAPPER_ERROR: Handshake timed out.\n")
+            return
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, OSError) as e:
             # Handle health check disconnects or immediate client exits gracefully
             logging.info(f"Client disconnected during handshake from {peername}: {e}")
             return
+        finally:
+            CONNECTION_GUARD.handshake_done()
 
         command_line = first_line.decode().strip()
         logging.info(f"Received command: '{command_line}'")
 
+        admin_args = command_line.split()
+        if admin_args and admin_args[0] in ADMIN_COMMANDS:
+            if not access_token:
+                logging.warning(f"Rejected admin command from {peername}: WRAPPER_ACCESS_TOKEN is not set.")
+                client_writer.write(b"WRAPPER_ERROR: Admin commands require WRAPPER_ACCESS_TOKEN.\n")
+                await client_writer.drain()
+                return
+            reply = await ADMIN_COMMANDS[admin_args[0]](admin_args[1:])
+            client_writer.write(json.dumps(reply, separators=(",", ":")).encode() + b"\n")
+            await client_writer.drain()
+            return
+
+        if DRAIN.active and command_line not in ("list", "watch"):
+            logging.info(f"Refused '{command_line}' from {peername}: draining.")
+            client_writer.write(b"WRAPPER_ERROR: Wrapper is draining for maintenance.\n")
+            await client_writer.drain()
+            return
+
         engines = get_engine_list()
 
         if command_line == "list":
@@ -188,15 +2024,41 @@ async def handle_client(client_reader: asyncio.StreamReader, client_writer: asyn
             await client_writer.wait_closed()
             return
 
+        if command_line == "watch":
+            await serve_engine_watch(client_reader, client_writer)
+            return
+
+        try:
+            command_line, connection_options = parse_connection_options(command_line)
+        except ValueError as e:
+            logging.error(f"Invalid command received: {command_line} ({e})")
+            client_writer.write(f"WRAPPER_ERROR: {e}.\n".encode())
+            await client_writer.drain()
+            return
+        output_format = connection_options.get("format", "usi")
+        compressed = connection_options.get("compress", "none") != "none"
+        if compressed:
+            # Everything sent from here on, including errors, is compressed
+            client_writer = CompressedWriter(client_writer, COMPRESS_LEVEL, COMPRESS_FLUSH_MS / 1000)
+
         engine_id = ""
-        if command_line.startswith("run "):
+        split_count = 0
+        if command_line.startswith("run-split "):
+            split_args = command_line[10:].split()
+            engine_id = split_args[0] if split_args else ""
+            try:
+                split_count = int(split_args[1]) if len(split_args) > 1 else DEFAULT_SPLIT_PROCESSES
+            except ValueError:
+                split_count = DEFAULT_SPLIT_PROCESSES
+            split_count = max(1, min(split_count, MAX_SPLIT_PROCESSES))
+        elif command_line.startswith("run "):
             engine_id = command_line[4:].strip()
         elif command_line == "research" or command_line == "game":
             # Backward compatibility
             engine_id = command_line
         else:
             logging.error(f"Invalid command received: {command_line}")
-            client_writer.write(b"WRAPPER_ERROR: Invalid command. Use 'list' or 'run <id>'.\n")
+            client_writer.write(b"WRAPPER_ERROR: Invalid command. Use 'list', 'watch', 'run <id>' or 'run-split <id> [N]'.\n")
             await client_writer.drain()
             return
 
@@ -214,27 +2076,26 @@ async def handle_client(client_reader: asyncio.StreamReader, client_writer: asyn
             await client_writer.drain()
             return
 
-        engine_path = Path(engine_path_str)
-        # Resolve relative paths relative to the script directory
-        if not engine_path.is_absolute():
-            engine_path = (BASE_DIR / engine_path).resolve()
+        engine_path = resolve_engine_path(engine_path_str)
 
-        engine_directory = engine_path.parent
+        if not SESSION_COUNTER.try_acquire(MAX_SESSIONS):
+            logging.warning(f"Rejected session for '{engine_id}': MAX_SESSIONS ({MAX_SESSIONS}) reached.")
+            client_writer.write(b"WRAPPER_ERROR: Too many engine sessions.\n")
+            await client_writer.drain()
+            return
+        session_admitted = True
+
+        if split_count:
+            await run_split_session(engine_def, engine_path, split_count, client_reader, client_writer, output_format)
+            return
 
-        # Prevent new console window on Windows
-        creationflags = 0
-        if sys.platform == "win32":
-            creationflags = subprocess.CREATE_NO_WINDOW
+        engine_stdout = asyncio.subprocess.PIPE
+        if zero_copy_eligible(engine_def, output_format, compressed):
+            zero_copy_fd, engine_stdout = os.pipe()
+            os.set_blocking(zero_copy_fd, False)
 
         try:
-            engine_process = await asyncio.create_subprocess_exec(
-                str(engine_path),
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=engine_directory,
-                creationflags=creationflags,
-            )
+            engine_process = await start_engine_process(engine_path, stdout=engine_stdout, limits=engine_def.get("limits"))
         except FileNotFoundError:
             logging.error(f"Engine executable not found at '{engine_path}'")
             error_message = "WRAPPER_ERROR: Engine executable not found."
@@ -247,94 +2108,43 @@ async def handle_client(client_reader: asyncio.StreamReader, client_writer: asyn
             client_writer.write(error_message.encode() + b"\n")
             await client_writer.drain()
             return
+        finally:
+            if zero_copy_fd is not None:
+                # The engine holds its own copy of the write end
+                os.close(engine_stdout)
 
         engine_name = engine_def.get("name", "Unknown")
         short_id = engine_id[:5]
         logging.info(f"Started engine: {engine_name} (ID: {short_id}...) Path: {engine_path} (PID: {engine_process.pid})")
+        if zero_copy_fd is not None:
+            logging.info("Relaying engine stdout with zero-copy splice().")
 
-        options_applied = False  # Track if options have been applied
-
-        async def client_to_engine():
-            nonlocal options_applied
-            try:
-                while True:
-                    line_bytes = await client_reader.readline()
-                    if not line_bytes:
-                        break
-                    command = line_bytes.decode().strip()
-
-                    # Inject options immediately BEFORE 'isready' command (only once)
-                    if command == "isready" and not options_applied:
-                        options = engine_def.get("options")
-                        if options:
-                            logging.info(f"Detected 'isready', applying engine options for '{engine_id}'...")
-                            await apply_engine_options(engine_process.stdin, options)
-                            options_applied = True
-
-                    logging.info(f"[Client -> Engine] {command}")
-                    engine_process.stdin.write(line_bytes)
-                    await engine_process.stdin.drain()
-            except Exception as e:
-                logging.debug(f"Client to engine pipe closed: {e}")
-
-        client_to_engine_task = asyncio.create_task(client_to_engine())
-        engine_stdout_to_client_task = asyncio.create_task(pipe_stream(engine_process.stdout, client_writer, "[Engine -> Client]"))
-        engine_stderr_to_client_task = asyncio.create_task(pipe_stream(engine_process.stderr, client_writer, "[Engine ERROR]"))
-        engine_wait_task = asyncio.create_task(engine_process.wait())
-
-        tasks_to_cancel = [
-            client_to_engine_task,
-            engine_stdout_to_client_task,
-            engine_stderr_to_client_task,
-            engine_wait_task,
-        ]
-
-        done, pending = await asyncio.wait(tasks_to_cancel, return_when=asyncio.FIRST_COMPLETED)
+        session = EngineSession(engine_def, engine_process, client_reader, client_writer, peername, zero_copy_fd, output_format)
+        # The session owns the engine process and the pipe from here on
+        engine_process = None
+        zero_copy_fd = None
+        if engine_def.get("eager_init") is True:
+            logging.info(f"Eager init enabled for '{engine_id}', warming up engine.")
+            session.start_warmup()
 
-        for task in pending:
-            task.cancel()
+        await session.run()
 
     except Exception as e:
         logging.error(f"An error occurred in client handler: {e}", exc_info=True)
     finally:
-        for task in tasks_to_cancel:
-            if not task.done():
-                task.cancel()
+        if session:
+            await session.close()
 
         if engine_process:
-            if engine_process.returncode is not None:
-                logging.info(f"Engine process (PID: {engine_process.pid}) already exited with code {engine_process.returncode}.")
-            else:
-                logging.info(f"Cleaning up engine process (PID: {engine_process.pid}).")
-                try:
-                    # Send 'quit' command
-                    if engine_process.stdin and not engine_process.stdin.is_closing():
-                        logging.info("Sending 'quit' command to engine.")
-                        engine_process.stdin.write(b"quit\n")
-                        await engine_process.stdin.drain()
-                        engine_process.stdin.close()
-
-                    # Wait for engine to exit
-                    try:
-                        await asyncio.wait_for(engine_process.wait(), timeout=5.0)
-                        logging.info(f"Engine process (PID: {engine_process.pid}) exited gracefully.")
-                    except asyncio.TimeoutError:
-                        logging.warning("Engine did not exit after 'quit' command. Terminating.")
-                        if engine_process.returncode is None:
-                            engine_process.terminate()
-                            try:
-                                await asyncio.wait_for(engine_process.wait(), timeout=3.0)
-                            except asyncio.TimeoutError:
-                                logging.warning(f"Engine process (PID: {engine_process.pid}) did not terminate gracefully, killing.")
-                                if engine_process.returncode is None:
-                                    engine_process.kill()
-                                    await engine_process.wait()
-                except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
-                    logging.warning("Engine stdin pipe already closed, could not send 'quit'.")
-                except ProcessLookupError:
-                    pass
+            await stop_engine_process(engine_process)
             engine_process = None
 
+        if zero_copy_fd is not None:
+            os.close(zero_copy_fd)
+
+        if session_admitted:
+            SESSION_COUNTER.release()
+
         if client_writer and not client_writer.is_closing():
             client_writer.close()
             try:
@@ -342,13 +2152,339 @@ async def handle_client(client_reader: asyncio.StreamReader, client_writer: asyn
             except Exception:
                 pass
 
-        logging.info(f"Client disconnected from {peername}.")
+        CLIENT_TASKS.discard(asyncio.current_task())
+        if session and session.handed_off:
+            logging.info(f"Session of {peername} handed over to the new wrapper process.")
+        else:
+            logging.info(f"Client disconnected from {peername}.")
+
+
+async def start_unix_server(path: str):
+    """Listen on a Unix domain socket in addition to TCP. Returns None if unsupported."""
+    if sys.platform == "win32":
+        logging.warning("LISTEN_UNIX is not supported on Windows. Ignoring.")
+        return None
+
+    socket_path = Path(path)
+    if socket_path.is_socket():
+        # Stale socket file left by a previous run
+        socket_path.unlink()
 
+    server = await asyncio.start_unix_server(handle_client, path=str(socket_path))
+    # Allow access from the same user and group only
+    os.chmod(socket_path, 0o660)
+    logging.info(f"Engine wrapper server listening on unix socket {socket_path}")
+    return server
 
-async def main():
-    server = await asyncio.start_server(handle_client, HOST, PORT)
-    addrs = ", ".join(str(sock.getsockname()) for sock in server.sockets)
-    logging.info(f"Single-port engine wrapper server listening on {addrs}")
+
+async def hand_over(conn: socket.socket, servers: list):
+    """Send the listening sockets and the live sessions to a new wrapper process."""
+    listeners = [sock for server in servers for sock in server.sockets]
+    send_message(conn, {"type": "listeners"}, [sock.fileno() for sock in listeners])
+    # Stop accepting here. Connections arriving from now on wait in the backlog for the new process.
+    for server in servers:
+        server.close()
+    logging.info(f"Handed over {len(listeners)} listening sockets.")
+    # Watchers reconnect to the new process
+    ENGINE_LIST_WATCH.close()
+
+    sessions = list(LIVE_SESSIONS.values())
+    moved = 0
+    for session in sessions:
+        if not session.can_hand_off():
+            continue
+        try:
+            await session.hand_over(conn)
+            moved += 1
+        except ProcessLookupError:
+            # The engine has just exited
+            pass
+        except OSError as e:
+            logging.error(f"Failed to hand over the session of {session.peername}: {e}")
+    logging.info(f"Handed over {moved} of {len(sessions)} engine sessions.")
+
+
+async def start_handoff_listener(servers: list, handoff_done: asyncio.Event):
+    """Wait for a new wrapper process started with --takeover. Returns the listening socket."""
+    socket_path = Path(HANDOFF_SOCKET_PATH)
+    if socket_path.is_socket():
+        socket_path.unlink()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    listener.bind(str(socket_path))
+    # Only the same user may take over the wrapper
+    os.chmod(socket_path, 0o600)
+    listener.listen(1)
+    listener.setblocking(False)
+
+    async def accept_takeover():
+        loop = asyncio.get_running_loop()
+        while True:
+            conn, _ = await loop.sock_accept(listener)
+            with conn:
+                try:
+                    request = json.loads(await loop.sock_recv(conn, MAX_MESSAGE_SIZE) or b"{}")
+                except ValueError:
+                    continue
+                if request.get("type") != "takeover":
+                    continue
+                logging.info("A new wrapper process requested takeover.")
+                conn.setblocking(True)
+                await hand_over(conn, servers)
+                # The path is free for the new process once 'done' has been received
+                listener.close()
+                socket_path.unlink(missing_ok=True)
+                send_message(conn, {"type": "done"})
+            handoff_done.set()
+            return
+
+    start_background_task(accept_takeover())
+    logging.info(f"Waiting for takeover requests on {socket_path}")
+    return listener
+
+
+async def adopt_session(message: dict, fds: list):
+    """Continue a session handed over by the previous wrapper process."""
+    client_fd, stdin_fd, stdout_fd, stderr_fd, pidfd = fds
+    client_reader, client_writer = await open_client_socket(client_fd)
+    stdin = await open_pipe_writer(stdin_fd)
+    stderr_pipe, stderr = await open_pipe_reader(stderr_fd)
+    engine_def = message["engine_def"]
+    zero_copy_fd = None
+    stdout_pipe, stdout = None, None
+    # splice() needs a pipe (uvloop uses socketpairs for subprocess stdio)
+    output_format = message.get("format", "usi")
+    if zero_copy_eligible(engine_def, output_format) and stat.S_ISFIFO(os.fstat(stdout_fd).st_mode):
+        zero_copy_fd = stdout_fd
+        os.set_blocking(zero_copy_fd, False)
+    else:
+        stdout_pipe, stdout = await open_pipe_reader(stdout_fd)
+    engine_process = AdoptedProcess(message["pid"], pidfd, stdin, stdout, stderr, (stdin.transport, stdout_pipe, stderr_pipe))
+    ENGINE_PROCESSES.add(engine_process)
+
+    session = EngineSession(engine_def, engine_process, client_reader, client_writer, message["peername"], zero_copy_fd, output_format)
+    session.options_applied = message["options_applied"]
+    if session.replay and message.get("replay"):
+        session.replay.load(message["replay"])
+    logging.info(f"Took over the session of {session.peername} (engine '{session.engine_id}', PID: {engine_process.pid}).")
+
+    async def serve():
+        CLIENT_TASKS.add(asyncio.current_task())
+        SESSION_COUNTER.try_acquire(0)
+        try:
+            await session.run()
+        except Exception as e:
+            logging.error(f"An error occurred in adopted session: {e}", exc_info=True)
+        finally:
+            await session.close()
+            SESSION_COUNTER.release()
+            if not client_writer.is_closing():
+                client_writer.close()
+            CLIENT_TASKS.discard(asyncio.current_task())
+            logging.info(f"Client disconnected from {session.peername}.")
+
+    start_background_task(serve())
+
+
+async def take_over(path: str) -> list:
+    """
+    Take the listeners and live sessions over from a running wrapper process. Returns the adopted
+    servers, which is empty when there was nothing to take over.
+    """
+    if not HANDOFF_SUPPORTED:
+        logging.error("--takeover is only supported on Linux.")
+        return []
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    try:
+        conn.connect(path)
+    except OSError as e:
+        logging.error(f"No running wrapper to take over at {path} ({e}).")
+        conn.close()
+        return []
+
+    servers = []
+    with conn:
+        conn.settimeout(HANDOFF_TIMEOUT)
+        send_message(conn, {"type": "takeover"})
+        while True:
+            try:
+                message, fds = await asyncio.to_thread(recv_message, conn)
+            except OSError as e:
+                logging.error(f"Takeover interrupted: {e}")
+                break
+            if message is None or message["type"] == "done":
+                break
+            if message["type"] == "listeners":
+                for fd in fds:
+                    sock = socket.socket(fileno=fd)
+                    if sock.family == socket.AF_UNIX:
+                        servers.append(await asyncio.start_unix_server(handle_client, sock=sock))
+                    else:
+                        servers.append(await asyncio.start_server(handle_client, sock=sock))
+                    logging.info(f"Took over listener {sock.getsockname()}")
+            elif message["type"] == "session":
+                try:
+                    await adopt_session(message, fds)
+                except Exception as e:
+                    logging.error(f"Failed to take over a session: {e}", exc_info=True)
+                    for fd in fds:
+                        try:
+                            os.close(fd)
+                        except OSError:
+                            pass
+    return servers
+
+
+def engine_executable(pid: int, engine_paths: set) -> str | None:
+    """Return the engines.json path that a process runs, if any (script engines run under an interpreter)."""
+    try:
+        exe = os.readlink(f"/proc/{pid}/exe")
+        if exe in engine_paths:
+            return exe
+        cwd = os.readlink(f"/proc/{pid}/cwd")
+        argv = Path(f"/proc/{pid}/cmdline").read_bytes().split(b"\0")
+    except OSError:
+        return None
+    for arg in argv[:2]:
+        path = os.path.realpath(os.path.join(cwd, os.fsdecode(arg)))
+        if path in engine_paths:
+            return path
+    return None
+
+
+def is_wrapper_process(pid: int) -> bool:
+    try:
+        return b"engine_wrapper" in Path(f"/proc/{pid}/cmdline").read_bytes()
+    except OSError:
+        return False
+
+
+def is_wrapper_engine(pid: int) -> bool:
+    """Whether a process was started by start_engine_process() (ENGINE_MARKER_ENV in its environment)."""
+    try:
+        environ = Path(f"/proc/{pid}/environ").read_bytes().split(b"\0")
+    except OSError:
+        return False
+    return f"{ENGINE_MARKER_ENV}=1".encode() in environ
+
+
+def orphan_adopters(processes: dict) -> set:
+    """
+    The processes that an engine is reparented to when its wrapper dies: init, or a subreaper
+    (systemd --user, a container init) among the ancestors of this wrapper.
+    """
+    adopters = {1}
+    pid = os.getppid()
+    while pid > 1 and pid not in adopters:
+        adopters.add(pid)
+        pid = processes.get(pid, (0, 0, 0))[0]
+    return adopters
+
+
+def find_orphaned_engines(live_pids: set) -> list:
+    """
+    Find engine processes that no wrapper owns any more (e.g. left behind by a wrapper that
+    was killed): started by a wrapper, and reparented to init or a subreaper since.
+    Returns (pid, path, rss_kb, helper_count) tuples, with the helpers' memory included.
+    """
+    engine_paths = set()
+    for engine in get_engine_list():
+        try:
+            engine_paths.add(os.path.realpath(resolve_engine_path(engine["path"])))
+        except (KeyError, TypeError):
+            pass
+    processes = list_processes()
+    adopters = orphan_adopters(processes)
+    orphans = []
+    for pid, (ppid, _pgid, _sid) in processes.items():
+        # A process whose parent is still alive (including engines forked by an engine) is not an orphan
+        if pid in live_pids or ppid not in adopters or is_wrapper_process(ppid):
+            continue
+        path = engine_executable(pid, engine_paths)
+        if not path or not is_wrapper_engine(pid):
+            continue
+        helpers = get_descendant_pids(pid, processes)
+        rss_kb = get_rss_kb(pid) + sum(get_rss_kb(h) for h in helpers)
+        orphans.append((pid, path, rss_kb, len(helpers)))
+    return orphans
+
+
+async def reap_orphans_periodically():
+    while True:
+        await asyncio.sleep(ORPHAN_REAP_INTERVAL)
+        live_pids = {p.pid for p in ENGINE_PROCESSES} | {p.pid for p in HANDED_OFF_PROCESSES}
+        try:
+            orphans = await asyncio.to_thread(find_orphaned_engines, live_pids)
+        except Exception as e:
+            logging.error(f"Orphan scan failed: {e}", exc_info=True)
+            continue
+        for pid, path, rss_kb, helper_count in orphans:
+            helpers = f" with {helper_count} helper processes" if helper_count else ""
+            logging.warning(f"Orphaned engine process (PID: {pid}) {path}{helpers} holds {rss_kb / 1024:.0f} MB RSS.")
+            if ORPHAN_REAP_KILL:
+                kill_proc_tree(pid)
+                logging.warning(f"Killed orphaned engine process (PID: {pid}).")
+
+
+async def shutdown_engines():
+    """Send 'quit' to all engines at once and kill the ones still running at the SHUTDOWN_TIMEOUT deadline."""
+    global SHUTTING_DOWN
+    SHUTTING_DOWN = True
+    processes = [p for p in ENGINE_PROCESSES if p.returncode is None]
+    if processes:
+        logging.info(f"Stopping {len(processes)} engine processes (deadline: {SHUTDOWN_TIMEOUT:g}s).")
+        stops = [asyncio.create_task(stop_engine_process(p)) for p in processes]
+        _, pending = await asyncio.wait(stops, timeout=SHUTDOWN_TIMEOUT)
+        if pending:
+            survivors = [p for p in processes if p.returncode is None]
+            logging.warning(f"Shutdown deadline reached. Killing {len(survivors)} engine processes.")
+            for p in survivors:
+                try:
+                    p.kill()
+                except ProcessLookupError:
+                    pass
+            await asyncio.wait(pending, timeout=1.0)
+
+    # The client handlers only have their sockets left to close
+    clients = [t for t in CLIENT_TASKS if t is not asyncio.current_task()]
+    if clients:
+        _, pending = await asyncio.wait(clients, timeout=1.0)
+        for task in pending:
+            task.cancel()
+
+
+async def wait_first(*aws):
+    """Wait until one of the awaitables completes and cancel the others."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def wait_for_clients():
+    while CLIENT_TASKS:
+        await asyncio.wait(list(CLIENT_TASKS))
+
+
+async def main(reuse_port: bool = False, listen_unix: bool = True, takeover: bool = False):
+    servers = await take_over(HANDOFF_SOCKET_PATH) if takeover else []
+    if takeover and not servers:
+        # Listening ourselves would fail on the port of a wrapper that is still running, or start a
+        # second wrapper next to it. The exit status tells the launcher that the reload failed.
+        logging.error("Takeover failed. Exiting.")
+        sys.exit(1)
+    if not servers:
+        server = await asyncio.start_server(handle_client, HOST, PORT, reuse_port=reuse_port or None)
+        tune_listening_sockets(server)
+        addrs = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        logging.info(f"Single-port engine wrapper server listening on {addrs}")
+
+        servers = [server]
+        if UNIX_SOCKET_PATH and listen_unix:
+            unix_server = await start_unix_server(UNIX_SOCKET_PATH)
+            if unix_server:
+                servers.append(unix_server)
 
     engines_json_path = BASE_DIR / "engines.json"
     if engines_json_path.exists():
@@ -364,12 +2500,165 @@ async def main():
     else:
         logging.error("engines.json not found. Please create one based on engines.json.example.")
 
-    async with server:
-        await server.serve_forever()
+    handoff_done = asyncio.Event()
+    handoff_listener = None
+    # Worker processes share the port with SO_REUSEPORT and are not handed over
+    if HANDOFF_SUPPORTED and not reuse_port:
+        try:
+            handoff_listener = await start_handoff_listener(servers, handoff_done)
+        except OSError as e:
+            logging.warning(f"Zero-downtime restart is unavailable: {e}")
+
+    # Only one process scans (the first worker in --workers mode)
+    if sys.platform == "linux" and ORPHAN_REAP_INTERVAL > 0 and listen_unix:
+        start_background_task(reap_orphans_periodically())
+
+    if LATENCY_TRACE:
+        start_trace_writer(LATENCY_TRACE_FILE)
+    if SESSION_TRANSCRIPTS:
+        start_transcript_writer(TRANSCRIPT_DIR, TRANSCRIPT_KEEP)
+
+    stop_requested = asyncio.Event()
+    if sys.platform != "win32":
+        # On Windows, Ctrl+C cancels main() instead and the same cleanup runs in 'finally'
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop_requested.set)
+
+    try:
+        # Serve until a stop signal or until the listeners have been handed over to a new process
+        await wait_first(handoff_done.wait(), stop_requested.wait())
+        if handoff_done.is_set():
+            # Finish the sessions that stay here (split sessions and warm-ups)
+            await wait_first(wait_for_clients(), stop_requested.wait())
+            if stop_requested.is_set():
+                await shutdown_engines()
+            logging.info("All sessions finished or handed over. Exiting.")
+            stop_trace_writer()
+            stop_transcript_writer()
+            logging.shutdown()
+            # Exit without finalizing the subprocess transports, which would kill the engines that were handed over
+            os._exit(0)
+        logging.info("Stop signal received. Shutting down.")
+    finally:
+        # Stop accepting first, then stop the engines in parallel
+        for s in servers:
+            s.close()
+        ENGINE_LIST_WATCH.close()
+        await shutdown_engines()
+        if handoff_listener:
+            handoff_listener.close()
+            Path(HANDOFF_SOCKET_PATH).unlink(missing_ok=True)
+        if UNIX_SOCKET_PATH and listen_unix:
+            Path(UNIX_SOCKET_PATH).unlink(missing_ok=True)
+        stop_trace_writer()
+        stop_transcript_writer()
+
+
+def load_uvloop():
+    """Return the uvloop module if it should be used, otherwise None."""
+    if EVENT_LOOP == "asyncio" or sys.platform == "win32":
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        if EVENT_LOOP == "uvloop":
+            logging.warning("WRAPPER_EVENT_LOOP=uvloop but uvloop is not installed. Using the default event loop.")
+        return None
+    return uvloop
+
+
+def run(coro):
+    uvloop = load_uvloop()
+    if uvloop:
+        logging.info(f"Using uvloop {uvloop.__version__} event loop.")
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+
+def worker_main(index: int, shared_sessions, shared_drain):
+    """Entry point of a worker process in --workers mode."""
+    global SESSION_COUNTER, DRAIN, LATENCY_TRACE_FILE, TICKETS
+    SESSION_COUNTER = SessionCounter(shared_sessions, index)
+    DRAIN = DrainState(shared_drain)
+    # The book inherited from the supervisor would give every worker the same key but its own
+    # record of the redeemed tickets, so a ticket could be resumed once per worker
+    TICKETS = TicketBook(AUTH_TICKET_TTL)
+    # A rotating file cannot be shared between processes
+    LATENCY_TRACE_FILE = str(Path(LATENCY_TRACE_FILE).with_suffix(f".w{index}.jsonl"))
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(f"[%(asctime)s.%(msecs)03dZ] [w{index}] %(message)s", datefmt="%Y-%m-%dT%H:%M:%S"))
+    try:
+        # Only the first worker listens on the Unix domain socket (it cannot be shared with SO_REUSEPORT)
+        run(main(reuse_port=True, listen_unix=index == 0))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(count: int):
+    """Fork worker processes that share the listening port and restart them if they die."""
+    ctx = multiprocessing.get_context("fork")
+    # One session counter slot per worker (see SessionCounter)
+    shared_sessions = ctx.Array("i", count)
+    shared_drain = ctx.Value("b", 0)
+
+    def spawn(index):
+        process = ctx.Process(target=worker_main, args=(index, shared_sessions, shared_drain), name=f"engine-wrapper-worker-{index}")
+        process.start()
+        logging.info(f"Started worker {index} (PID: {process.pid}).")
+        return process
+
+    # Stop the workers too when the supervisor is terminated (e.g. by the launcher)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    workers = [spawn(i) for i in range(count)]
+    try:
+        while True:
+            time.sleep(1.0)
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    logging.warning(f"Worker {i} (PID: {process.pid}) exited with code {process.exitcode}. Restarting.")
+                    with shared_sessions.get_lock():
+                        shared_sessions[i] = 0
+                    workers[i] = spawn(i)
+    finally:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            process.join(timeout=SHUTDOWN_TIMEOUT + 5.0)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="USI engine wrapper for ShogiHome LAN")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="number of worker processes sharing the port with SO_REUSEPORT (Linux only, default: WRAPPER_WORKERS or 1)",
+    )
+    parser.add_argument(
+        "--takeover",
+        action="store_true",
+        help="take the listening sockets and live engine sessions over from the running wrapper (Linux only)",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.takeover and args.workers > 1:
+        # Worker processes share the port with SO_REUSEPORT and are not handed over
+        logging.error("--takeover cannot be used with --workers.")
+        sys.exit(2)
     try:
-        asyncio.run(main())
+        if args.workers > 1 and sys.platform == "linux":
+            logging.info(f"Starting {args.workers} worker processes with SO_REUSEPORT.")
+            run_workers(args.workers)
+        else:
+            if args.workers > 1:
+                logging.warning("--workers requires Linux (SO_REUSEPORT). Running a single process.")
+            run(main(takeover=args.takeover))
     except KeyboardInterrupt:
         logging.info("Server is shutting down.")
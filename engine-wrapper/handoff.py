@@ -0,0 +1,130 @@
+"""
+Zero-downtime restart support (Linux only).
+
+A new wrapper process started with '--takeover' connects to the handoff socket of
+the running one and receives the listening sockets and the live engine sessions
+(client socket + engine stdio pipes + a pidfd of the engine) with SCM_RIGHTS.
+Clients keep their connection and engines keep their hash tables and search state.
+
+Messages are JSON objects sent over a SOCK_SEQPACKET Unix socket, one per packet,
+with the file descriptors attached to the same packet.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+
+# SCM_RIGHTS, pidfd_open() and pidfd_send_signal() are needed
+HANDOFF_SUPPORTED = sys.platform == "linux" and hasattr(socket, "send_fds") and hasattr(os, "pidfd_open")
+
+MAX_MESSAGE_SIZE = 64 * 1024
+MAX_FDS_PER_MESSAGE = 16
+
+
+def send_message(sock: socket.socket, message: dict, fds: list = ()):
+    socket.send_fds(sock, [json.dumps(message).encode()], list(fds))
+
+
+def recv_message(sock: socket.socket) -> tuple[dict | None, list]:
+    """Receive one message and its file descriptors. Returns (None, []) when the peer has closed the socket."""
+    data, fds, _flags, _addr = socket.recv_fds(sock, MAX_MESSAGE_SIZE, MAX_FDS_PER_MESSAGE)
+    if not data:
+        for fd in fds:
+            os.close(fd)
+        return None, []
+    return json.loads(data), fds
+
+
+async def drain_reader(reader: asyncio.StreamReader) -> bytes:
+    """Take whatever a stream reader has buffered but not delivered yet (its transport must be paused)."""
+    reader.feed_eof()
+    return await reader.read()
+
+
+async def flush_writer(writer: asyncio.StreamWriter):
+    """Wait until everything written to a stream has reached the kernel."""
+    writer.transport.set_write_buffer_limits(high=0)
+    await writer.drain()
+
+
+def pipe_transports(engine_process) -> tuple:
+    """Return the (stdin, stdout, stderr) pipe transports of an engine process (None for non-piped streams)."""
+    if isinstance(engine_process, AdoptedProcess):
+        return engine_process.pipes
+    # asyncio.subprocess.Process has no public accessor for its transport
+    transport = engine_process._transport
+    return tuple(transport.get_pipe_transport(fd) for fd in (0, 1, 2))
+
+
+def transport_fileno(transport) -> int:
+    # uvloop connects subprocess stdio with socketpairs and exposes them as 'socket' only
+    return (transport.get_extra_info("pipe") or transport.get_extra_info("socket")).fileno()
+
+
+async def open_pipe_reader(fd: int) -> tuple[asyncio.ReadTransport, asyncio.StreamReader]:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", buffering=0))
+    return transport, reader
+
+
+async def open_pipe_writer(fd: int) -> asyncio.StreamWriter:
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, os.fdopen(fd, "wb", buffering=0))
+    return asyncio.StreamWriter(transport, protocol, None, loop)
+
+
+async def open_client_socket(fd: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    sock = socket.socket(fileno=fd)
+    if sock.family == socket.AF_UNIX:
+        return await asyncio.open_unix_connection(sock=sock)
+    return await asyncio.open_connection(sock=sock)
+
+
+class AdoptedProcess:
+    """
+    An engine process inherited from the previous wrapper process.
+    Provides the part of asyncio.subprocess.Process that the wrapper uses. The engine is
+    not our child, so its exit is observed through a pidfd and the exit status is not
+    available: returncode is 0 once it has exited, whether the engine quit or crashed
+    (see EngineSession.engine_exited_cleanly()).
+    """
+
+    def __init__(self, pid: int, pidfd: int, stdin: asyncio.StreamWriter, stdout, stderr: asyncio.StreamReader, pipes: tuple):
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        # (stdin, stdout, stderr) transports, for handing the engine over again
+        self.pipes = pipes
+        self.returncode = None
+        self._pidfd = pidfd
+        self._loop = asyncio.get_running_loop()
+        self._exited = self._loop.create_future()
+        self._loop.add_reader(pidfd, self._on_exit)
+
+    def _on_exit(self):
+        self._loop.remove_reader(self._pidfd)
+        os.close(self._pidfd)
+        self._pidfd = None
+        self.returncode = 0
+        if not self._exited.done():
+            self._exited.set_result(None)
+
+    async def wait(self) -> int:
+        await asyncio.shield(self._exited)
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        if self._pidfd is None:
+            raise ProcessLookupError(self.pid)
+        signal.pidfd_send_signal(self._pidfd, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
@@ -0,0 +1,122 @@
+"""
+End-to-end latency tracing of USI commands (LATENCY_TRACE=true).
+
+For the commands that the engine answers ('usi', 'isready', 'go') one JSON object per
+line is written for each of these events, with time.monotonic() timestamps:
+
+  recv    the command was read from the client socket
+  sent    the command was written to engine stdin
+  first   the first line of engine output after it was read
+  answer  the answer ('usiok', 'readyok', 'bestmove') was forwarded to the client socket
+          ('read' is the time it was read from the engine)
+
+Records are written by a background thread into a rotating file, so the relay never
+waits for the disk. scripts/trace_summary.py turns them into percentiles per engine.
+"""
+
+import json
+import logging
+import queue
+import time
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Traced commands and the engine output that answers them
+ANSWERS = {"usi": "usiok", "isready": "readyok", "go": "bestmove"}
+
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUP_COUNT = 3
+
+_logger = logging.getLogger("engine_wrapper.trace")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+_listener = None
+
+
+def start_trace_writer(path: str):
+    global _listener
+    if _listener:
+        return
+    handler = RotatingFileHandler(path, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records = queue.SimpleQueue()
+    _logger.addHandler(QueueHandler(records))
+    _listener = QueueListener(records, handler)
+    _listener.start()
+    logging.info(f"Latency tracing enabled: {path}")
+
+
+def stop_trace_writer():
+    """Flush the pending records and close the file."""
+    global _listener
+    if not _listener:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+    _listener = None
+
+
+def trace_enabled() -> bool:
+    return _listener is not None
+
+
+class SessionTrace:
+    """
+    Trace events of one engine session. Engines answer in order, so the output is
+    attributed to the oldest command that is still waiting for its answer.
+    """
+
+    def __init__(self, session_id: str, engine_id: str, peername):
+        # Session ids are unique across worker processes and wrapper restarts
+        self.sid = session_id
+        self.engine_id = engine_id
+        self.seq = 0
+        # Commands sent to the engine and not answered yet: dicts of seq, cmd, first (seen output), read (answer read time)
+        self.outstanding = deque(maxlen=64)
+        self.emit("start", peer=str(peername))
+
+    def emit(self, event: str, **fields):
+        record = {"t": round(time.monotonic(), 6), "sid": self.sid, "engine": self.engine_id, "ev": event, **fields}
+        _logger.info(json.dumps(record, separators=(",", ":")))
+
+    def received(self, command: str) -> int | None:
+        """Returns the sequence number of a traced command, None for the others."""
+        name = command.split(maxsplit=1)[0] if command else ""
+        if name not in ANSWERS:
+            return None
+        self.seq += 1
+        self.emit("recv", seq=self.seq, cmd=name)
+        return self.seq
+
+    def sent(self, seq: int, command: str):
+        name = command.split(maxsplit=1)[0]
+        self.outstanding.append({"seq": seq, "cmd": name, "first": False, "read": None})
+        self.emit("sent", seq=seq, cmd=name)
+
+    def answered(self, seq: int, command: str):
+        """The wrapper answered the command itself (e.g. from the warm-up)."""
+        self.emit("answer", seq=seq, cmd=command.split(maxsplit=1)[0], read=None)
+
+    def engine_line(self, line: str):
+        if not self.outstanding:
+            return
+        head = self.outstanding[0]
+        if not head["first"]:
+            head["first"] = True
+            self.emit("first", seq=head["seq"], cmd=head["cmd"])
+        token = line.split(maxsplit=1)[0] if line else ""
+        for entry in self.outstanding:
+            if ANSWERS[entry["cmd"]] == token and entry["read"] is None:
+                entry["read"] = time.monotonic()
+                break
+
+    def forwarded(self, line: str):
+        token = line.split(maxsplit=1)[0] if line else ""
+        for entry in self.outstanding:
+            if ANSWERS[entry["cmd"]] == token and entry["read"] is not None:
+                self.outstanding.remove(entry)
+                self.emit("answer", seq=entry["seq"], cmd=entry["cmd"], read=round(entry["read"], 6))
+                return
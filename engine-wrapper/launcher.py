@@ -14,6 +14,7 @@ from pystray import MenuItem
 
 from common import (
     BASE_DIR,
+    get_descendant_pids,
     get_local_ip,
     get_pc_url_config,
     get_python_exe,
@@ -21,6 +22,7 @@ from common import (
     is_port_open,
     kill_proc_tree,
     load_env_value,
+    unix_listener_pid,
 )
 
 # --- Configuration ---
@@ -64,6 +66,8 @@ class LauncherApp(ctk.CTk):
         # State variables
         self.server_process = None
         self.wrapper_process = None
+        # Wrappers that handed their sessions over on a reload and still finish the ones that stayed
+        self.retiring_wrappers = []
         self.config_editor_process = None
         self.is_running = False
         self.tray_icon = None
@@ -168,6 +172,8 @@ class LauncherApp(ctk.CTk):
         """Load or reload configuration from .env files."""
         self.server_port = load_env_value(SERVER_ENV_PATH, "PORT", 8140)
         self.wrapper_port = load_env_value(WRAPPER_ENV_PATH, "LISTEN_PORT", 4082)
+        self.wrapper_workers = load_env_value(WRAPPER_ENV_PATH, "WRAPPER_WORKERS", 1)
+        self.handoff_socket = WRAPPER_DIR / load_env_value(WRAPPER_ENV_PATH, "HANDOFF_SOCKET", "engine_wrapper.handoff.sock")
 
         # LAN access configuration
         self.bind_address = load_env_value(SERVER_ENV_PATH, "BIND_ADDRESS", "0.0.0.0")
@@ -347,14 +353,7 @@ class LauncherApp(ctk.CTk):
 
         # Start Wrapper
         try:
-            if IS_BUNDLED:
-                wrapper_cmd = [str(PYTHON_EXE), str(WRAPPER_PY)]
-                # Ensure CWD is where engines.json/.env reside (engine-wrapper root)
-                cwd = WRAPPER_DIR
-            else:
-                wrapper_cmd = ["uv", "run", "engine_wrapper.py"]
-                cwd = WRAPPER_DIR
-
+            wrapper_cmd, cwd = self._wrapper_command()
             wrapper_log.write(f"Executing Wrapper: {wrapper_cmd}\nCWD: {cwd}\n")
             wrapper_log.flush()
 
@@ -430,6 +429,62 @@ class LauncherApp(ctk.CTk):
             self.after(0, lambda: self.status_indicator.configure(text="● Error", text_color="#f44336"))
             self.update_status(False)
 
+    def _wrapper_command(self, *args):
+        if IS_BUNDLED:
+            wrapper_cmd = [str(PYTHON_EXE), str(WRAPPER_PY), *args]
+        else:
+            wrapper_cmd = ["uv", "run", "engine_wrapper.py", *args]
+        # Ensure CWD is where engines.json/.env reside (engine-wrapper root)
+        return wrapper_cmd, WRAPPER_DIR
+
+    def can_reload_wrapper(self):
+        # Worker processes (WRAPPER_WORKERS > 1) share the port with SO_REUSEPORT and cannot be handed over
+        return sys.platform == "linux" and self.wrapper_workers <= 1
+
+    def reload_wrapper(self):
+        # Zero-downtime restart: the new wrapper takes the port and the live engine sessions over (Linux only)
+        if not self.is_running or not self.can_reload_wrapper():
+            return
+
+        def _reload():
+            old_process = self.wrapper_process
+            wrapper_cmd, cwd = self._wrapper_command("--takeover")
+            try:
+                with open(BASE_DIR / "logs" / "wrapper.log", "a", encoding="utf-8") as wrapper_log:
+                    wrapper_log.write(f"--- {time.ctime()} Reloading Wrapper ---\nExecuting Wrapper: {wrapper_cmd}\n")
+                    wrapper_log.flush()
+                    new_process = subprocess.Popen(wrapper_cmd, cwd=str(cwd), stdout=wrapper_log, stderr=wrapper_log)
+            except Exception as e:
+                print(f"Failed to reload wrapper: {e}")
+                return
+            if not self._wait_for_takeover(new_process):
+                # The old wrapper keeps serving
+                print(f"Wrapper reload failed (exit code {new_process.poll()}).")
+                if new_process.poll() is None:
+                    self._stop_wrapper(new_process)
+                return
+            self.wrapper_process = new_process
+            # The old wrapper exits by itself once its remaining sessions have finished
+            if old_process:
+                self.retiring_wrappers.append(old_process)
+                old_process.wait()
+                self.retiring_wrappers.remove(old_process)
+
+        threading.Thread(target=_reload, daemon=True).start()
+
+    def _wait_for_takeover(self, new_process, timeout=60):
+        """Wait until the new wrapper has taken over, which it shows by listening for the next takeover itself."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if new_process.poll() is not None:
+                return False
+            # 'uv run' starts the wrapper as a child process
+            pid = unix_listener_pid(self.handoff_socket)
+            if pid and (pid == new_process.pid or pid in get_descendant_pids(new_process.pid)):
+                return True
+            time.sleep(0.5)
+        return False
+
     def stop_services(self):
         self.after(0, lambda: self.status_indicator.configure(text="Stopping...", text_color="#f44336"))
 
@@ -437,8 +492,10 @@ class LauncherApp(ctk.CTk):
             self._kill_proc_tree(self.server_process)
             self.server_process = None
         if self.wrapper_process:
-            self._kill_proc_tree(self.wrapper_process)
+            self._stop_wrapper(self.wrapper_process)
             self.wrapper_process = None
+        for process in list(self.retiring_wrappers):
+            self._stop_wrapper(process)
         if self.config_editor_process:
             self._kill_proc_tree(self.config_editor_process)
             self.config_editor_process = None
@@ -576,6 +633,18 @@ class LauncherApp(ctk.CTk):
         # This prevents the icon from lingering in the Windows taskbar until hovered.
         self.after(200, self.quit)
 
+    def _stop_wrapper(self, proc):
+        # Let the wrapper stop all engines in parallel on SIGTERM before killing it.
+        # (Windows has no equivalent signal for a process without a console, so it is killed directly.)
+        if os.name != "nt":
+            timeout = load_env_value(WRAPPER_ENV_PATH, "SHUTDOWN_TIMEOUT", 5) + 2
+            try:
+                proc.terminate()
+                proc.wait(timeout=timeout)
+            except Exception:
+                pass
+        self._kill_proc_tree(proc)
+
     def _kill_proc_tree(self, proc):
         # Force kill using common utility
         kill_proc_tree(proc.pid)
@@ -593,6 +662,7 @@ def setup_tray(app):
         MenuItem("Open ShogiHome", lambda: app.open_browser()),
         MenuItem("Dashboard", lambda: app.show_window(), default=True),
         MenuItem("Settings", lambda: app.open_settings()),
+        MenuItem("Reload Engine Wrapper", lambda: app.reload_wrapper(), visible=lambda item: app.can_reload_wrapper()),
         pystray.Menu.SEPARATOR,
         MenuItem("Exit", lambda: app.quit_app()),
     )
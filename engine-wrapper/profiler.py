@@ -0,0 +1,109 @@
+"""
+On-demand profiling of the running wrapper ('profile' admin command).
+
+  cprofile  deterministic profile of the event loop thread, saved as .pstats
+            (python -m pstats, snakeviz)
+  sample    stacks of the event loop thread sampled from a background thread, saved as
+            collapsed stacks (flamegraph.pl, speedscope). Lower overhead, also shows idle time.
+
+Everything in the wrapper runs on the event loop thread, so profiling that thread for a
+while covers all sessions without restarting anything.
+"""
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+
+PROFILE_MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL = 0.005
+REPORT_LINES = 40
+
+_running = False
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+async def run_profile(mode: str, seconds: float, path_stem: str) -> tuple[str, str]:
+    """Profile the calling event loop thread for `seconds`. Returns (profile file path, text summary)."""
+    global _running
+    if _running:
+        raise ProfilerBusyError("A profile is already running")
+    _running = True
+    try:
+        if mode == "sample":
+            return await _sample(seconds, path_stem + ".collapsed")
+        return await _cprofile(seconds, path_stem + ".pstats")
+    finally:
+        _running = False
+
+
+async def _cprofile(seconds: float, path: str) -> tuple[str, str]:
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    profiler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(REPORT_LINES)
+    return path, summary.getvalue()
+
+
+async def _sample(seconds: float, path: str) -> tuple[str, str]:
+    thread_id = threading.get_ident()
+    stacks = Counter()
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                names.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if names:
+                stacks[";".join(reversed(names))] += 1
+
+    sampler = threading.Thread(target=sample, name="profile-sampler", daemon=True)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        done.set()
+        await asyncio.to_thread(sampler.join)
+
+    def write():
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    await asyncio.to_thread(write)
+
+    # Leaf functions by share of samples
+    total = sum(stacks.values())
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    lines = [f"{total} samples every {SAMPLE_INTERVAL * 1000:g} ms", "leaf functions:"]
+    lines += [f"  {count * 100 / total:5.1f}%  {name}" for name, count in leaves.most_common(REPORT_LINES)] if total else []
+    return path, "\n".join(lines) + "\n"
+
+
+def format_tasks() -> str:
+    """Stacks of all asyncio tasks of the running loop."""
+    out = io.StringIO()
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    out.write(f"{len(tasks)} asyncio tasks\n")
+    for task in tasks:
+        coro = task.get_coro()
+        out.write(f"\n{task.get_name()}: {getattr(coro, '__qualname__', coro)}\n")
+        task.print_stack(limit=8, file=out)
+    return out.getvalue()
@@ -0,0 +1,416 @@
+"""
+Experimental root-move splitting ('run-split <id> [N]').
+
+One client session is served by N processes of the same engine. On 'go', the
+root moves are partitioned with 'go ... searchmoves' across the processes and
+their 'info' streams are merged back into a single MultiPV view, so that the
+client sees one engine.
+"""
+
+import asyncio
+import logging
+
+from time_margin import CLIENT_RTT_COMMAND
+from usi_parser import info_frame
+
+# MultiPV used for the depth-1 probe that enumerates the root moves (shogi has at most 593 legal moves)
+ROOT_PROBE_MULTIPV = 600
+# Seconds for the probe, and for its 'bestmove' after a 'stop' when it did not finish in time
+ROOT_PROBE_TIMEOUT = 10.0
+ROOT_PROBE_STOP_TIMEOUT = 5.0
+
+# Sort keys for mate scores (always outrank centipawn scores)
+MATE_SCORE = 100000
+
+
+def split_engine_options(options: dict, count: int) -> dict:
+    """Divide Threads/USI_Hash between the processes so that the total matches the configuration."""
+    options = dict(options or {})
+    for name in ("Threads", "USI_Hash"):
+        if name in options:
+            try:
+                options[name] = max(1, int(options[name]) // count)
+            except (TypeError, ValueError):
+                pass
+    return options
+
+
+def score_key(tokens: list) -> float | None:
+    """Return a comparable key for the 'score' of a tokenized info line (higher is better)."""
+    try:
+        i = tokens.index("score")
+        kind, value = tokens[i + 1], tokens[i + 2]
+    except (ValueError, IndexError):
+        return None
+    if kind == "cp":
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    if kind == "mate":
+        if value in ("+", "-"):
+            return MATE_SCORE - 1 if value == "+" else -MATE_SCORE + 1
+        try:
+            plies = int(value)
+        except ValueError:
+            return None
+        return MATE_SCORE - plies if plies >= 0 else -MATE_SCORE - plies
+    return None
+
+
+def token_value(tokens: list, name: str) -> str | None:
+    try:
+        return tokens[tokens.index(name) + 1]
+    except (ValueError, IndexError):
+        return None
+
+
+def replace_token_value(tokens: list, name: str, value: str) -> list:
+    tokens = list(tokens)
+    try:
+        i = tokens.index(name)
+    except ValueError:
+        return tokens
+    if i + 1 < len(tokens):
+        tokens[i + 1] = value
+    return tokens
+
+
+def partition_moves(moves: list, count: int) -> list:
+    """Round-robin partition so that each process gets a mix of good and bad moves (moves are ordered best first)."""
+    return [moves[i::count] for i in range(count)]
+
+
+class RootSplitSession:
+    """Relays one client session to several engine processes that share the root moves."""
+
+    def __init__(
+        self,
+        processes: list,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter,
+        apply_options,
+        output_format: str = "usi",
+    ):
+        self.processes = processes
+        self.client_reader = client_reader
+        self.client_writer = client_writer
+        # Coroutine function (stdin, index) -> None that applies the configured options to one process
+        self.apply_options = apply_options
+        self.options_applied = False
+        # 'json': 'info' lines are sent as JSON frames (see usi_parser.py)
+        self.output_format = output_format
+        self.client_multipv = 1
+        # Relay counters (same meaning as for single-engine sessions)
+        self.commands = 0
+        self.bytes_to_engine = 0
+        self.bytes_to_client = 0
+
+        self.pending_readyok = 0
+        # Current search
+        self.searching = [False] * len(processes)
+        self.bestmoves = {}
+        self.root_infos = {}
+        self.worker_nodes = [0] * len(processes)
+        self.worker_nps = [0] * len(processes)
+        self.last_ranking = []
+        # Root move probe (depth 1, high MultiPV on process 0)
+        self.probe_moves = None
+        self.probe_done = None
+        # True while the probe's 'go depth 1' runs on process 0
+        self.probe_searching = False
+        # Task of the 'go' being started (probe, then the split search), so that the client loop keeps reading
+        self.search_start = None
+        # 'stop' received before the split search started
+        self.stop_requested = False
+
+    async def write_client(self, line: str):
+        if self.output_format == "json" and line.startswith("info"):
+            data = info_frame(line)
+        else:
+            data = line.encode() + b"\n"
+        self.client_writer.write(data)
+        await self.client_writer.drain()
+        self.bytes_to_client += len(data)
+
+    async def write_engine(self, index: int, line: str):
+        stdin = self.processes[index].stdin
+        stdin.write(line.encode() + b"\n")
+        await stdin.drain()
+
+    async def broadcast(self, line: str):
+        for i in range(len(self.processes)):
+            await self.write_engine(i, line)
+
+    async def run(self):
+        tasks = [asyncio.create_task(self.client_loop())]
+        for i, process in enumerate(self.processes):
+            tasks.append(asyncio.create_task(self.engine_loop(i, process.stdout)))
+            tasks.append(asyncio.create_task(self.stderr_loop(i, process.stderr)))
+            tasks.append(asyncio.create_task(process.wait()))
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if self.search_start:
+                tasks.append(self.search_start)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def client_loop(self):
+        try:
+            while True:
+                line_bytes = await self.client_reader.readline()
+                if not line_bytes:
+                    break
+                command = line_bytes.decode().strip()
+                if not command or command.split(maxsplit=1)[0] == CLIENT_RTT_COMMAND:
+                    # Browser RTT reported by server.ts: the split session has no time margin to feed
+                    continue
+                self.commands += 1
+                self.bytes_to_engine += len(line_bytes)
+                logging.info(f"[Client -> Split] {command}")
+                await self.handle_command(command)
+        except Exception as e:
+            logging.debug(f"Client to split engines pipe closed: {e}")
+
+    async def handle_command(self, command: str):
+        tokens = command.split()
+        name = tokens[0]
+        if self.search_start and not self.search_start.done():
+            if name == "stop":
+                await self.stop_before_search()
+                return
+            if name == "quit":
+                self.search_start.cancel()
+                await asyncio.wait([self.search_start])
+            elif name != "isready":
+                # Anything else (ponderhit, the next position, ...) applies after the search has started
+                await asyncio.wait([self.search_start])
+        if name == "isready":
+            if not self.options_applied:
+                for i, process in enumerate(self.processes):
+                    await self.apply_options(process.stdin, i)
+                self.options_applied = True
+            self.pending_readyok = len(self.processes)
+            await self.broadcast(command)
+        elif name == "setoption":
+            option = token_value(tokens, "name")
+            if option == "MultiPV":
+                try:
+                    self.client_multipv = max(1, int(token_value(tokens, "value")))
+                except (TypeError, ValueError):
+                    pass
+            elif option in ("Threads", "USI_Hash"):
+                # Divided like the configured options, so that N processes do not use N times the threads/memory
+                value = split_engine_options({option: token_value(tokens, "value")}, len(self.processes))[option]
+                command = f"setoption name {option} value {value}"
+            await self.broadcast(command)
+        elif name == "go":
+            # The root move probe can take up to ROOT_PROBE_TIMEOUT: run it as a task so that 'stop'/'quit' are read meanwhile
+            self.search_start = asyncio.create_task(self.run_search_start(tokens))
+        elif name == "stop":
+            for i, searching in enumerate(self.searching):
+                if searching:
+                    await self.write_engine(i, command)
+        else:
+            await self.broadcast(command)
+
+    async def run_search_start(self, tokens: list):
+        try:
+            await self.start_search(tokens)
+        except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError) as e:
+            logging.debug(f"Split engines pipe closed while starting the search: {e}")
+        except Exception as e:
+            logging.error(f"Failed to start the split search: {e}", exc_info=True)
+
+    async def stop_before_search(self):
+        """'stop' during the root move probe: end the probe and answer with its best move instead of searching."""
+        logging.info("'stop' received during the root move probe.")
+        self.stop_requested = True
+        if self.probe_searching:
+            await self.write_engine(0, "stop")
+
+    async def start_search(self, tokens: list):
+        self.stop_requested = False
+        go_args = tokens[1:]
+        moves = None
+        if "searchmoves" in go_args:
+            i = go_args.index("searchmoves")
+            moves = go_args[i + 1 :]
+            go_args = go_args[:i]
+        if moves is None:
+            moves = await self.probe_root_moves()
+
+        self.bestmoves = {}
+        self.root_infos = {}
+        self.worker_nodes = [0] * len(self.processes)
+        self.worker_nps = [0] * len(self.processes)
+        self.last_ranking = []
+
+        if self.stop_requested:
+            self.searching = [False] * len(self.processes)
+            await self.write_client(f"bestmove {moves[0] if moves else 'resign'}")
+            return
+
+        if len(moves) <= 1:
+            # Nothing to split (or the probe failed): search on the first process only
+            self.searching = [i == 0 for i in range(len(self.processes))]
+            suffix = f" searchmoves {moves[0]}" if moves else ""
+            await self.write_engine(0, " ".join(["go", *go_args]) + suffix)
+            return
+
+        parts = partition_moves(moves, len(self.processes))
+        self.searching = [bool(part) for part in parts]
+        for i, part in enumerate(parts):
+            if part:
+                await self.write_engine(i, " ".join(["go", *go_args, "searchmoves", *part]))
+
+    async def probe_root_moves(self) -> list:
+        """Enumerate the root moves with a depth-1 MultiPV search on process 0, best first."""
+        loop = asyncio.get_running_loop()
+        self.probe_moves = {}
+        done = self.probe_done = loop.create_future()
+        try:
+            await self.write_engine(0, f"setoption name MultiPV value {ROOT_PROBE_MULTIPV}")
+            await self.write_engine(0, "go depth 1")
+            self.probe_searching = True
+            if self.stop_requested:
+                await self.write_engine(0, "stop")
+            await asyncio.wait_for(asyncio.shield(done), timeout=ROOT_PROBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Stop the probe and drain its output up to its 'bestmove', so that it does not leak into the search
+            logging.warning("Root move probe timed out. Stopping it.")
+            await self.write_engine(0, "stop")
+            try:
+                await asyncio.wait_for(asyncio.shield(done), timeout=ROOT_PROBE_STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logging.warning("Root move probe did not stop. Its output is dropped until its 'bestmove'.")
+        finally:
+            self.probe_searching = False
+            await self.write_engine(0, f"setoption name MultiPV value {self.client_multipv}")
+            moves = sorted(self.probe_moves, key=lambda m: self.probe_moves[m], reverse=True)
+            self.probe_moves = None
+            # Cleared by handle_engine_line() at the probe's 'bestmove' if that has not come yet
+            if done.done():
+                self.probe_done = None
+        logging.info(f"Root move probe found {len(moves)} moves.")
+        return moves
+
+    async def engine_loop(self, index: int, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line_bytes = await reader.readline()
+                if not line_bytes:
+                    break
+                line = line_bytes.decode(errors="ignore").strip()
+                if line:
+                    await self.handle_engine_line(index, line)
+        except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError, ConnectionAbortedError):
+            pass
+        except Exception as e:
+            logging.error(f"Unexpected error in split engine #{index}: {e}", exc_info=True)
+
+    async def stderr_loop(self, index: int, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line_bytes = await reader.readline()
+                if not line_bytes:
+                    break
+                logging.info(f"[Split #{index} ERROR] {line_bytes.decode(errors='ignore').strip()}")
+        except (ConnectionResetError, BrokenPipeError, asyncio.CancelledError, ConnectionAbortedError):
+            pass
+
+    async def handle_engine_line(self, index: int, line: str):
+        tokens = line.split()
+        name = tokens[0]
+
+        if index == 0 and self.probe_done is not None and name in ("info", "bestmove"):
+            # Search output belonging to the root move probe is never relayed
+            if name == "info" and "pv" in tokens and self.probe_moves is not None:
+                move = token_value(tokens, "pv")
+                key = score_key(tokens)
+                if move and move not in ("resign", "win"):
+                    self.probe_moves[move] = key if key is not None else 0.0
+            elif name == "bestmove":
+                if not self.probe_done.done():
+                    self.probe_done.set_result(None)
+                if self.probe_moves is None:
+                    # The probe gave up waiting for this 'bestmove'
+                    self.probe_done = None
+            return
+
+        if name == "info":
+            logging.debug(f"[Split #{index} -> Client] {line}")
+            await self.handle_info(index, tokens, line)
+        elif name == "bestmove":
+            logging.info(f"[Split #{index}] {line}")
+            await self.handle_bestmove(index, tokens)
+        elif name == "readyok":
+            self.pending_readyok -= 1
+            if self.pending_readyok <= 0:
+                await self.write_client("readyok")
+        elif index == 0:
+            # id / option / usiok and anything else come from the first process only
+            logging.info(f"[Split #0 -> Client] {line}")
+            await self.write_client(line)
+
+    async def handle_info(self, index: int, tokens: list, line: str):
+        if "string" in tokens:
+            await self.write_client(line)
+            return
+
+        nodes = token_value(tokens, "nodes")
+        if nodes and nodes.isdigit():
+            self.worker_nodes[index] = int(nodes)
+        nps = token_value(tokens, "nps")
+        if nps and nps.isdigit():
+            self.worker_nps[index] = int(nps)
+
+        move = token_value(tokens, "pv")
+        key = score_key(tokens)
+        if not move or key is None:
+            return
+        self.root_infos[move] = (key, tokens)
+        await self.emit_merged_view(move)
+
+    def ranking(self) -> list:
+        return sorted(self.root_infos, key=lambda m: self.root_infos[m][0], reverse=True)[: self.client_multipv]
+
+    def merged_line(self, move: str, rank: int) -> str:
+        tokens = self.root_infos[move][1]
+        tokens = replace_token_value(tokens, "nodes", str(sum(self.worker_nodes)))
+        tokens = replace_token_value(tokens, "nps", str(sum(self.worker_nps)))
+        if "multipv" in tokens:
+            tokens = replace_token_value(tokens, "multipv", str(rank))
+        elif self.client_multipv > 1:
+            tokens = tokens[:1] + ["multipv", str(rank)] + tokens[1:]
+        return " ".join(tokens)
+
+    async def emit_merged_view(self, updated_move: str):
+        ranking = self.ranking()
+        if ranking != self.last_ranking:
+            # Membership or order changed: resend the whole view so that no stale line survives in the client
+            for rank, move in enumerate(ranking, start=1):
+                await self.write_client(self.merged_line(move, rank))
+        elif updated_move in ranking:
+            await self.write_client(self.merged_line(updated_move, ranking.index(updated_move) + 1))
+        self.last_ranking = ranking
+
+    async def handle_bestmove(self, index: int, tokens: list):
+        if not self.searching[index]:
+            return
+        self.searching[index] = False
+        self.bestmoves[index] = tokens
+        if any(self.searching):
+            return
+
+        ranking = sorted(self.root_infos, key=lambda m: self.root_infos[m][0], reverse=True)
+        if ranking:
+            pv = self.root_infos[ranking[0]][1]
+            pv = pv[pv.index("pv") + 1 :]
+            line = f"bestmove {pv[0]}" + (f" ponder {pv[1]}" if len(pv) > 1 else "")
+        else:
+            line = " ".join(self.bestmoves[min(self.bestmoves)])
+        logging.info(f"[Split -> Client] {line}")
+        await self.write_client(line)
@@ -0,0 +1,94 @@
+"""
+Compression benchmark for the wrapper-to-client stream ('run <id> compress=zlib').
+
+Compresses a stream of engine output with the same LineCompressor as the wrapper and
+prints, for each zlib level and flush batch size, the bytes saved and the CPU time spent
+on the wrapper (compress) and on the client (decompress).
+
+'lines/flush' is the number of lines collected before a sync flush: 1 corresponds to
+COMPRESS_FLUSH_MS=0, larger values to the lines an engine writes within COMPRESS_FLUSH_MS.
+
+Usage: uv run python scripts/bench_compression.py [--input engine_output.txt] [--lines 20000]
+                                                  [--levels 1 6 9] [--lines-per-flush 1 5 20]
+       (default input: MultiPV output generated like scripts/fake_engine.py)
+"""
+
+import argparse
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from compression import LineCompressor  # noqa: E402
+
+PV = "7g7f 3c3d 2g2f 8c8d 2f2e 8d8e 6i7h 4a3b 2e2d 2c2d 2h2d 8e8f 8g8f 8b8f 2d3d 2b3c"
+
+
+def generated_lines(count: int) -> list:
+    return [
+        f"info depth {i // 5 + 1} seldepth {i // 5 + 5} score cp {30 + i % 50} multipv {i % 5 + 1} "
+        f"nodes {i * 10000} nps 1500000 hashfull {i % 1000} time {i} pv {PV}\n".encode()
+        for i in range(count)
+    ]
+
+
+def bench(lines: list, level: int, lines_per_flush: int) -> dict:
+    compressor = LineCompressor(level)
+    chunks = []
+    started = time.process_time()
+    for i, line in enumerate(lines, start=1):
+        chunk = compressor.compress(line)
+        if i % lines_per_flush == 0 or i == len(lines):
+            chunk += compressor.flush()
+        if chunk:
+            chunks.append(chunk)
+    compress_cpu = time.process_time() - started
+
+    decompressor = zlib.decompressobj()
+    started = time.process_time()
+    restored = b"".join(decompressor.decompress(chunk) for chunk in chunks)
+    decompress_cpu = time.process_time() - started
+    assert restored == b"".join(lines)
+
+    raw = sum(len(line) for line in lines)
+    compressed = sum(len(chunk) for chunk in chunks)
+    return {
+        "raw": raw,
+        "compressed": compressed,
+        "compress_us": compress_cpu * 1e6 / len(lines),
+        "decompress_us": decompress_cpu * 1e6 / len(lines),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=Path, help="engine output, one USI line per line")
+    parser.add_argument("--lines", type=int, default=20000, help="number of generated lines")
+    parser.add_argument("--levels", nargs="+", type=int, default=[1, 6, 9])
+    parser.add_argument("--lines-per-flush", nargs="+", type=int, default=[1, 5, 20])
+    args = parser.parse_args()
+
+    if args.input:
+        lines = [line if line.endswith(b"\n") else line + b"\n" for line in args.input.read_bytes().splitlines(keepends=True)]
+    else:
+        lines = generated_lines(args.lines)
+    if not lines:
+        print("No input lines.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{len(lines)} lines, {sum(len(line) for line in lines):,} bytes")
+    print(f"{'level':>5}{'lines/flush':>13}{'bytes':>13}{'saved':>8}{'compress':>14}{'decompress':>14}")
+    for level in args.levels:
+        for lines_per_flush in args.lines_per_flush:
+            result = bench(lines, level, max(1, lines_per_flush))
+            saved = 1 - result["compressed"] / result["raw"]
+            print(
+                f"{level:>5}{lines_per_flush:>13}{result['compressed']:>13,}{saved:>8.1%}"
+                f"{result['compress_us']:>9.2f} us/l{result['decompress_us']:>9.2f} us/l"
+            )
+
+
+if __name__ == "__main__":
+    main()
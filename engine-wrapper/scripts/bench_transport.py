@@ -0,0 +1,136 @@
+"""
+Relay benchmark for the engine wrapper.
+
+Starts engine_wrapper.py in a child process with scripts/fake_engine.py registered as
+the only engine, then measures through each transport:
+  - round trip latency of 'isready' -> 'readyok'
+  - 'info' flood throughput of 'go' -> 'bestmove'
+
+Usage: uv run python scripts/bench_transport.py [--transport tcp unix] [--loop asyncio uvloop] [--zero-copy]
+                                                [--rounds 2000] [--info-lines 20000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+WRAPPER_DIR = Path(__file__).resolve().parents[1]
+FAKE_ENGINE = Path(__file__).resolve().parent / "fake_engine.py"
+BENCH_PORT = 14083
+
+# Runs the wrapper with engines.json taken from the temporary directory
+WRAPPER_BOOTSTRAP = """
+import asyncio, sys
+from pathlib import Path
+sys.path.insert(0, sys.argv[1])
+import engine_wrapper
+engine_wrapper.BASE_DIR = Path(sys.argv[2])
+engine_wrapper.run(engine_wrapper.main())
+"""
+
+
+def start_wrapper(work_dir: Path, env: dict) -> subprocess.Popen:
+    (work_dir / "engines.json").write_text(json.dumps([{"id": "fake", "name": "FakeEngine", "path": str(FAKE_ENGINE)}]), encoding="utf-8")
+    return subprocess.Popen(
+        [sys.executable, "-c", WRAPPER_BOOTSTRAP, str(WRAPPER_DIR), str(work_dir)],
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def connect(transport: str, socket_path: str):
+    for _ in range(50):
+        try:
+            if transport == "unix":
+                return await asyncio.open_unix_connection(socket_path)
+            return await asyncio.open_connection("127.0.0.1", BENCH_PORT)
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Could not connect to the wrapper over {transport}")
+
+
+async def read_until(reader: asyncio.StreamReader, token: bytes) -> int:
+    count = 0
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise RuntimeError("Wrapper closed the connection")
+        count += 1
+        if line.startswith(token):
+            return count
+
+
+async def bench(transport: str, socket_path: str, rounds: int, info_lines: int) -> dict:
+    reader, writer = await connect(transport, socket_path)
+    writer.write(b"run fake\nusi\n")
+    await writer.drain()
+    await read_until(reader, b"usiok")
+
+    latencies = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        writer.write(b"isready\n")
+        await writer.drain()
+        await read_until(reader, b"readyok")
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    writer.write(b"position startpos\ngo\n")
+    await writer.drain()
+    lines = await read_until(reader, b"bestmove")
+    elapsed = time.perf_counter() - started
+
+    writer.write(b"quit\n")
+    writer.close()
+    latencies.sort()
+    return {
+        "transport": transport,
+        "rtt_p50_ms": statistics.median(latencies),
+        "rtt_p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "info_lines_per_sec": lines / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", nargs="+", default=["tcp", "unix"], choices=["tcp", "unix"])
+    parser.add_argument("--loop", nargs="+", default=["asyncio"], choices=["asyncio", "uvloop"], help="wrapper event loop(s)")
+    parser.add_argument("--zero-copy", action="store_true", help="enable the splice() relay (ZERO_COPY_RELAY)")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--info-lines", type=int, default=20000)
+    args = parser.parse_args()
+
+    for loop in args.loop:
+        with tempfile.TemporaryDirectory() as tmp:
+            work_dir = Path(tmp)
+            socket_path = str(work_dir / "wrapper.sock")
+            env = {
+                "LISTEN_PORT": str(BENCH_PORT),
+                "LISTEN_UNIX": socket_path,
+                "WRAPPER_EVENT_LOOP": loop,
+                "ZERO_COPY_RELAY": "true" if args.zero_copy else "false",
+                "FAKE_ENGINE_INFO_LINES": str(args.info_lines),
+            }
+            wrapper = start_wrapper(work_dir, env)
+            try:
+                for transport in args.transport:
+                    result = asyncio.run(bench(transport, socket_path, args.rounds, args.info_lines))
+                    print(
+                        f"{loop:>7} {result['transport']:>4}: isready RTT p50 {result['rtt_p50_ms']:.3f} ms, "
+                        f"p99 {result['rtt_p99_ms']:.3f} ms, info {result['info_lines_per_sec']:,.0f} lines/s"
+                    )
+            finally:
+                wrapper.terminate()
+                wrapper.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Minimal USI engine for benchmarks.
+
+'go' emits FAKE_ENGINE_INFO_LINES 'info' lines (MultiPV-like, long PVs) as fast as
+possible, flushed in batches, and then 'bestmove'. 'go infinite' keeps searching until 'stop'.
+"""
+
+import os
+import sys
+import threading
+
+INFO_LINES = int(os.getenv("FAKE_ENGINE_INFO_LINES", "1000"))
+PV = "7g7f 3c3d 2g2f 8c8d 2f2e 8d8e 6i7h 4a3b 2e2d 2c2d 2h2d 8e8f 8g8f 8b8f 2d3d 2b3c"
+
+stop_event = threading.Event()
+
+
+def out(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def search(infinite):
+    # Flush in batches so that the engine side is not the bottleneck of the benchmark
+    batch = []
+    for i in range(INFO_LINES):
+        if stop_event.is_set():
+            break
+        depth = i // 5 + 1
+        batch.append(
+            f"info depth {depth} seldepth {depth + 4} score cp {30 + i % 50} multipv {i % 5 + 1} "
+            f"nodes {i * 10000} nps 1500000 hashfull {i % 1000} time {i} pv {PV}\n"
+        )
+        if len(batch) >= 100:
+            sys.stdout.write("".join(batch))
+            sys.stdout.flush()
+            batch = []
+    sys.stdout.write("".join(batch))
+    while infinite and not stop_event.wait(0.01):
+        pass
+    out("bestmove 7g7f ponder 3c3d")
+
+
+def main():
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        if tokens[0] == "usi":
+            out("id name FakeEngine")
+            out("id author ShogiHome LAN")
+            out("usiok")
+        elif tokens[0] == "isready":
+            out("readyok")
+        elif tokens[0] == "go":
+            stop_event.clear()
+            threading.Thread(target=search, args=("infinite" in tokens,), daemon=True).start()
+        elif tokens[0] == "stop":
+            stop_event.set()
+        elif tokens[0] == "quit":
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+USI engine that plays the engine side of a session transcript (see transcript.py).
+
+Each recorded engine line belongs to the last client command recorded before it. When
+the engine receives its n-th command, it writes the lines of the n-th recorded command
+with their recorded delays (divided by REPLAY_SPEED). The remaining lines of a command
+are written at once when the next command arrives, so the order of the recording is kept.
+
+Configured through the environment because engines.json has no arguments:
+  REPLAY_TRANSCRIPT  path of the transcript
+  REPLAY_SPEED       1 = real time, 10 = ten times faster, 0 = no delays
+"""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from transcript import CLIENT, read_transcript  # noqa: E402
+
+SPEED = float(os.getenv("REPLAY_SPEED", "1"))
+
+received = []
+arrived = threading.Condition()
+
+
+def out(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def recorded_groups(entries: list) -> tuple[list, list]:
+    """Recorded client commands and, for each, the (delay ms, line) of the engine output that followed it."""
+    commands = []
+    groups = []
+    # Output recorded before the first command (none in practice) is written at start
+    pending = []
+    for ms, direction, line in entries:
+        if direction == CLIENT:
+            commands.append((ms, line))
+            groups.append([])
+        elif groups:
+            groups[-1].append((ms - commands[-1][0], line))
+        else:
+            pending.append((0, line))
+    return commands, [pending, *groups]
+
+
+def play(commands: list, groups: list):
+    for _, line in groups[0]:
+        out(line)
+    for n, lines in enumerate(groups[1:]):
+        with arrived:
+            arrived.wait_for(lambda n=n: len(received) > n)
+            base = received[n]
+        for delay, line in lines:
+            due = base + delay / 1000 / SPEED if SPEED > 0 else base
+            with arrived:
+                # Wake up early when the next command arrives
+                arrived.wait_for(lambda n=n: len(received) > n + 1, timeout=max(0.0, due - time.monotonic()))
+            out(line)
+
+
+def main():
+    _, entries = read_transcript(os.environ["REPLAY_TRANSCRIPT"])
+    commands, groups = recorded_groups(entries)
+    threading.Thread(target=play, args=(commands, groups), daemon=True).start()
+    for line in sys.stdin:
+        command = line.strip()
+        with arrived:
+            n = len(received)
+            received.append(time.monotonic())
+            arrived.notify_all()
+        if n < len(commands) and command.split()[:1] != commands[n][1].split()[:1]:
+            print(f"Command {n + 1} is '{command}', recorded '{commands[n][1]}'", file=sys.stderr, flush=True)
+        if command == "quit":
+            break
+
+
+if __name__ == "__main__":
+    main()
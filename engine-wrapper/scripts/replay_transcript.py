@@ -0,0 +1,175 @@
+"""
+Replays a session transcript (SESSION_TRANSCRIPTS=true) against the engine wrapper.
+
+Starts engine_wrapper.py in a child process with scripts/replay_engine.py registered as
+the only engine, sends the recorded client commands at their recorded times (divided by
+--speed), each after the engine output recorded before it, and compares what comes back with the recording:
+  - whether the engine lines arrived complete and in order
+  - latency from the last command to each answer ('usiok', 'readyok', 'bestmove'),
+    recorded vs replayed
+
+Wrapper settings such as WRAPPER_EVENT_LOOP or COMPRESS_* are taken from the environment,
+so the same transcript can be used to compare them.
+
+Usage: uv run python scripts/replay_transcript.py transcripts/<file>.usi.gz [--speed 1] [--repeat 1]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+WRAPPER_DIR = Path(__file__).resolve().parents[1]
+REPLAY_ENGINE = Path(__file__).resolve().parent / "replay_engine.py"
+REPLAY_PORT = 14084
+ANSWERS = ("usiok", "readyok", "bestmove")
+
+sys.path.insert(0, str(WRAPPER_DIR))
+
+from transcript import CLIENT, ENGINE, read_transcript  # noqa: E402
+
+# Runs the wrapper with engines.json taken from the temporary directory
+WRAPPER_BOOTSTRAP = """
+import asyncio, sys
+from pathlib import Path
+sys.path.insert(0, sys.argv[1])
+import engine_wrapper
+engine_wrapper.BASE_DIR = Path(sys.argv[2])
+engine_wrapper.run(engine_wrapper.main())
+"""
+
+
+def start_wrapper(work_dir: Path, env: dict) -> subprocess.Popen:
+    (work_dir / "engines.json").write_text(json.dumps([{"id": "replay", "name": "Replay", "path": str(REPLAY_ENGINE)}]), encoding="utf-8")
+    return subprocess.Popen(
+        [sys.executable, "-c", WRAPPER_BOOTSTRAP, str(WRAPPER_DIR), str(work_dir)],
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def connect():
+    for _ in range(50):
+        try:
+            return await asyncio.open_connection("127.0.0.1", REPLAY_PORT)
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("Could not connect to the wrapper")
+
+
+def answer_latencies(events: list) -> dict:
+    """Milliseconds from the last command to each answer, by answer. events: (ms, direction, line)."""
+    latencies = {answer: [] for answer in ANSWERS}
+    last_command = None
+    for ms, direction, line in events:
+        if direction == CLIENT:
+            last_command = ms
+            continue
+        token = line.split(maxsplit=1)[0] if line else ""
+        if token in latencies and last_command is not None:
+            latencies[token].append(ms - last_command)
+    return latencies
+
+
+async def replay(entries: list, speed: float) -> list:
+    """Returns the events seen by the client, in the transcript's format."""
+    reader, writer = await connect()
+    events = []
+    started = time.monotonic()
+
+    def now_ms() -> float:
+        return (time.monotonic() - started) * 1000
+
+    received = 0
+    arrived = asyncio.Event()
+
+    async def receive():
+        nonlocal received
+        while line := await reader.readline():
+            events.append((now_ms(), ENGINE, line.decode(errors="ignore").strip()))
+            received += 1
+            arrived.set()
+
+    receiver = asyncio.create_task(receive())
+    writer.write(b"run replay\n")
+    expected = 0
+    for ms, direction, line in entries:
+        if direction != CLIENT:
+            expected += 1
+            continue
+        # Keep the recorded order: a command is sent after the engine output recorded before it
+        while received < expected and not receiver.done():
+            arrived.clear()
+            try:
+                await asyncio.wait_for(arrived.wait(), 10)
+            except asyncio.TimeoutError:
+                print(f"Engine output before '{line}' did not arrive.", file=sys.stderr)
+                break
+        if speed > 0:
+            await asyncio.sleep(max(0.0, ms / speed - now_ms()) / 1000)
+        events.append((now_ms(), CLIENT, line))
+        writer.write(f"{line}\n".encode())
+        await writer.drain()
+    try:
+        await asyncio.wait_for(receiver, 10)
+    except asyncio.TimeoutError:
+        print("The wrapper did not close the connection after the last command.", file=sys.stderr)
+    writer.close()
+    return events
+
+
+def format_latencies(values: list) -> str:
+    if not values:
+        return "-"
+    return f"n={len(values)} p50 {statistics.median(values):.1f} ms max {max(values):.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("transcript", type=Path)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 10 = ten times faster, 0 = no delays")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    header, entries = read_transcript(args.transcript)
+    recorded_lines = [line for _, direction, line in entries if direction == ENGINE]
+    print(f"{args.transcript.name}: engine '{header.get('engine')}', {len(entries)} lines, {entries[-1][0] / 1000 if entries else 0:.1f} s")
+    recorded = answer_latencies(entries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            "LISTEN_PORT": str(REPLAY_PORT),
+            "REPLAY_TRANSCRIPT": str(args.transcript.resolve()),
+            "REPLAY_SPEED": str(args.speed),
+            "SESSION_TRANSCRIPTS": "false",
+        }
+        wrapper = start_wrapper(Path(tmp), env)
+        try:
+            for run in range(1, args.repeat + 1):
+                events = asyncio.run(replay(entries, args.speed))
+                lines = [line for _, direction, line in events if direction == ENGINE]
+                if lines == recorded_lines:
+                    matched = "complete and in order"
+                else:
+                    matched = f"{len(lines)} lines, recorded {len(recorded_lines)}, DIFFERENT"
+                print(f"run {run}: {events[-1][0] / 1000 if events else 0:.1f} s, engine output {matched}")
+                replayed = answer_latencies(events)
+                for answer in ANSWERS:
+                    if recorded[answer] or replayed[answer]:
+                        print(
+                            f"  {answer:>8}: recorded {format_latencies(recorded[answer])}, replayed {format_latencies(replayed[answer])}"
+                        )
+        finally:
+            wrapper.terminate()
+            wrapper.wait()
+
+
+if __name__ == "__main__":
+    main()
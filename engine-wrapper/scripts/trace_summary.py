@@ -0,0 +1,103 @@
+"""
+Summarize the latency trace written by the engine wrapper (LATENCY_TRACE=true).
+
+For each engine and command ('usi', 'isready', 'go') prints percentiles of:
+  wrapper_in   recv -> sent     client command read until written to engine stdin
+  engine_first sent -> first    until the first line of engine output
+  engine       sent -> read     until the answer was read from the engine
+  wrapper_out  read -> answer   answer read until forwarded to the client socket
+  total        recv -> answer   everything the wrapper can see (the client adds the network on top)
+
+Usage: uv run python scripts/trace_summary.py [trace files...] [--engine ID] [--command go]
+       (default: engine_wrapper.trace*.jsonl* next to engine_wrapper.py, including rotated files)
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+WRAPPER_DIR = Path(__file__).resolve().parents[1]
+STAGES = ("wrapper_in", "engine_first", "engine", "wrapper_out", "total")
+PERCENTILES = (50, 90, 99)
+
+
+def load_events(paths: list) -> list:
+    events = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line cut short by a crash or by rotation
+                    continue
+    return events
+
+
+def collect_stages(events: list) -> dict:
+    """Return {(engine, command): {stage: [milliseconds]}}."""
+    commands = defaultdict(dict)
+    for event in events:
+        if "seq" in event:
+            commands[(event["sid"], event["seq"])][event["ev"]] = event
+
+    stages = defaultdict(lambda: defaultdict(list))
+    for timeline in commands.values():
+        recv, sent, first, answer = (timeline.get(name) for name in ("recv", "sent", "first", "answer"))
+        some = recv or sent or answer
+        if not some:
+            continue
+        samples = stages[(some["engine"], some["cmd"])]
+        read = answer.get("read") if answer else None
+        for stage, start, end in (
+            ("wrapper_in", recv, sent),
+            ("engine_first", sent, first),
+            ("engine", sent, read),
+            ("wrapper_out", read, answer),
+            ("total", recv, answer),
+        ):
+            if start is None or end is None:
+                continue
+            start_t = start if isinstance(start, float) else start["t"]
+            end_t = end if isinstance(end, float) else end["t"]
+            samples[stage].append((end_t - start_t) * 1000)
+    return stages
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile."""
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--engine", help="only this engine id")
+    parser.add_argument("--command", choices=["usi", "isready", "go"], help="only this command")
+    args = parser.parse_args()
+
+    files = args.files or sorted(WRAPPER_DIR.glob("engine_wrapper.trace*.jsonl*"))
+    if not files:
+        print("No trace files found. Enable LATENCY_TRACE=true in .env first.", file=sys.stderr)
+        sys.exit(1)
+
+    stages = collect_stages(load_events(files))
+    header = f"{'stage':<13}{'n':>7}" + "".join(f"{'p' + str(p):>11}" for p in PERCENTILES) + f"{'max':>11}"
+    for (engine, command), samples in sorted(stages.items()):
+        if (args.engine and engine != args.engine) or (args.command and command != args.command):
+            continue
+        print(f"\n{engine} / {command} (ms)")
+        print(header)
+        for stage in STAGES:
+            values = sorted(samples.get(stage, []))
+            if not values:
+                continue
+            cells = "".join(f"{percentile(values, p):>11.3f}" for p in PERCENTILES)
+            print(f"{stage:<13}{len(values):>7}{cells}{values[-1]:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Hash pressure and search health from engine 'info' output (SEARCH_HEALTH=true).
+
+Each session follows the 'hashfull' (per mille) and 'nps' of its running search. At
+'bestmove' the last values become one sample of the engine's rolling profile: the last
+PROFILE_WINDOW searches per engine id, shared by all sessions of that engine. Searches
+shorter than MIN_SEARCH_MS are not sampled, since their NPS is dominated by the start-up.
+
+Two conditions are logged as warnings, at most once per WARN_INTERVAL per engine:
+
+  hash saturated  hashfull >= SATURATED_HASHFULL at the end of at least SATURATED_FRACTION
+                  of the searches: USI_Hash is too small for the searches run on it
+  NPS collapse    the median NPS of the last RECENT_SEARCHES is below NPS_DROP x the
+                  usual NPS (90th percentile of the window): thermal throttling, or more
+                  search threads than cores (Threads, concurrent sessions)
+
+The admin command 'health' returns the profiles.
+"""
+
+import time
+from collections import deque
+
+from usi_parser import parse_info
+
+PROFILE_WINDOW = 200
+MIN_SEARCH_MS = 1000
+# Samples needed before the hash warning
+MIN_SAMPLES = 20
+SATURATED_HASHFULL = 900
+SATURATED_FRACTION = 0.5
+RECENT_SEARCHES = 10
+NPS_DROP = 0.5
+WARN_INTERVAL = 600.0
+
+
+def percentile(values, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else None
+
+
+class EngineSearchProfile:
+    """Rolling hashfull/NPS profile of one engine id."""
+
+    def __init__(self):
+        self.hashfull = deque(maxlen=PROFILE_WINDOW)
+        self.nps = deque(maxlen=PROFILE_WINDOW)
+        self.searches = 0
+        self.warnings = 0
+        # Warning kind -> time.monotonic() of the last one
+        self.warned = {}
+
+    def saturated_fraction(self) -> float:
+        if not self.hashfull:
+            return 0.0
+        return sum(value >= SATURATED_HASHFULL for value in self.hashfull) / len(self.hashfull)
+
+    def usual_nps(self):
+        return percentile(self.nps, 0.9)
+
+    def recent_nps(self):
+        return percentile(list(self.nps)[-RECENT_SEARCHES:], 0.5)
+
+    def record(self, engine_id: str, hashfull: int | None, nps: int | None) -> list[str]:
+        """Add the sample of a finished search. Returns the warnings to log."""
+        self.searches += 1
+        if hashfull is not None:
+            self.hashfull.append(hashfull)
+        if nps is not None:
+            self.nps.append(nps)
+
+        found = []
+        if len(self.hashfull) >= MIN_SAMPLES and self.saturated_fraction() >= SATURATED_FRACTION:
+            found.append(
+                (
+                    "hash",
+                    f"Hash of engine '{engine_id}' is nearly full (hashfull >= {SATURATED_HASHFULL / 10:g}%) at the end of "
+                    f"{self.saturated_fraction():.0%} of the last {len(self.hashfull)} searches. Consider a larger USI_Hash.",
+                )
+            )
+        if len(self.nps) >= RECENT_SEARCHES * 2 and self.recent_nps() < NPS_DROP * self.usual_nps():
+            found.append(
+                (
+                    "nps",
+                    f"NPS of engine '{engine_id}' dropped to {self.recent_nps():,} (median of the last {RECENT_SEARCHES} searches), "
+                    f"usually {self.usual_nps():,}. Check for thermal throttling or more search threads than cores.",
+                )
+            )
+
+        now = time.monotonic()
+        messages = []
+        for kind, message in found:
+            if now - self.warned.get(kind, -WARN_INTERVAL) >= WARN_INTERVAL:
+                self.warned[kind] = now
+                self.warnings += 1
+                messages.append(message)
+        return messages
+
+    def to_dict(self) -> dict:
+        return {
+            "searches": self.searches,
+            "sampled": len(self.nps),
+            "hashfull_p50": percentile(self.hashfull, 0.5),
+            "hashfull_p90": percentile(self.hashfull, 0.9),
+            "hash_saturated": round(self.saturated_fraction(), 3),
+            "nps_usual": self.usual_nps(),
+            "nps_recent": self.recent_nps(),
+            "warnings": self.warnings,
+        }
+
+
+# EngineSearchProfile by engine id
+SEARCH_PROFILES = {}
+
+
+def search_profile(engine_id: str) -> EngineSearchProfile:
+    return SEARCH_PROFILES.setdefault(engine_id, EngineSearchProfile())
+
+
+class SearchSampler:
+    """The 'info' fields of the running search of one session."""
+
+    def __init__(self, engine_id: str):
+        self.engine_id = engine_id
+        self.profile = search_profile(engine_id)
+        self.hashfull = None
+        self.nps = None
+        self.time_ms = 0
+
+    def on_line(self, line: str) -> list[str]:
+        """Follow one line of engine output. Returns the warnings to log."""
+        if line.startswith("info"):
+            if "nps" in line or "hashfull" in line:
+                info = parse_info(line)
+                self.hashfull = info.get("hashfull", self.hashfull)
+                self.nps = info.get("nps", self.nps)
+                self.time_ms = info.get("time", self.time_ms)
+            return []
+        if not line.startswith("bestmove"):
+            return []
+        hashfull, nps, time_ms = self.hashfull, self.nps, self.time_ms
+        self.hashfull = self.nps = None
+        self.time_ms = 0
+        if time_ms < MIN_SEARCH_MS or (hashfull is None and nps is None):
+            return []
+        return self.profile.record(self.engine_id, hashfull, nps)
+
+    def to_dict(self) -> dict:
+        return {"hashfull": self.hashfull, "nps": self.nps}
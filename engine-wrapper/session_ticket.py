@@ -0,0 +1,66 @@
+"""
+Session tickets: authentication and the first command in a single round trip.
+
+A client that authenticates with 'auth <digest> ticket' gets a ticket with the reply
+('auth_ok <ticket>'). On its next connection it can send, without waiting for the nonce:
+
+    resume <ticket> <proof> <first command>
+
+where proof = HMAC-SHA256(WRAPPER_ACCESS_TOKEN, ticket). Each accepted resume returns a
+new ticket ('auth_ok <ticket>'). A rejected ticket falls back to CRAM: the wrapper
+replies 'auth_ticket_rejected', expects 'auth <digest>' for the nonce it sent on connect,
+and then runs the command of the resume line.
+
+Replay protection: tickets expire after AUTH_TICKET_TTL seconds and are accepted once.
+The proof needs the access token, so a ticket seen on the network cannot be used by
+anyone else. The signing key and the record of redeemed tickets belong to one TicketBook,
+created per process (per worker in --workers mode): tickets do not survive a restart, and
+a ticket resumed on another worker than the one that issued it is rejected as unknown and
+falls back to CRAM.
+"""
+
+import hashlib
+import hmac
+import secrets
+import time
+
+
+def ticket_proof(access_token: str, ticket: str) -> str:
+    return hmac.new(access_token.encode(), ticket.encode(), hashlib.sha256).hexdigest()
+
+
+class TicketBook:
+    """Issues tickets and remembers the redeemed ones until they expire."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._key = secrets.token_bytes(32)
+        # ticket id -> expiry of the redeemed tickets
+        self._redeemed = {}
+
+    def _sign(self, body: str) -> str:
+        return hmac.new(self._key, body.encode(), hashlib.sha256).hexdigest()
+
+    def issue(self) -> str:
+        body = f"{secrets.token_hex(8)}.{int(time.time() + self.ttl)}"
+        return f"{body}.{self._sign(body)}"
+
+    def redeem(self, ticket: str, proof: str, access_token: str) -> str | None:
+        """Returns None if the ticket is accepted, otherwise why it was rejected."""
+        try:
+            ticket_id, expiry, signature = ticket.split(".")
+            expiry = int(expiry)
+        except ValueError:
+            return "malformed"
+        if not hmac.compare_digest(signature, self._sign(f"{ticket_id}.{expiry}")):
+            return "unknown"
+        now = time.time()
+        if expiry < now:
+            return "expired"
+        if not hmac.compare_digest(proof, ticket_proof(access_token, ticket)):
+            return "bad proof"
+        self._redeemed = {key: value for key, value in self._redeemed.items() if value >= now}
+        if ticket_id in self._redeemed:
+            return "already used"
+        self._redeemed[ticket_id] = expiry
+        return None
@@ -1,6 +1,19 @@
+import os
+import socket
+import sys
 from pathlib import Path
 
-from common import get_pc_url_config, get_python_exe, get_resource_dir, is_bundled, load_env_value
+import pytest
+
+from common import (
+    get_descendant_pids,
+    get_pc_url_config,
+    get_python_exe,
+    get_resource_dir,
+    is_bundled,
+    load_env_value,
+    unix_listener_pid,
+)
 
 
 def test_is_bundled(tmp_path, monkeypatch):
@@ -35,8 +48,6 @@ def test_get_python_exe(tmp_path, monkeypatch):
     monkeypatch.setattr("common.BASE_DIR", wrapper_dir)
 
     # 同梱の pythonw.exe がない場合は sys.executable を返す
-    import sys
-
     assert get_python_exe() == Path(sys.executable)
 
     # 同梱の pythonw.exe がある場合はそれを返す
@@ -122,3 +133,22 @@ class TestGetPcUrlConfig:
         url, ok = get_pc_url_config("0.0.0.0", _PORT, True, origins, _IP)
         assert url == "https://hostname.tailnet.ts.net"
         assert ok is True  # best-effort
+
+
+def test_get_descendant_pids():
+    # {pid: (ppid, pgid, sid)}: 10 -> 11 -> 13, 10 -> 12 / 20 は無関係
+    processes = {10: (1, 10, 10), 11: (10, 11, 11), 12: (10, 10, 10), 13: (11, 11, 11), 20: (1, 20, 20)}
+    assert sorted(get_descendant_pids(10, processes)) == [11, 12, 13]
+    assert get_descendant_pids(13, processes) == []
+
+
+def test_unix_listener_pid(tmp_path):
+    if sys.platform != "linux":
+        pytest.skip("SO_PEERCRED is Linux only")
+    path = tmp_path / "handoff.sock"
+    assert unix_listener_pid(path) is None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as listener:
+        listener.bind(str(path))
+        listener.listen(1)
+        # ランチャーは引き継ぎ用ソケットの待ち受け元で新しい Wrapper の引き継ぎ完了を確認する
+        assert unix_listener_pid(path) == os.getpid()
@@ -0,0 +1,48 @@
+import asyncio
+import zlib
+from unittest.mock import MagicMock
+
+from compression import CompressedWriter
+
+
+def make_writer(flush_interval: float):
+    raw = MagicMock()
+    raw.is_closing.return_value = False
+    sent = []
+    raw.write.side_effect = sent.append
+    return CompressedWriter(raw, 6, flush_interval), raw, sent
+
+
+async def test_compressed_writer_flushes_at_line_end():
+    writer, _, sent = make_writer(0)
+    decompressor = zlib.decompressobj()
+    writer.write(b"info depth 1 pv 7g7f\n")
+    # 行末ごとに同期フラッシュされ、受信済みのデータだけで展開できる
+    assert decompressor.decompress(b"".join(sent)) == b"info depth 1 pv 7g7f\n"
+    sent.clear()
+    # 行の途中ではフラッシュしない
+    writer.write(b"bestmove")
+    assert decompressor.decompress(b"".join(sent)) == b""
+    writer.write(b" 7g7f\n")
+    assert decompressor.decompress(b"".join(sent)) == b"bestmove 7g7f\n"
+    assert writer.bytes_in == 35
+
+
+async def test_compressed_writer_batches_within_flush_interval():
+    writer, raw, sent = make_writer(0.05)
+    decompressor = zlib.decompressobj()
+    for i in range(10):
+        writer.write(f"info depth {i} multipv 1 pv 7g7f 3c3d 2g2f\n".encode())
+    # フラッシュ間隔が経過するまでは送信されない
+    assert decompressor.decompress(b"".join(sent)) == b""
+    header = len(b"".join(sent))
+    sent.clear()
+    await asyncio.sleep(0.1)
+    assert decompressor.decompress(b"".join(sent)).count(b"\n") == 10
+    assert writer.bytes_out == header + sum(len(chunk) for chunk in sent) and writer.ratio() < 1
+    sent.clear()
+    # close() は未送信分を送ってから閉じる
+    writer.write(b"bestmove 7g7f\n")
+    writer.close()
+    assert decompressor.decompress(b"".join(sent)) == b"bestmove 7g7f\n"
+    raw.close.assert_called_once()
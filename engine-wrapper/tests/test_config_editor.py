@@ -64,3 +64,20 @@ def test_api_save_invalid_options_type():
     result = api.save(invalid_data)
     assert "error" in result
     assert "Field 'options' in entry 0 must be an object" in result["error"]
+
+
+def test_api_save_invalid_limits():
+    api = Api()
+    base = {"id": "id", "name": "Name", "path": "path"}
+
+    result = api.save([{**base, "limits": {"memory_mb": "4096"}}])
+    assert "Limit 'memory_mb' in entry 0 must be an integer" in result["error"]
+
+    result = api.save([{**base, "limits": {"rss": 1}}])
+    assert "Unknown limit 'rss'" in result["error"]
+
+    result = api.save([{**base, "limits": {"nice": 20}}])
+    assert "between -20 and 19" in result["error"]
+
+    result = api.save([{**base, "limits": {"cpu_seconds": 0}}])
+    assert "must be positive" in result["error"]
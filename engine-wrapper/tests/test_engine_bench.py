@@ -0,0 +1,51 @@
+import sys
+
+from engine_bench import BENCH_POSITIONS, append_history, find_baseline, load_history, regressions, run_bench
+
+FAKE_ENGINE = """
+import sys
+for line in sys.stdin:
+    if line.startswith('usi'):
+        print('id name Bench', flush=True)
+        print('usiok', flush=True)
+    elif line.startswith('setoption name Threads'):
+        threads = int(line.split()[-1])
+    elif line.startswith('isready'):
+        print('readyok', flush=True)
+    elif line.startswith('go'):
+        print('info depth 1 nodes 1000 time 1', flush=True)
+        print(f'info depth 2 nodes {threads * 50000} time 100', flush=True)
+        print('bestmove 7g7f', flush=True)
+    elif line.startswith('quit'):
+        break
+"""
+
+
+async def test_run_bench_measures_nps(tmp_path):
+    engine_path = tmp_path / "engine.py"
+    engine_path.write_text(f"#!{sys.executable}\n{FAKE_ENGINE}")
+    engine_path.chmod(0o755)
+    engine_def = {"id": "e1", "name": "E1", "path": str(engine_path), "options": {"Threads": 4}}
+
+    result = await run_bench(engine_def, "go btime 0 wtime 0 byoyomi 100")
+    # オプションが反映され、最後の info の nodes/time から NPS を求める
+    assert result["nps"] == 2_000_000
+    assert result["nodes"] == 200_000 * len(BENCH_POSITIONS)
+    assert result["searches"][0]["depth_times"] == {1: 1, 2: 100}
+    assert result["readyok_ms"] >= 0
+
+
+def test_bench_history_and_regressions(tmp_path):
+    path = tmp_path / "bench_history.jsonl"
+    base = {"engine": "e1", "go": "go nodes 1000", "positions": 5, "host": "h"}
+    append_history(path, {**base, "time": "t1", "nps": 1_000_000, "readyok_ms": 1000, "peak_rss_kb": 100_000})
+    append_history(path, {**base, "go": "go nodes 2000", "time": "t2", "nps": 5})
+    history = load_history(path)
+
+    # 同じエンジン・同じ探索条件の直近の結果と比較する
+    record = {**base, "nps": 850_000, "readyok_ms": 1050, "peak_rss_kb": 130_000}
+    baseline = find_baseline(history, record)
+    assert baseline["time"] == "t1"
+    assert regressions(record, baseline, 0.1) == ["NPS 1,000,000 -> 850,000", "peak RSS 100,000 -> 130,000"]
+    assert regressions({**record, "nps": 950_000, "peak_rss_kb": None}, baseline, 0.1) == []
+    assert find_baseline(history, {**record, "engine": "e2"}) is None
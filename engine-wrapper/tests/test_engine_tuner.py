@@ -0,0 +1,56 @@
+import json
+import sys
+
+import pytest
+
+from engine_tuner import apply_options, choose, time_to_depth, tune
+
+# スレッド数に応じて深さ 3 に到達する時間が短くなる疑似エンジン
+FAKE_ENGINE = """
+import sys
+threads = 1
+for line in sys.stdin:
+    if line.startswith('usi'):
+        print('option name Threads type spin default 1 min 1 max 64', flush=True)
+        print('option name USI_Hash type spin default 256 min 1 max 65536', flush=True)
+        print('usiok', flush=True)
+    elif line.startswith('setoption name Threads'):
+        threads = int(line.split()[-1])
+    elif line.startswith('isready'):
+        print('readyok', flush=True)
+    elif line.startswith('go'):
+        print(f'info depth 3 nodes {threads * 1000} time {max(100, 400 // threads)}', flush=True)
+        print('bestmove 7g7f', flush=True)
+    elif line.startswith('quit'):
+        break
+"""
+
+
+def test_choose_prefers_smallest_within_tolerance():
+    # 最良値から許容範囲内なら小さい値を選ぶ
+    assert choose({1: 400.0, 2: 200.0, 4: 100.0, 8: 102.0}, False, 0.03) == 4
+    assert choose({256: 100.0, 1024: 99.0}, False, 0.03) == 256
+    assert choose({64: 9000, 128: 10000, 256: 9950}, True, 0.03) == 128
+    search = {"depth": 3, "depth_times": {3: 100}}
+    assert time_to_depth({"searches": [search, {"depth": 2, "depth_times": {}}]}, 3, 500) == 300
+
+
+async def test_tune_sweeps_options(tmp_path):
+    engine_path = tmp_path / "engine.py"
+    engine_path.write_text(f"#!{sys.executable}\n{FAKE_ENGINE}")
+    engine_path.chmod(0o755)
+    engine_def = {"id": "e1", "name": "E1", "path": str(engine_path), "options": {"USI_OwnBook": True}}
+
+    sweeps = [("Threads", [1, 2, 4, 8]), ("USI_Hash", [256, 1024]), ("DNN_Batch_Size1", [64, 128])]
+    options = await tune(engine_def, sweeps, 100, 0.03)
+    # 深さ 3 までの時間は 4 スレッドで頭打ち、ハッシュは差がないので小さい方、バッチサイズは未対応なので設定しない
+    assert options == {"USI_OwnBook": True, "Threads": 4, "USI_Hash": 256}
+
+
+def test_apply_options_validates(tmp_path):
+    path = tmp_path / "engines.json"
+    path.write_text(json.dumps([{"id": "e1", "name": "E1", "path": "engine", "options": {"MultiPV": 1}}]), encoding="utf-8")
+    apply_options(path, "e1", {"Threads": 4})
+    assert json.loads(path.read_text(encoding="utf-8"))[0]["options"] == {"MultiPV": 1, "Threads": 4}
+    with pytest.raises(ValueError):
+        apply_options(path, "e2", {"Threads": 4})
@@ -0,0 +1,37 @@
+import json
+
+from latency_trace import SessionTrace, start_trace_writer, stop_trace_writer
+
+
+def test_session_trace_events(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    start_trace_writer(str(path))
+    try:
+        trace = SessionTrace("100-1", "fake", "test")
+        # 先読みで送られた usi と isready は、エンジンが順に応答した順で対応付けられる
+        usi = trace.received("usi")
+        trace.sent(usi, "usi")
+        ready = trace.received("isready")
+        trace.sent(ready, "isready")
+        assert trace.received("position startpos") is None
+        for line in ["id name Fake", "usiok", "readyok"]:
+            trace.engine_line(line)
+            trace.forwarded(line)
+    finally:
+        stop_trace_writer()
+
+    events = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(e["ev"], e.get("cmd")) for e in events] == [
+        ("start", None),
+        ("recv", "usi"),
+        ("sent", "usi"),
+        ("recv", "isready"),
+        ("sent", "isready"),
+        ("first", "usi"),
+        ("answer", "usi"),
+        ("first", "isready"),
+        ("answer", "isready"),
+    ]
+    answer = events[6]
+    assert answer["seq"] == usi and answer["read"] <= answer["t"]
+    assert all(e["sid"] == "100-1" and e["engine"] == "fake" for e in events)
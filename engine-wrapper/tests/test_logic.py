@@ -69,3 +69,12 @@ def test_parse_usi_option_line_button():
 def test_parse_usi_option_line_invalid():
     assert parse_usi_option_line("invalid line") == (None, None)
     assert parse_usi_option_line("option name OnlyName") == (None, None)
+
+
+def test_parse_usi_option_line_string_with_spaces():
+    # string 型の既定値は空白を含むことがある
+    name, opt = parse_usi_option_line("option name EvalDir type string default C:/Program Files/eval")
+    assert name == "EvalDir"
+    assert opt["default"] == "C:/Program Files/eval"
+    name, opt = parse_usi_option_line("option name BookFile type string default <empty>")
+    assert opt["default"] == ""
@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import root_split
+from root_split import RootSplitSession, partition_moves, score_key, split_engine_options
+
+
+class FakeStdin:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data: bytes):
+        self.lines.append(data.decode().strip())
+
+    async def drain(self):
+        pass
+
+
+def split_session(count: int) -> RootSplitSession:
+    processes = [SimpleNamespace(stdin=FakeStdin()) for _ in range(count)]
+    client_writer = MagicMock()
+    client_writer.drain = AsyncMock()
+    return RootSplitSession(processes, None, client_writer, AsyncMock())
+
+
+def test_split_engine_options():
+    options = {"Threads": 8, "USI_Hash": 4096, "BookFile": "book.db"}
+    result = split_engine_options(options, 3)
+    assert result["Threads"] == 2
+    assert result["USI_Hash"] == 1365
+    assert result["BookFile"] == "book.db"
+    # 元の設定は変更しない
+    assert options["Threads"] == 8
+
+    # 1未満にはならない
+    assert split_engine_options({"Threads": 1}, 4)["Threads"] == 1
+
+
+def test_score_key_ordering():
+    mate_win = score_key("info depth 5 score mate 3 pv 7g7f".split())
+    slow_mate_win = score_key("info depth 5 score mate 9 pv 7g7f".split())
+    cp_good = score_key("info depth 5 score cp 300 pv 7g7f".split())
+    cp_bad = score_key("info depth 5 score cp -300 pv 7g7f".split())
+    mated = score_key("info depth 5 score mate -4 pv 7g7f".split())
+
+    assert mate_win > slow_mate_win > cp_good > cp_bad > mated
+    assert score_key("info depth 5 nodes 100".split()) is None
+
+
+def test_partition_moves():
+    moves = ["a", "b", "c", "d", "e"]
+    assert partition_moves(moves, 2) == [["a", "c", "e"], ["b", "d"]]
+    assert partition_moves(moves, 3) == [["a", "d"], ["b", "e"], ["c"]]
+
+
+async def test_client_setoption_is_split():
+    session = split_session(2)
+    await session.handle_command("setoption name Threads value 8")
+    await session.handle_command("setoption name USI_Hash value 1024")
+    await session.handle_command("setoption name MultiPV value 3")
+    # Threads/USI_Hash は engines.json の設定と同じくプロセス数で分割する
+    expected = ["setoption name Threads value 4", "setoption name USI_Hash value 512", "setoption name MultiPV value 3"]
+    assert [process.stdin.lines for process in session.processes] == [expected, expected]
+
+
+async def test_probe_timeout_drains_the_probe(monkeypatch):
+    monkeypatch.setattr(root_split, "ROOT_PROBE_TIMEOUT", 0.05)
+    session = split_session(2)
+    search = asyncio.create_task(session.start_search("go btime 0 wtime 0 byoyomi 1000".split()))
+    await asyncio.sleep(0.1)
+    # 時間切れの探査は stop で止め、その bestmove までの出力はクライアントへ送らない
+    assert session.processes[0].stdin.lines[-1] == "stop"
+    await session.handle_engine_line(0, "info depth 1 multipv 1 score cp 50 pv 7g7f")
+    await session.handle_engine_line(0, "bestmove 7g7f")
+    await search
+    session.client_writer.write.assert_not_called()
+    assert session.processes[0].stdin.lines == [
+        "setoption name MultiPV value 600",
+        "go depth 1",
+        "stop",
+        "setoption name MultiPV value 1",
+        "go btime 0 wtime 0 byoyomi 1000 searchmoves 7g7f",
+    ]
+
+    # 本来の探索の出力は中継される
+    await session.handle_engine_line(0, "info depth 5 score cp 40 nodes 100 pv 7g7f")
+    session.client_writer.write.assert_called_once()
+
+
+async def test_stop_during_probe_answers_with_the_probe_move():
+    session = split_session(2)
+    # go を受けても探査の完了を待たずに次のコマンドを読む
+    await session.handle_command("go btime 0 wtime 0 byoyomi 1000")
+    await asyncio.sleep(0)
+    assert session.processes[0].stdin.lines[-1] == "go depth 1"
+    await session.handle_engine_line(0, "info depth 1 multipv 1 score cp 50 pv 7g7f")
+    # 探査中の stop は探査を止め、探査の最善手を bestmove として返す (分割探索は始めない)
+    await session.handle_command("stop")
+    assert session.processes[0].stdin.lines[-1] == "stop"
+    await session.handle_engine_line(0, "bestmove 7g7f")
+    await session.search_start
+    session.client_writer.write.assert_called_once_with(b"bestmove 7g7f\n")
+    assert session.processes[0].stdin.lines[-1] == "setoption name MultiPV value 1"
+    assert session.processes[1].stdin.lines == []
+    assert session.searching == [False, False]
+
+
+async def test_quit_during_probe_cancels_it():
+    session = split_session(2)
+    await session.handle_command("go infinite")
+    await asyncio.sleep(0)
+    await session.handle_command("quit")
+    assert session.search_start.cancelled()
+    assert [process.stdin.lines[-1] for process in session.processes] == ["quit", "quit"]
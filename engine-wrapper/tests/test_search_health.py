@@ -0,0 +1,40 @@
+import search_health
+from search_health import EngineSearchProfile, SearchSampler
+
+
+def search(sampler: SearchSampler, hashfull: int, nps: int, time_ms: int = 3000) -> list:
+    sampler.on_line(f"info depth 20 time {time_ms // 2} nodes 1000 nps {nps * 2} hashfull {hashfull // 2} pv 7g7f")
+    sampler.on_line(f"info depth 21 time {time_ms} nodes 2000 nps {nps} hashfull {hashfull} pv 7g7f")
+    return sampler.on_line("bestmove 7g7f")
+
+
+def test_sampler_records_last_values_of_long_searches(monkeypatch):
+    monkeypatch.setattr(search_health, "SEARCH_PROFILES", {})
+    sampler = SearchSampler("e1")
+    search(sampler, 300, 1_000_000)
+    # 短い探索は立ち上がりの NPS になるため記録しない
+    search(sampler, 10, 5, time_ms=100)
+    profile = search_health.SEARCH_PROFILES["e1"]
+    assert list(profile.hashfull) == [300] and list(profile.nps) == [1_000_000]
+    assert profile.searches == 1
+    assert sampler.to_dict() == {"hashfull": None, "nps": None}
+
+
+def test_profile_warns_about_saturated_hash_and_nps_collapse():
+    profile = EngineSearchProfile()
+    for _ in range(19):
+        assert profile.record("e1", 950, 1_000_000) == []
+    # 十分な数の探索で置換表が埋まっていれば警告する (同じ種類の警告は WARN_INTERVAL に1回)
+    (message,) = profile.record("e1", 950, 1_000_000)
+    assert "USI_Hash" in message
+    assert profile.record("e1", 950, 1_000_000) == []
+
+    profile = EngineSearchProfile()
+    for _ in range(20):
+        profile.record("e1", 100, 1_000_000)
+    messages = []
+    for _ in range(10):
+        messages += profile.record("e1", 100, 300_000)
+    # 直近の NPS の中央値が通常の半分を下回ると警告する
+    assert len(messages) == 1 and "300,000" in messages[0] and "1,000,000" in messages[0]
+    assert profile.to_dict()["nps_recent"] == 300_000 and profile.to_dict()["warnings"] == 1
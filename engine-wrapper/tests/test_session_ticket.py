@@ -0,0 +1,27 @@
+from session_ticket import TicketBook, ticket_proof
+
+
+def test_ticket_is_accepted_once():
+    book = TicketBook(60)
+    ticket = book.issue()
+    proof = ticket_proof("secret", ticket)
+    assert book.redeem(ticket, proof, "secret") is None
+    # 同じチケットの再利用 (リプレイ) は拒否される
+    assert book.redeem(ticket, proof, "secret") == "already used"
+
+
+def test_ticket_rejections():
+    book = TicketBook(60)
+    ticket = book.issue()
+    # トークンを知らない第三者は証明を作れない
+    assert book.redeem(ticket, ticket_proof("wrong", ticket), "secret") == "bad proof"
+    # 別のプロセス (署名鍵) が発行したチケットや改ざんされたチケット
+    other = TicketBook(60).issue()
+    assert book.redeem(other, ticket_proof("secret", other), "secret") == "unknown"
+    ticket_id, expiry, signature = ticket.split(".")
+    forged = f"{ticket_id}.{int(expiry) + 3600}.{signature}"
+    assert book.redeem(forged, ticket_proof("secret", forged), "secret") == "unknown"
+    assert book.redeem("garbage", "x", "secret") == "malformed"
+    expired = TicketBook(-1)
+    ticket = expired.issue()
+    assert expired.redeem(ticket, ticket_proof("secret", ticket), "secret") == "expired"
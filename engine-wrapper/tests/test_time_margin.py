@@ -0,0 +1,73 @@
+import socket
+
+from time_margin import NetworkTimeKeeper, adjust_go, parse_client_rtt, side_to_move, tcp_rtt_ms
+
+
+def test_side_to_move():
+    assert side_to_move("position startpos") == "b"
+    assert side_to_move("position startpos moves 7g7f") == "w"
+    assert side_to_move("position sfen lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL w - 1 moves 3c3d") == "b"
+    assert side_to_move("position") is None
+
+
+def test_adjust_go_lowers_byoyomi_or_own_time():
+    # 秒読みがあれば秒読みだけを減らす
+    command, budget = adjust_go("go btime 0 wtime 0 byoyomi 1000", 150, "b")
+    assert command == "go btime 0 wtime 0 byoyomi 850"
+    assert budget["budget"] == 1000 and budget["deducted"] == 150
+    # 秒読みは MIN_BYOYOMI_MS 未満にしない
+    assert adjust_go("go btime 0 wtime 0 byoyomi 200", 500, "b")[0] == "go btime 0 wtime 0 byoyomi 100"
+    # 秒読みがなければ手番側の持ち時間を減らす
+    command, budget = adjust_go("go btime 60000 wtime 50000 binc 1000 winc 1000", 200, "w")
+    assert command == "go btime 60000 wtime 49800 binc 1000 winc 1000"
+    assert budget["budget"] == 51000
+    # 手番が分からなければ両方を減らす
+    assert adjust_go("go btime 1000 wtime 1000", 100, None)[0] == "go btime 900 wtime 900"
+    # 検討・詰み探索と時間指定のない go はそのまま
+    for command in ("go infinite", "go mate 10000", "go depth 10"):
+        assert adjust_go(command, 100, "b") == (command, None)
+
+
+def test_network_time_keeper_logs_budget():
+    keeper = NetworkTimeKeeper(100)
+    keeper.rtt_samples.extend([1.0] * 99 + [40.0])
+    assert keeper.rtt_p99() == 40.0
+    keeper.on_client_command("position startpos moves 7g7f")
+    assert keeper.on_client_command("go btime 0 wtime 0 byoyomi 1000") == "go btime 0 wtime 0 byoyomi 860"
+    message = keeper.on_bestmove()
+    assert "byoyomi 1000 -> 860" in message and "p99 RTT 40.0 ms" in message
+    assert keeper.adjusted == 1 and keeper.deducted_ms == 140 and keeper.late == 0
+    # 先読みは ponderhit から計測する
+    keeper.on_client_command("go ponder btime 0 wtime 0 byoyomi 1000")
+    assert keeper.on_bestmove() is None
+    assert keeper.on_bestmove() is None
+
+
+def test_client_rtt_adds_to_deduction():
+    assert parse_client_rtt("client_rtt 12.5") == 12.5
+    for command in ("client_rtt", "client_rtt abc", "client_rtt -1", "client_rtt 1 2"):
+        assert parse_client_rtt(command) is None
+    keeper = NetworkTimeKeeper(50)
+    keeper.rtt_samples.append(2.0)
+    # ブラウザとの RTT (server.ts が計測) は TCP_INFO の RTT に足される
+    assert keeper.report_client_rtt("client_rtt 120")
+    assert not keeper.report_client_rtt("client_rtt x")
+    assert keeper.rtt_p99() == 122.0
+    assert keeper.on_client_command("go btime 0 wtime 0 byoyomi 1000") == "go btime 0 wtime 0 byoyomi 828"
+    assert keeper.to_dict()["client_rtt_p99_ms"] == 120.0
+
+
+def test_tcp_rtt_ms():
+    server = socket.create_server(("127.0.0.1", 0))
+    client = socket.create_connection(server.getsockname())
+    accepted, _ = server.accept()
+    try:
+        client.sendall(b"usi\n")
+        accepted.recv(4)
+        rtt = tcp_rtt_ms(accepted)
+        # Linux 以外では計測できない
+        assert rtt is None or rtt >= 0
+        assert tcp_rtt_ms(None) is None
+    finally:
+        for sock in (client, accepted, server):
+            sock.close()
@@ -0,0 +1,26 @@
+from transcript import SessionTranscript, read_transcript, start_transcript_writer, stop_transcript_writer
+
+
+def test_session_transcript_round_trip(tmp_path):
+    start_transcript_writer(str(tmp_path), keep=2)
+    try:
+        for session_id in range(3):
+            transcript = SessionTranscript(f"100-{session_id}", "e/1", ("127.0.0.1", 5000))
+            transcript.client("go btime 0 wtime 0 byoyomi 1000")
+            transcript.engine("info depth 1\tpv 7g7f")
+            transcript.engine("bestmove 7g7f")
+            transcript.close()
+    finally:
+        stop_transcript_writer()
+    # 古いファイルは TRANSCRIPT_KEEP 個を残して削除される
+    paths = sorted(tmp_path.glob("*.usi.gz"))
+    assert len(paths) == 2 and paths[-1].name.endswith("-100-2-e_1.usi.gz")
+    header, entries = read_transcript(paths[-1])
+    assert header["engine"] == "e/1" and header["format"] == "usi"
+    # 方向と行の内容 (タブを含む) がそのまま記録される
+    assert [(direction, line) for _, direction, line in entries] == [
+        (">", "go btime 0 wtime 0 byoyomi 1000"),
+        ("<", "info depth 1\tpv 7g7f"),
+        ("<", "bestmove 7g7f"),
+    ]
+    assert entries[0][0] <= entries[-1][0]
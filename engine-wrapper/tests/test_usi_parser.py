@@ -0,0 +1,40 @@
+import json
+
+from usi_parser import INFO_KEYWORDS, info_frame, iter_fields, parse_info
+
+
+def test_iter_fields_splits_keywords():
+    fields = list(iter_fields("info depth 10 score cp 35 lowerbound pv 7g7f 3c3d", INFO_KEYWORDS))
+    assert fields == [("depth", ["10"]), ("score", ["cp", "35", "lowerbound"]), ("pv", ["7g7f", "3c3d"])]
+    # string 以降はキーワードを含んでいても行末までそのまま 1 つの値になる
+    fields = list(iter_fields("info depth 3 string  depth 5 is  next", INFO_KEYWORDS, "string"))
+    assert fields == [("depth", ["3"]), ("string", ["depth 5 is  next"])]
+
+
+def test_parse_info_typed_fields():
+    line = "info depth 24 seldepth 30 score cp -120 upperbound multipv 2 nodes 123456 nps 987654 hashfull 512 time 1500 pv 2g2f 8c8d"
+    assert parse_info(line) == {
+        "depth": 24,
+        "seldepth": 30,
+        "score": {"cp": -120, "bound": "upper"},
+        "multipv": 2,
+        "nodes": 123456,
+        "nps": 987654,
+        "hashfull": 512,
+        "time": 1500,
+        "pv": ["2g2f", "8c8d"],
+    }
+    assert parse_info("info score mate -3 pv 5a4b")["score"] == {"mate": -3}
+    assert parse_info("info score mate + pv 5a4b")["score"] == {"mate": "+"}
+    assert parse_info("info currmove 7g7f")["currmove"] == "7g7f"
+
+
+def test_parse_info_skips_malformed_fields():
+    # 壊れたフィールドは落とし、残りは解析する
+    assert parse_info("info depth x score cp nodes 10 pv") == {"nodes": 10, "pv": []}
+
+
+def test_info_frame_is_one_compact_line():
+    frame = info_frame("info depth 1 string hello world")
+    assert frame.endswith(b"\n") and frame.count(b"\n") == 1 and b" " not in frame.replace(b"hello world", b"")
+    assert json.loads(frame) == {"info": {"depth": 1, "string": "hello world"}}
@@ -1,6 +1,140 @@
+import asyncio
+import hashlib
+import hmac
 import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import types
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
 
-from engine_wrapper import get_engine_list
+import pytest
+
+import engine_wrapper
+import search_health
+from engine_wrapper import (
+    EngineSession,
+    EngineWarmup,
+    LatencyHistogram,
+    SessionCounter,
+    SessionReplay,
+    StopWatchdog,
+    adopt_session,
+    engine_list_delta,
+    find_orphaned_engines,
+    get_engine_list,
+    handle_client,
+    limit_exit_hint,
+    limit_exit_message,
+    load_uvloop,
+    parse_connection_options,
+    shutdown_engines,
+    splice_stream,
+    start_engine_process,
+    start_unix_server,
+)
+from handoff import HANDOFF_SUPPORTED, recv_message
+from session_ticket import ticket_proof
+from transcript import read_transcript, start_transcript_writer, stop_transcript_writer
+
+# セッションのテストで使う USI エンジン。CONFIG は write_fake_engine() の設定に置き換えられる
+FAKE_ENGINE = """
+import json, os, sys
+
+config = json.loads(CONFIG)
+log = open(config["log"], "a") if config["log"] else None
+for line in sys.stdin:
+    if log:
+        log.write(line)
+        log.flush()
+    command = line.strip()
+    name = command.split(maxsplit=1)[0] if command else ""
+    if name == "usi":
+        print("usiok", flush=True)
+    elif name == "isready":
+        print("readyok", flush=True)
+    elif name == "go" and config["crash_marker"] and not os.path.exists(config["crash_marker"]):
+        open(config["crash_marker"], "w").close()
+        os._exit(3)
+    elif name == "go" and config["on_go"] is not None:
+        for output in config["on_go"]:
+            print(output.replace("$command", command), flush=True)
+    elif name == "quit":
+        sys.exit(config["quit_code"])
+"""
+
+
+def write_fake_engine(
+    directory: Path, on_go=("bestmove 7g7f",), crash_once: bool = False, log: Path | None = None, quit_code: int = 0
+) -> Path:
+    """
+    Write an executable fake engine that answers 'usi'/'isready' and prints on_go for each 'go'
+    ('$command' becomes the go command, None never answers). With crash_once it exits with code 3
+    at the first 'go', and 'quit' exits with quit_code. Every received command is appended to log.
+    """
+    config = {
+        "on_go": list(on_go) if on_go is not None else None,
+        "crash_marker": str(directory / "crashed") if crash_once else None,
+        "log": str(log) if log else None,
+        "quit_code": quit_code,
+    }
+    engine_path = directory / "engine.py"
+    engine_path.write_text(f"#!{sys.executable}\n" + FAKE_ENGINE.replace("CONFIG", repr(json.dumps(config))), encoding="utf-8")
+    engine_path.chmod(0o755)
+    return engine_path
+
+
+def fake_engine_def(engine_path: Path, engine_id: str = "e1", **fields) -> dict:
+    return {"id": engine_id, "name": engine_id.upper(), "path": str(engine_path), **fields}
+
+
+def write_engines_json(directory: Path, *engine_defs: dict):
+    (directory / "engines.json").write_text(json.dumps(list(engine_defs)), encoding="utf-8")
+
+
+@pytest.fixture
+def wrapper_dir(tmp_path, monkeypatch):
+    """BASE_DIR of the wrapper in tmp_path, without the sessions left by other tests."""
+    monkeypatch.setattr(engine_wrapper, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(engine_wrapper, "LIVE_SESSIONS", {})
+    monkeypatch.setattr(engine_wrapper, "SPLIT_SESSIONS", {})
+    return tmp_path
+
+
+async def socket_streams():
+    """Streams of both ends of a socketpair: (wrapper reader, wrapper writer, client reader, client writer)."""
+    left, right = socket.socketpair()
+    wrapper_reader, wrapper_writer = await asyncio.open_connection(sock=left)
+    reader, writer = await asyncio.open_connection(sock=right)
+    return wrapper_reader, wrapper_writer, reader, writer
+
+
+async def connect_wrapper(token: str | None):
+    """Connect to handle_client through a socketpair and authenticate. Returns (reader, writer, handler task)."""
+    client_reader, client_writer, reader, writer = await socket_streams()
+    handler = asyncio.create_task(handle_client(client_reader, client_writer))
+    if token:
+        nonce = (await reader.readline()).decode().split()[1]
+        writer.write(f"auth {hmac.new(token.encode(), nonce.encode(), hashlib.sha256).hexdigest()}\n".encode())
+        assert await reader.readline() == b"auth_ok\n"
+    return reader, writer, handler
+
+
+async def request(lines: list, token: str | None) -> list:
+    reader, writer, handler = await connect_wrapper(token)
+    writer.write("".join(line + "\n" for line in lines).encode())
+    replies = [line async for line in reader]
+    await handler
+    writer.close()
+    return replies
 
 
 def test_get_engine_list_empty(tmp_path, monkeypatch):
@@ -31,3 +165,708 @@ def test_get_engine_list_invalid_json(tmp_path, monkeypatch):
 
     # エラー時は空配列を返すはず
     assert get_engine_list() == []
+
+
+async def test_engine_warmup_absorbs_handshake():
+    stdout = asyncio.StreamReader()
+    stdout.feed_data(b"id name Test\nusiok\ninfo string loading\nreadyok\nbestmove 7g7f\n")
+    process = MagicMock()
+    process.stdin = AsyncMock()
+    process.stdin.write = MagicMock()
+    process.stdout = stdout
+
+    warmup = EngineWarmup(process, {"Threads": 2})
+    warmup.start()
+    await warmup.task
+
+    writes = [call[0][0] for call in process.stdin.write.call_args_list]
+    assert writes == [b"usi\n", b"setoption name Threads value 2\n", b"isready\n"]
+    assert warmup.usi_lines == [b"id name Test\n", b"usiok\n"]
+    assert warmup.ready_done.is_set()
+    # readyok 以降の出力は通常の中継に残される
+    assert await stdout.readline() == b"bestmove 7g7f\n"
+
+
+async def test_unix_socket_listener_serves_list(wrapper_dir):
+    if sys.platform == "win32":
+        pytest.skip("Unix domain sockets are not supported on Windows")
+
+    write_engines_json(wrapper_dir, {"id": "e1", "name": "E1", "path": "e1"})
+    socket_path = wrapper_dir / "wrapper.sock"
+    # 前回の異常終了で残ったソケットファイルは置き換えられる
+    stale = await asyncio.start_unix_server(lambda r, w: None, path=str(socket_path))
+    stale.close()
+
+    server = await start_unix_server(str(socket_path))
+    try:
+        reader, writer = await asyncio.open_unix_connection(str(socket_path))
+        writer.write(b"list\n")
+        await writer.drain()
+        assert json.loads(await reader.readline()) == [{"id": "e1", "name": "E1", "path": "e1"}]
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_load_uvloop_respects_setting(monkeypatch):
+    fake_uvloop = types.ModuleType("uvloop")
+    monkeypatch.setitem(sys.modules, "uvloop", fake_uvloop)
+    monkeypatch.setattr("engine_wrapper.sys.platform", "linux")
+
+    monkeypatch.setattr("engine_wrapper.EVENT_LOOP", "asyncio")
+    assert load_uvloop() is None
+
+    monkeypatch.setattr("engine_wrapper.EVENT_LOOP", "auto")
+    assert load_uvloop() is fake_uvloop
+
+    # Windows では常に標準のイベントループ
+    monkeypatch.setattr("engine_wrapper.sys.platform", "win32")
+    assert load_uvloop() is None
+
+
+async def test_splice_stream_keeps_order():
+    if sys.platform != "linux" or not hasattr(os, "splice"):
+        pytest.skip("splice() is Linux only")
+
+    _, writer, reader, _ = await socket_streams()
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+
+    # トランスポートに溜まっているデータは splice したデータより先に届く
+    writer.write(b"id name Test\n")
+    os.write(write_fd, b"info depth 1\nbestmove 7g7f\n")
+    os.close(write_fd)
+    await splice_stream(read_fd, writer, "[test]")
+    os.close(read_fd)
+    writer.close()
+
+    assert await reader.read() == b"id name Test\ninfo depth 1\nbestmove 7g7f\n"
+
+
+def test_session_counter_limits_across_workers():
+    local = SessionCounter()
+    assert local.try_acquire(1) is True
+    assert local.try_acquire(1) is False
+    local.release()
+    assert local.try_acquire(0) is True  # 0 は無制限
+
+    # ワーカーごとのスロットを合算して上限を判定する
+    shared = multiprocessing.get_context().Array("i", 2)
+    worker0 = SessionCounter(shared, 0)
+    worker1 = SessionCounter(shared, 1)
+    assert worker0.try_acquire(2) is True
+    assert worker1.try_acquire(2) is True
+    assert worker0.try_acquire(2) is False
+    assert worker1.total() == 2
+    worker1.release()
+    assert worker0.try_acquire(2) is True
+    assert list(shared) == [2, 0]
+
+
+async def test_session_hand_over_keeps_engine_and_client():
+    if not HANDOFF_SUPPORTED:
+        pytest.skip("handoff is Linux only")
+
+    # 受け取った行をそのまま返し、quit で終了するエンジン
+    echo = "import sys\nfor line in sys.stdin:\n    if line.strip() == 'quit': break\n    print(line.strip(), flush=True)"
+    engine = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", echo, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    client_reader, client_writer, reader, writer = await socket_streams()
+
+    session = EngineSession({"id": "echo"}, engine, client_reader, client_writer, "test")
+    run_task = asyncio.create_task(session.run())
+    writer.write(b"before\n")
+    assert await reader.readline() == b"before\n"
+
+    old_end, new_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    await session.hand_over(old_end)
+    await run_task
+    assert session.handed_off
+
+    # 旧プロセス側のクライアントソケットを閉じても接続とエンジンは引き継ぎ先で生きている
+    client_writer.close()
+    message, fds = recv_message(new_end)
+    assert message["pid"] == engine.pid
+    await adopt_session(message, fds)
+    writer.write(b"after\n")
+    assert await reader.readline() == b"after\n"
+
+    # クライアント切断で引き継ぎ先がエンジンを終了させる
+    writer.close()
+    await asyncio.wait_for(asyncio.gather(*engine_wrapper.CLIENT_TASKS), 10)
+    assert await asyncio.wait_for(engine.wait(), 10) == 0
+    old_end.close()
+    new_end.close()
+
+
+async def test_takeover_without_running_wrapper_exits(wrapper_dir, monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "HANDOFF_SOCKET_PATH", str(wrapper_dir / "missing.sock"))
+    # 引き継ぎ元がなければ待ち受けを始めずに異常終了し、ランチャーは旧プロセスを使い続ける
+    with pytest.raises(SystemExit) as exit_info:
+        await engine_wrapper.main(takeover=True)
+    assert exit_info.value.code == 1
+
+
+async def test_adopted_session_respawns_crashed_engine(wrapper_dir):
+    if not HANDOFF_SUPPORTED:
+        pytest.skip("handoff is Linux only")
+
+    engine_path = write_fake_engine(wrapper_dir, crash_once=True)
+    engine_def = fake_engine_def(engine_path, respawn=True)
+    engine = await start_engine_process(engine_path)
+    client_reader, client_writer, reader, writer = await socket_streams()
+    session = EngineSession(engine_def, engine, client_reader, client_writer, "test")
+    run_task = asyncio.create_task(session.run())
+    writer.write(b"usi\nisready\n")
+    assert await reader.readline() == b"usiok\n"
+    assert await reader.readline() == b"readyok\n"
+
+    old_end, new_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    await session.hand_over(old_end)
+    await run_task
+    await session.close()
+    client_writer.close()
+    await adopt_session(*recv_message(new_end))
+
+    # 引き継いだエンジンの終了コードは分からないが、quit なしの終了はクラッシュとして再起動する
+    writer.write(b"position startpos\ngo depth 10\n")
+    assert (await asyncio.wait_for(reader.readline(), 10)).startswith(b"info string Engine crashed (exit code unknown)")
+    assert await asyncio.wait_for(reader.readline(), 10) == b"bestmove 7g7f\n"
+    assert await asyncio.wait_for(engine.wait(), 10) == 3
+    (respawned,) = [live.engine_process for live in engine_wrapper.LIVE_SESSIONS.values()]
+
+    writer.close()
+    await asyncio.wait_for(asyncio.gather(*engine_wrapper.CLIENT_TASKS), 10)
+    assert await asyncio.wait_for(respawned.wait(), 10) == 0
+    old_end.close()
+    new_end.close()
+
+
+async def test_shutdown_engines_enforces_one_deadline(monkeypatch):
+    monkeypatch.setattr("engine_wrapper.SHUTDOWN_TIMEOUT", 0.5)
+    monkeypatch.setattr("engine_wrapper.SHUTTING_DOWN", False)
+
+    async def spawn(script):
+        process = await asyncio.create_subprocess_exec(sys.executable, "-c", script, stdin=asyncio.subprocess.PIPE)
+        engine_wrapper.ENGINE_PROCESSES.add(process)
+        return process
+
+    # quit で終了するエンジンと、quit も SIGTERM も無視するエンジン
+    polite = [await spawn("import sys\nfor line in sys.stdin:\n    if line.strip() == 'quit': break") for _ in range(3)]
+    stubborn = await spawn("import signal, time\nsignal.signal(signal.SIGTERM, signal.SIG_IGN)\ntime.sleep(60)")
+
+    started = time.monotonic()
+    await shutdown_engines()
+    # エンジンごとの待ち時間が積み上がらず、全体で1つの期限に収まる
+    assert time.monotonic() - started < engine_wrapper.SHUTDOWN_TIMEOUT + 1.0
+    assert [p.returncode for p in polite] == [0, 0, 0]
+    assert stubborn.returncode is not None and stubborn.returncode < 0
+
+
+def start_reparented(engine_path: Path, stdin_fd: int, env: dict) -> int:
+    """Start engine_path from a shell that exits right away, so that the engine is reparented. Returns its pid."""
+    shell = subprocess.run(
+        # A background command gets /dev/null as its stdin unless it is redirected explicitly
+        ["sh", "-c", '"$0" <&0 >/dev/null 2>&1 & echo $!', str(engine_path)],
+        stdin=stdin_fd,
+        env=env,
+        cwd=engine_path.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    pid = int(shell.stdout)
+    deadline = time.monotonic() + 5
+    while str(engine_path).encode() not in Path(f"/proc/{pid}/cmdline").read_bytes() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return pid
+
+
+def test_find_orphaned_engines(wrapper_dir):
+    if sys.platform != "linux":
+        pytest.skip("/proc is Linux only")
+
+    engine_path = write_fake_engine(wrapper_dir)
+    write_engines_json(wrapper_dir, fake_engine_def(engine_path))
+    stdin_read, stdin_write = os.pipe()
+
+    # 他のプログラム (GUI・ベンチマーク等) が起動した同じエンジンは、親が生きていても孤児になっていても対象外
+    foreign = subprocess.Popen([str(engine_path)], cwd=wrapper_dir, stdin=subprocess.PIPE)
+    stray = start_reparented(engine_path, stdin_read, dict(os.environ))
+    # Wrapper が起動し、親を失ったエンジンは孤児として検出され、メモリ量も報告される
+    orphan = start_reparented(engine_path, stdin_read, {**os.environ, engine_wrapper.ENGINE_MARKER_ENV: "1"})
+    try:
+        orphans = find_orphaned_engines(set())
+        assert [(pid, path) for pid, path, _, _ in orphans] == [(orphan, str(engine_path.resolve()))]
+        assert orphans[0][2] > 0
+
+        # 自分が管理しているエンジンは除外する
+        assert find_orphaned_engines({orphan}) == []
+    finally:
+        foreign.kill()
+        foreign.wait()
+        for pid in (stray, orphan):
+            os.kill(pid, signal.SIGKILL)
+        os.close(stdin_read)
+        os.close(stdin_write)
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="Linux only")
+def test_engine_nice_applies_to_all_threads():
+    # 起動直後にスレッドを作るエンジンでも、すべてのスレッドの nice 値が変わる
+    script = (
+        "import sys, threading\n"
+        "for _ in range(3): threading.Thread(target=sys.stdin.read, daemon=True).start()\n"
+        "print(flush=True)\n"
+        "sys.stdin.read()"
+    )
+    process = subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        process.stdout.readline()
+        engine_wrapper.apply_engine_limits(process.pid, {"nice": 7})
+        tids = [int(tid) for tid in os.listdir(f"/proc/{process.pid}/task")]
+        assert len(tids) == 4
+        assert [os.getpriority(os.PRIO_PROCESS, tid) for tid in tids] == [7] * 4
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_limit_exit_message():
+    # 制限なし・正常終了は通常の切断扱い
+    assert limit_exit_message(None, -signal.SIGKILL) is None
+    assert limit_exit_message({"memory_mb": 1024}, 0) is None
+
+    # CPU 時間の上限は SIGXCPU でのみ判定する (SIGKILL は watchdog などからも送られる)
+    assert "CPU time limit" in limit_exit_message({"cpu_seconds": 60}, -signal.SIGXCPU)
+    assert limit_exit_message({"cpu_seconds": 60}, -signal.SIGKILL) is None
+    # メモリ確保の失敗は abort() やエラー終了になるが、他の原因と区別できないので推定に留める
+    assert limit_exit_message({"memory_mb": 1024}, -signal.SIGABRT) is None
+    assert "memory limit (1024 MB)" in limit_exit_hint({"memory_mb": 1024}, -signal.SIGABRT)
+    assert limit_exit_hint({"memory_mb": 1024, "cpu_seconds": 60}, -signal.SIGXCPU) is None
+    assert limit_exit_message({"nice": 10}, 1) is None and limit_exit_hint({"nice": 10}, 1) is None
+
+
+def test_session_replay_records_state():
+    replay = SessionReplay()
+    for command in ["usi", "setoption name MultiPV value 3", "setoption name USI_Hash value 256", "isready"]:
+        replay.record_client(command)
+    replay.record_engine("readyok")
+    for command in ["setoption name MultiPV value 1", "usinewgame", "position startpos moves 7g7f", "go btime 1000 wtime 1000"]:
+        replay.record_client(command)
+
+    # 後から変更したオプションは最後に再送される
+    assert list(replay.options.values()) == ["setoption name USI_Hash value 256", "setoption name MultiPV value 1"]
+    assert replay.ready
+    assert replay.replay_lines() == ["usinewgame", "position startpos moves 7g7f", "go btime 1000 wtime 1000"]
+
+    # 探索中に stop を送っていれば再送後すぐに止める
+    replay.record_client("stop")
+    assert replay.replay_lines()[-2:] == ["go btime 1000 wtime 1000", "stop"]
+
+    # bestmove を受け取った後は go を再送しない
+    replay.record_engine("bestmove 7g7f")
+    assert replay.replay_lines() == ["usinewgame", "position startpos moves 7g7f"]
+
+    restored = SessionReplay()
+    restored.load(json.loads(json.dumps(replay.to_dict())))
+    assert restored.to_dict() == replay.to_dict()
+
+
+async def test_session_respawns_crashed_engine(tmp_path):
+    # 最初の go で異常終了し、受け取ったコマンドを記録するエンジン
+    log = tmp_path / "commands.log"
+    engine_path = write_fake_engine(tmp_path, crash_once=True, log=log)
+
+    # memory_mb を指定していても、原因を特定できない異常終了では再起動する
+    limits = {"memory_mb": 4096}
+    engine_def = fake_engine_def(engine_path, "crashy", respawn=True, options={"USI_Hash": 64}, limits=limits)
+    engine = await start_engine_process(engine_path, limits=limits)
+    client_reader, client_writer, reader, writer = await socket_streams()
+    session = EngineSession(engine_def, engine, client_reader, client_writer, "test")
+    run_task = asyncio.create_task(session.run())
+
+    writer.write(b"usi\nisready\n")
+    assert await reader.readline() == b"usiok\n"
+    assert await reader.readline() == b"readyok\n"
+    writer.write(b"position startpos\ngo depth 10\n")
+
+    # クライアントは切断されず、再起動の通知に続いて再送した go の bestmove を受け取る
+    notice = await asyncio.wait_for(reader.readline(), 10)
+    assert notice.startswith(b"info string Engine crashed (exit code 3; may have been caused by its memory limit (4096 MB))")
+    assert await asyncio.wait_for(reader.readline(), 10) == b"bestmove 7g7f\n"
+    assert session.engine_process.pid != engine.pid
+    assert engine_wrapper.RESPAWN_STATS["crashy"].respawns == 1
+
+    commands = log.read_text().splitlines()
+    restart = commands.index("usi", 1)
+    assert commands[restart:] == ["usi", "setoption name USI_Hash value 64", "isready", "position startpos", "go depth 10"]
+
+    writer.close()
+    await asyncio.wait_for(run_task, 10)
+    await session.close()
+
+
+async def test_respawn_restores_eager_init_options(wrapper_dir):
+    # eager_init ではウォームアップが engines.json のオプションを送るが、再起動後のエンジンにも再送される
+    log = wrapper_dir / "commands.log"
+    engine_path = write_fake_engine(wrapper_dir, crash_once=True, log=log)
+    options = {"USI_Hash": 64, "Threads": 2}
+    write_engines_json(wrapper_dir, fake_engine_def(engine_path, "eager", respawn=True, eager_init=True, options=options))
+
+    reader, writer, handler = await connect_wrapper(None)
+    writer.write(b"run eager\nusi\nisready\nposition startpos\ngo depth 10\n")
+    assert await reader.readline() == b"usiok\n"
+    assert await reader.readline() == b"readyok\n"
+    assert (await asyncio.wait_for(reader.readline(), 10)).startswith(b"info string Engine crashed (exit code 3)")
+    assert await asyncio.wait_for(reader.readline(), 10) == b"bestmove 7g7f\n"
+
+    commands = log.read_text().splitlines()
+    restart = len(commands) - 1 - commands[::-1].index("usi")
+    assert commands[restart:] == [
+        "usi",
+        "setoption name USI_Hash value 64",
+        "setoption name Threads value 2",
+        "isready",
+        "position startpos",
+        "go depth 10",
+    ]
+
+    writer.close()
+    await asyncio.wait_for(handler, 10)
+
+
+async def test_shutdown_does_not_respawn_engines(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "SHUTTING_DOWN", False)
+    # quit に異常終了コードを返すエンジンでも、終了処理中は再起動しない
+    engine_path = write_fake_engine(tmp_path, on_go=None, quit_code=1)
+    engine = await start_engine_process(engine_path)
+    client_reader, client_writer, reader, writer = await socket_streams()
+    session = EngineSession(fake_engine_def(engine_path, "stopping", respawn=True), engine, client_reader, client_writer, "test")
+    run_task = asyncio.create_task(session.run())
+
+    writer.write(b"usi\nisready\nposition startpos\ngo infinite\n")
+    assert await reader.readline() == b"usiok\n"
+    assert await reader.readline() == b"readyok\n"
+
+    await shutdown_engines()
+    await asyncio.wait_for(run_task, 10)
+    assert engine.returncode == 1 and session.engine_process is engine
+    assert engine_wrapper.RESPAWN_STATS["stopping"].crashes == 0
+
+    writer.close()
+    await session.close()
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    for seconds in [0.005, 0.02, 0.02, 0.3, 12.0]:
+        histogram.record(seconds)
+    assert histogram.total == 5
+    assert histogram.percentile(0.5) == "<=25ms"
+    assert histogram.percentile(0.99) == ">10000ms"
+    assert histogram.summary().endswith("[<=10ms: 1, <=25ms: 2, <=500ms: 1, >10000ms: 1]")
+
+
+async def test_stop_watchdog_resigns_then_kills(monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "STOP_TIMEOUT", 0.05)
+    monkeypatch.setattr(engine_wrapper, "STOP_LATENCY", {})
+    client_writer = MagicMock()
+    client_writer.drain = AsyncMock()
+    session = SimpleNamespace(engine_id="hang", engine_process=MagicMock(pid=1), client_writer=client_writer, replay=None)
+    watchdog = StopWatchdog(session)
+
+    # 期限内の bestmove はそのまま中継され、遅延が記録される
+    watchdog.on_client_command("go infinite")
+    watchdog.on_client_command("stop")
+    assert watchdog.on_engine_line("bestmove 7g7f")
+    assert watchdog.histogram.total == 1
+    # 管理コマンド health でエンジンごとに取得できる
+    reply = await engine_wrapper.admin_health([])
+    assert reply["stop_latency"]["hang"]["count"] == 1 and reply["stop_latency"]["hang"]["timeouts"] == 0
+
+    # 期限を過ぎると bestmove resign を送り、遅れて届いた bestmove は捨てる
+    watchdog.on_client_command("go infinite")
+    watchdog.on_client_command("stop")
+    await asyncio.sleep(0.08)
+    client_writer.write.assert_called_once_with(b"bestmove resign\n")
+    assert not watchdog.on_engine_line("bestmove 7g7f")
+    assert watchdog.histogram.timeouts == 1
+
+    # さらに応答がなければエンジンを強制終了する
+    watchdog.on_client_command("go infinite")
+    watchdog.on_client_command("stop")
+    await asyncio.wait_for(watchdog.task, 1)
+    assert watchdog.killed
+    session.engine_process.kill.assert_called_once()
+
+
+async def test_admin_profile_requires_token(wrapper_dir, monkeypatch):
+    # トークン未設定 (認証なし) では管理コマンドを受け付けない
+    monkeypatch.delenv("WRAPPER_ACCESS_TOKEN", raising=False)
+    assert await request(["profile 0.1"], None) == [b"WRAPPER_ERROR: Admin commands require WRAPPER_ACCESS_TOKEN.\n"]
+
+    monkeypatch.setenv("WRAPPER_ACCESS_TOKEN", "secret")
+    for mode, suffix in [("cprofile", ".pstats"), ("sample", ".collapsed")]:
+        (reply,) = await request([f"profile 0.1 {mode}"], "secret")
+        result = json.loads(reply)
+        assert result["status"] == "ok" and result["profile"].endswith(suffix)
+        # プロファイルと同じ場所にタスク一覧を含むレポートが書き出される
+        assert "asyncio tasks" in (wrapper_dir / result["report"]).read_text(encoding="utf-8")
+
+    (reply,) = await request(["profile 1 perf"], "secret")
+    assert "error" in json.loads(reply)
+
+
+async def test_admin_sessions_kill_and_drain(wrapper_dir, monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "DRAIN", engine_wrapper.DrainState())
+    monkeypatch.setenv("WRAPPER_ACCESS_TOKEN", "secret")
+    # go に応答しない (探索を続ける) エンジン
+    write_engines_json(wrapper_dir, fake_engine_def(write_fake_engine(wrapper_dir, on_go=None)))
+
+    reader, writer, handler = await connect_wrapper("secret")
+    writer.write(b"run e1\nusi\ngo infinite\n")
+    assert await reader.readline() == b"usiok\n"
+    await asyncio.sleep(0.1)
+
+    (reply,) = await request(["sessions"], "secret")
+    (session,) = json.loads(reply)["sessions"]
+    assert session["engine"] == "e1" and session["state"] == "searching" and session["commands"] == 2
+    (reply,) = await request(["pool"], "secret")
+    assert json.loads(reply)["pool"] == {"e1": {"busy": 1, "idle": 0}}
+
+    # drain 中は新しいセッションを受け付けないが、既存のセッションは続く
+    (reply,) = await request(["drain"], "secret")
+    assert json.loads(reply)["draining"] is True
+    assert await request(["run e1"], "secret") == [b"WRAPPER_ERROR: Wrapper is draining for maintenance.\n"]
+
+    # ID にはプロセスの PID が付き、別のプロセス (ワーカー) のセッションの ID は受け付けない
+    number = session["id"].split("-")[1]
+    assert session["id"] == f"{os.getpid()}-{number}"
+    (reply,) = await request([f"kill {os.getpid() + 1}-{number}"], "secret")
+    assert "is not served by this process" in json.loads(reply)["error"]
+
+    # kill でクライアントが切断され、エンジンも終了する
+    (reply,) = await request([f"kill {session['id']}"], "secret")
+    assert json.loads(reply) == {"status": "ok", "killed": session["id"]}
+    assert await reader.readline() == b"WRAPPER_ERROR: Session terminated by the administrator.\n"
+    await asyncio.wait_for(handler, 10)
+    (reply,) = await request(["sessions"], "secret")
+    assert json.loads(reply)["sessions"] == []
+    writer.close()
+
+
+def test_parse_connection_options():
+    assert parse_connection_options("run e1") == ("run e1", {})
+    assert parse_connection_options("run-split e1 2 format=json") == ("run-split e1 2", {"format": "json"})
+    with pytest.raises(ValueError):
+        parse_connection_options("run e1 format=xml")
+    with pytest.raises(ValueError):
+        parse_connection_options("run e1 color=red")
+
+
+async def test_structured_output_sends_info_as_json(wrapper_dir):
+    on_go = ["info depth 5 score cp 80 nodes 1000 pv 7g7f 3c3d", "bestmove 7g7f"]
+    write_engines_json(wrapper_dir, fake_engine_def(write_fake_engine(wrapper_dir, on_go=on_go)))
+
+    # info は JSON フレームになり、それ以外の行はそのまま届く
+    replies = await request(["run e1 format=json", "go", "quit"], None)
+    assert json.loads(replies[0]) == {"info": {"depth": 5, "score": {"cp": 80}, "nodes": 1000, "pv": ["7g7f", "3c3d"]}}
+    assert replies[1] == b"bestmove 7g7f\n"
+    # 既定は従来どおりの USI 行
+    replies = await request(["run e1", "go", "quit"], None)
+    assert replies[0] == b"info depth 5 score cp 80 nodes 1000 pv 7g7f 3c3d\n"
+
+
+async def test_network_time_margin_adjusts_go(wrapper_dir, monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "NETWORK_TIME_MARGIN_MS", 150)
+    # 受け取った go をそのまま info string で返すエンジン
+    engine_path = write_fake_engine(wrapper_dir, on_go=["info string $command", "bestmove 7g7f"])
+    write_engines_json(wrapper_dir, fake_engine_def(engine_path))
+
+    # 対局の go は余裕分だけ短くしてエンジンへ送り、検討の go はそのまま送る
+    replies = await request(["run e1", "position startpos", "go btime 0 wtime 0 byoyomi 1000", "go infinite", "quit"], None)
+    assert replies[0] == b"info string go btime 0 wtime 0 byoyomi 850\n"
+    assert replies[2] == b"info string go infinite\n"
+
+    # server.ts から届くブラウザとの RTT はエンジンへ送らず、差し引く時間に加える
+    replies = await request(["run e1", "client_rtt 300.0", "position startpos", "go btime 0 wtime 0 byoyomi 1000", "quit"], None)
+    assert replies == [b"info string go btime 0 wtime 0 byoyomi 550\n", b"bestmove 7g7f\n"]
+
+
+async def test_session_transcript_records_both_directions(wrapper_dir):
+    engine_lines = ["info depth 5 score cp 80 nodes 1000 pv 7g7f 3c3d", "bestmove 7g7f"]
+    write_engines_json(wrapper_dir, fake_engine_def(write_fake_engine(wrapper_dir, on_go=engine_lines)))
+
+    start_transcript_writer(str(wrapper_dir / "transcripts"), 10)
+    try:
+        # 構造化出力でも、記録されるのはクライアントのコマンドとエンジンの出力そのもの
+        await request(["run e1 format=json", "position startpos", "go", "quit"], None)
+    finally:
+        stop_transcript_writer()
+    (path,) = (wrapper_dir / "transcripts").glob("*-e1.usi.gz")
+    header, entries = read_transcript(path)
+    assert header["format"] == "json"
+    assert [line for _, direction, line in entries if direction == ">"] == ["position startpos", "go", "quit"]
+    assert [line for _, direction, line in entries if direction == "<"] == engine_lines
+
+
+async def test_search_health_profile(wrapper_dir, monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "SEARCH_HEALTH", True)
+    monkeypatch.setattr(search_health, "SEARCH_PROFILES", {})
+    monkeypatch.setattr(engine_wrapper, "SEARCH_PROFILES", search_health.SEARCH_PROFILES)
+    on_go = ["info depth 12 time 2000 nodes 2000000 nps 1000000 hashfull 420 pv 7g7f", "bestmove 7g7f"]
+    write_engines_json(wrapper_dir, fake_engine_def(write_fake_engine(wrapper_dir, on_go=on_go)))
+
+    # info 行の hashfull/nps がエンジンごとのプロファイルに集計される
+    await request(["run e1", "go", "quit"], None)
+    reply = await engine_wrapper.admin_health([])
+    assert reply["enabled"] is True
+    assert reply["health"]["e1"]["hashfull_p50"] == 420 and reply["health"]["e1"]["nps_recent"] == 1_000_000
+
+
+async def test_compressed_session_output(wrapper_dir, monkeypatch):
+    monkeypatch.setenv("WRAPPER_ACCESS_TOKEN", "secret")
+    on_go = [f"info depth {i} multipv 1 pv 7g7f 3c3d 2g2f 8c8d" for i in range(50)] + ["bestmove 7g7f"]
+    write_engines_json(wrapper_dir, fake_engine_def(write_fake_engine(wrapper_dir, on_go=on_go)))
+
+    # auth_ok までは平文で、run 行以降の出力はすべて 1 本の zlib ストリームになる
+    reader, writer, handler = await connect_wrapper("secret")
+    writer.write(b"run e1 compress=zlib\ngo\nquit\n")
+    compressed = await reader.read()
+    await handler
+    writer.close()
+    lines = zlib.decompressobj().decompress(compressed).decode().splitlines()
+    assert len(lines) == 51 and lines[-1] == "bestmove 7g7f"
+    assert len(compressed) < sum(len(line) + 1 for line in lines) / 2
+
+
+def test_engine_list_delta():
+    a = {"id": "a", "name": "A"}
+    b = {"id": "b", "name": "B"}
+    assert engine_list_delta([a, b], [a, b]) is None
+    assert engine_list_delta([a], [a, b]) == {"added": [b], "changed": [], "removed": [], "order": ["a", "b"]}
+    renamed = {"id": "a", "name": "A2"}
+    assert engine_list_delta([a, b], [renamed]) == {"added": [], "changed": [renamed], "removed": ["b"], "order": ["a"]}
+    # 並べ替えだけでも通知する
+    assert engine_list_delta([a, b], [b, a])["order"] == ["b", "a"]
+
+
+async def test_watch_pushes_engine_list_changes(wrapper_dir, monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "ENGINE_LIST_POLL_INTERVAL", 0.02)
+    monkeypatch.setattr(engine_wrapper, "ENGINE_LIST_WATCH", engine_wrapper.EngineListWatch())
+    write_engines_json(wrapper_dir, {"id": "a", "name": "A"})
+
+    reader, writer, handler = await connect_wrapper(None)
+    writer.write(b"watch\n")
+    assert json.loads(await reader.readline()) == [{"id": "a", "name": "A"}]
+
+    # 設定エディタでの保存を模して書き換える (同じ秒内でも検出できるよう mtime をずらす)
+    write_engines_json(wrapper_dir, {"id": "a", "name": "A"}, {"id": "b", "name": "B"})
+    os.utime(wrapper_dir / "engines.json", ns=(0, 10**9))
+    delta = json.loads(await asyncio.wait_for(reader.readline(), 5))
+    assert delta == {"added": [{"id": "b", "name": "B"}], "changed": [], "removed": [], "order": ["a", "b"]}
+
+    # クライアントが切断するとポーリングも止まる
+    writer.close()
+    await asyncio.wait_for(handler, 5)
+    assert engine_wrapper.ENGINE_LIST_WATCH.task is None
+
+
+async def test_session_ticket_resume(wrapper_dir, monkeypatch):
+    monkeypatch.setenv("WRAPPER_ACCESS_TOKEN", "secret")
+    write_engines_json(wrapper_dir)
+
+    # 通常の認証でチケットを受け取る
+    reader, writer, handler = await connect_wrapper(None)
+    nonce = (await reader.readline()).decode().split()[1]
+    writer.write(f"auth {hmac.new(b'secret', nonce.encode(), hashlib.sha256).hexdigest()} ticket\nlist\n".encode())
+    reply, ticket = (await reader.readline()).decode().split()
+    assert reply == "auth_ok" and await reader.readline() == b"[]\n"
+    await handler
+
+    # ノンスを待たずにチケットと最初のコマンドを送る (1 往復)
+    reader, writer, handler = await connect_wrapper(None)
+    resume = f"resume {ticket} {ticket_proof('secret', ticket)} list\n".encode()
+    writer.write(resume)
+    assert (await reader.readline()).startswith(b"auth_cram_sha256 ")
+    reply, next_ticket = (await reader.readline()).decode().split()
+    assert reply == "auth_ok" and next_ticket != ticket
+    assert await reader.readline() == b"[]\n"
+    await handler
+
+    # 使用済みチケットの再送はチャレンジレスポンスに戻り、resume のコマンドが実行される
+    reader, writer, handler = await connect_wrapper(None)
+    writer.write(resume)
+    nonce = (await reader.readline()).decode().split()[1]
+    assert await reader.readline() == b"auth_ticket_rejected\n"
+    writer.write(f"auth {hmac.new(b'secret', nonce.encode(), hashlib.sha256).hexdigest()}\n".encode())
+    assert await reader.readline() == b"auth_ok\n"
+    assert await reader.readline() == b"[]\n"
+    await handler
+
+
+def test_session_ticket_single_use_across_workers(monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "run", lambda coro: coro.close())
+    monkeypatch.setattr(logging.getLogger(), "handlers", [])
+    for name in ["SESSION_COUNTER", "DRAIN", "LATENCY_TRACE_FILE", "TICKETS"]:
+        monkeypatch.setattr(engine_wrapper, name, getattr(engine_wrapper, name))
+    supervisor = engine_wrapper.TICKETS
+    context = multiprocessing.get_context()
+    shared_sessions, shared_drain = context.Array("i", 2), context.Value("b", 0)
+
+    # fork 直後の状態から各ワーカーを初期化する
+    workers = []
+    for index in range(2):
+        engine_wrapper.TICKETS = supervisor
+        engine_wrapper.worker_main(index, shared_sessions, shared_drain)
+        workers.append(engine_wrapper.TICKETS)
+    assert supervisor not in workers and workers[0] is not workers[1]
+
+    # あるワーカーで使ったチケットは、別のワーカーでも再利用できない
+    ticket = workers[0].issue()
+    proof = ticket_proof("secret", ticket)
+    assert workers[0].redeem(ticket, proof, "secret") is None
+    assert workers[1].redeem(ticket, proof, "secret") == "unknown"
+    assert workers[0].redeem(ticket, proof, "secret") == "already used"
+
+
+def test_connection_guard_limits(monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "CONN_RATE_LIMIT", 3)
+    monkeypatch.setattr(engine_wrapper, "MAX_HANDSHAKES", 4)
+    guard = engine_wrapper.ConnectionGuard()
+    # IP ごとの接続レート制限 (Unix ソケットは対象外)
+    assert [guard.admit("10.0.0.1") for _ in range(4)] == [None, None, None, "more than 3 connections in 10s"]
+    assert guard.admit("10.0.0.2") is None
+    # ハンドシェイク中の接続数の上限
+    assert guard.admit(None) == "4 handshakes in progress"
+    guard.handshake_done()
+    assert guard.admit(None) is None
+    counters = guard.to_dict()
+    assert counters["accepted"] == 5 and counters["rejected_rate"] == 1 and counters["rejected_handshakes"] == 1
+    assert counters["handshakes_in_progress"] == 4 and counters["tracked_ips"] == 2
+
+    # 同じマシンの server.ts (ループバック) はレート制限の対象外
+    local = engine_wrapper.ConnectionGuard()
+    for ip in ["127.0.0.1", "::1", "::ffff:127.0.0.1"]:
+        for _ in range(4):
+            assert local.admit(ip) is None
+            local.handshake_done()
+    assert local.to_dict()["tracked_ips"] == 0
+
+
+async def test_handshake_timeout(monkeypatch):
+    monkeypatch.setattr(engine_wrapper, "HANDSHAKE_TIMEOUT", 0.1)
+    monkeypatch.setattr(engine_wrapper, "CONNECTION_GUARD", engine_wrapper.ConnectionGuard())
+    monkeypatch.setenv("WRAPPER_ACCESS_TOKEN", "secret")
+
+    # 認証応答を送らないクライアントは時間切れで切断される
+    reader, writer, handler = await connect_wrapper(None)
+    assert (await reader.readline()).startswith(b"auth_cram_sha256 ")
+    assert await asyncio.wait_for(reader.readline(), 5) == b"WRAPPER_ERROR: Handshake timed out.\n"
+    await handler
+    writer.close()
+    counters = engine_wrapper.CONNECTION_GUARD.to_dict()
+    assert counters["handshake_timeouts"] == 1 and counters["handshakes_in_progress"] == 0
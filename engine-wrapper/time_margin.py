@@ -0,0 +1,219 @@
+"""
+Network time margin for timed 'go' commands (game mode).
+
+The game clock runs on the client side, so the time between the client sending 'go' and
+receiving 'bestmove' is the engine's thinking time plus the network. With
+NETWORK_TIME_MARGIN_MS > 0 the wrapper samples the RTT of the client connection on every
+command (the kernel's smoothed RTT from TCP_INFO, Linux only; no probes are sent) and
+lowers the time controls of forwarded 'go' commands by p99 RTT + the margin:
+
+- 'byoyomi' when it is given (not below MIN_BYOYOMI_MS),
+- otherwise the remaining time of the side to move ('btime'/'wtime', not below 0).
+
+That RTT only covers the wrapper-to-client hop, i.e. wrapper to shogihome server, which
+is about 0 when the two share one machine. The hop from the shogihome server to the browser
+is measured by server.ts with websocket pings and reported to the wrapper as
+'client_rtt <ms>' lines (not forwarded to the engine); the p99 of those samples is added to
+the deduction. The margin is meant for the rest (event loop delays, clock rounding).
+'go infinite' and 'go mate' are not changed.
+At each 'bestmove' of an adjusted search, the time left of the original budget is logged.
+"""
+
+import socket
+import struct
+import sys
+import time
+from collections import deque
+
+# Offset of tcpi_rtt / tcpi_rttvar (microseconds) in struct tcp_info on Linux
+TCP_INFO_RTT_OFFSET = 68
+TCP_INFO_SIZE = 104
+# A byoyomi is never lowered below this (milliseconds)
+MIN_BYOYOMI_MS = 100
+# Number of RTT samples the p99 is taken from
+RTT_WINDOW = 256
+# Line server.ts sends with the RTT it measured to the browser (not a USI command)
+CLIENT_RTT_COMMAND = "client_rtt"
+
+
+def tcp_rtt_ms(sock) -> float | None:
+    """Smoothed RTT of a TCP socket as measured by the kernel, or None where it is not available."""
+    if sock is None or sys.platform != "linux" or not hasattr(socket, "TCP_INFO"):
+        return None
+    if sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return None
+    try:
+        raw = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_SIZE)
+    except OSError:
+        return None
+    if len(raw) < TCP_INFO_RTT_OFFSET + 4:
+        return None
+    return struct.unpack_from("I", raw, TCP_INFO_RTT_OFFSET)[0] / 1000
+
+
+def parse_client_rtt(command: str) -> float | None:
+    """Milliseconds of a 'client_rtt <ms>' line, None if it is malformed."""
+    tokens = command.split()
+    if len(tokens) != 2:
+        return None
+    try:
+        rtt = float(tokens[1])
+    except ValueError:
+        return None
+    return rtt if 0 <= rtt < 60_000 else None
+
+
+def p99(samples) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+def side_to_move(position_command: str) -> str | None:
+    """'b' or 'w' after a 'position' command, None if it cannot be told."""
+    tokens = position_command.split()
+    if len(tokens) < 2:
+        return None
+    moves = len(tokens) - tokens.index("moves") - 1 if "moves" in tokens else 0
+    if tokens[1] == "startpos":
+        side = "b"
+    elif tokens[1] == "sfen" and len(tokens) > 3 and tokens[3] in ("b", "w"):
+        side = tokens[3]
+    else:
+        return None
+    if moves % 2:
+        side = "w" if side == "b" else "b"
+    return side
+
+
+def go_time_controls(tokens: list) -> dict:
+    """Integer time controls of a tokenized 'go' command."""
+    controls = {}
+    for name in ("btime", "wtime", "byoyomi", "binc", "winc"):
+        if name in tokens:
+            i = tokens.index(name)
+            try:
+                controls[name] = int(tokens[i + 1])
+            except (IndexError, ValueError):
+                pass
+    return controls
+
+
+def adjust_go(command: str, deduction_ms: int, side: str | None) -> tuple[str, dict | None]:
+    """
+    Lower the time controls of a 'go' command by deduction_ms.
+    Returns the command to forward and the budget of the move (None if nothing was changed).
+    """
+    tokens = command.split()
+    if "infinite" in tokens or "mate" in tokens:
+        return command, None
+    controls = go_time_controls(tokens)
+    if not controls or deduction_ms <= 0:
+        return command, None
+
+    own_time = controls.get(f"{side}time", 0) if side else 0
+    own_inc = controls.get(f"{side}inc", 0) if side else 0
+    budget = own_time + own_inc + controls.get("byoyomi", 0)
+    if controls.get("byoyomi", 0) > 0:
+        byoyomi = controls["byoyomi"]
+        targets = {"byoyomi": max(min(byoyomi, MIN_BYOYOMI_MS), byoyomi - deduction_ms)}
+    elif side:
+        targets = {f"{side}time": max(0, own_time - deduction_ms)} if f"{side}time" in controls else {}
+    else:
+        # Unknown side to move: lower both clocks
+        targets = {name: max(0, controls[name] - deduction_ms) for name in ("btime", "wtime") if name in controls}
+    if not targets:
+        return command, None
+
+    for name, value in targets.items():
+        tokens[tokens.index(name) + 1] = str(value)
+    deducted = sum(controls[name] - value for name, value in targets.items())
+    if not deducted:
+        return command, None
+    changes = ", ".join(f"{name} {controls[name]} -> {value}" for name, value in targets.items())
+    return " ".join(tokens), {"budget": budget, "deducted": deducted, "changes": changes}
+
+
+class NetworkTimeKeeper:
+    """Client RTT samples and 'go' adjustments of one session."""
+
+    def __init__(self, margin_ms: float):
+        self.margin_ms = margin_ms
+        self.rtt_samples = deque(maxlen=RTT_WINDOW)
+        # Browser to shogihome server, reported by server.ts
+        self.client_rtt_samples = deque(maxlen=RTT_WINDOW)
+        self.side = None
+        # The adjusted search waiting for 'bestmove'
+        self.pending = None
+        self.adjusted = 0
+        self.deducted_ms = 0
+        self.closest_ms = None
+        self.late = 0
+
+    def sample(self, sock):
+        rtt = tcp_rtt_ms(sock)
+        if rtt is not None:
+            self.rtt_samples.append(rtt)
+
+    def report_client_rtt(self, command: str) -> bool:
+        """Record a 'client_rtt <ms>' line from server.ts. False if it is malformed."""
+        rtt = parse_client_rtt(command)
+        if rtt is None:
+            return False
+        self.client_rtt_samples.append(rtt)
+        return True
+
+    def rtt_p99(self) -> float:
+        """p99 RTT of the whole path to the browser: wrapper to server plus server to browser."""
+        return p99(self.rtt_samples) + p99(self.client_rtt_samples)
+
+    def on_client_command(self, command: str) -> str:
+        """Returns the command to forward to the engine."""
+        name = command.split(maxsplit=1)[0] if command else ""
+        if name == "position":
+            self.side = side_to_move(command)
+        elif name == "ponderhit" and self.pending:
+            self.pending["started"] = time.monotonic()
+        elif name == "go":
+            rtt = self.rtt_p99()
+            command, budget = adjust_go(command, round(rtt + self.margin_ms), self.side)
+            self.pending = None
+            if budget:
+                self.adjusted += 1
+                self.deducted_ms += budget["deducted"]
+                # A ponder search is timed from 'ponderhit'
+                started = None if "ponder" in command.split() else time.monotonic()
+                self.pending = {**budget, "rtt": rtt, "started": started}
+        return command
+
+    def on_bestmove(self) -> str | None:
+        """Log message for the search that just ended, if it was adjusted."""
+        pending, self.pending = self.pending, None
+        if not pending or pending["started"] is None:
+            return None
+        elapsed = (time.monotonic() - pending["started"]) * 1000
+        left = pending["budget"] - elapsed - pending["rtt"]
+        if self.closest_ms is None or left < self.closest_ms:
+            self.closest_ms = left
+        if left < 0:
+            self.late += 1
+        return (
+            f"{pending['changes']} (p99 RTT {pending['rtt']:.1f} ms + margin {self.margin_ms:g} ms); "
+            f"bestmove after {elapsed:.0f} ms, {left:+.0f} ms of the original budget left after the network"
+        )
+
+    def summary(self) -> str:
+        closest = f"{self.closest_ms:+.0f} ms" if self.closest_ms is not None else "-"
+        return (
+            f"{self.adjusted} 'go' adjusted, {self.deducted_ms} ms deducted in total, p99 RTT {self.rtt_p99():.1f} ms, "
+            f"closest {closest}, over the original budget {self.late} times"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "rtt_p99_ms": round(self.rtt_p99(), 2),
+            "client_rtt_p99_ms": round(p99(self.client_rtt_samples), 2),
+            "go_adjusted": self.adjusted,
+            "go_deducted_ms": self.deducted_ms,
+        }
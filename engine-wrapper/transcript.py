@@ -0,0 +1,156 @@
+"""
+Session transcripts (SESSION_TRANSCRIPTS=true).
+
+Every engine session is written to its own gzip file in TRANSCRIPT_DIR, one line per
+USI line with the milliseconds since the session started and the direction:
+
+    #{"version": 1, "engine": "e1", "format": "usi", "peer": "...", "started": "..."}
+    0	>	usi
+    12	<	id name Engine
+    12	<	usiok
+
+'>' is a command as received from the client (before the wrapper rewrites it), '<' a
+line of engine output as read from the engine (before it is converted for the client).
+Lines are queued to one background thread that compresses and writes them, so the
+relay never waits for zlib or the disk. Only the newest TRANSCRIPT_KEEP files are kept.
+
+scripts/replay_transcript.py replays a transcript against the wrapper, with
+scripts/replay_engine.py playing the recorded engine side.
+"""
+
+import gzip
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+TRANSCRIPT_SUFFIX = ".usi.gz"
+TRANSCRIPT_VERSION = 1
+CLIENT = ">"
+ENGINE = "<"
+
+_writer = None
+
+
+class TranscriptWriter:
+    """Background thread that owns the open transcript files."""
+
+    def __init__(self, directory: Path, keep: int):
+        self.directory = directory
+        self.keep = keep
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name="transcript-writer", daemon=True)
+
+    def run(self):
+        files = {}
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, text = item
+            try:
+                if text is None:
+                    file = files.pop(path, None)
+                    if file:
+                        file.close()
+                    continue
+                file = files.get(path)
+                if file is None:
+                    self.prune()
+                    file = files[path] = gzip.open(path, "wt", encoding="utf-8")
+                file.write(text + "\n")
+            except OSError as e:
+                logging.warning(f"Failed to write transcript {path.name}: {e}")
+        for file in files.values():
+            file.close()
+
+    def prune(self):
+        """Delete the oldest transcripts so that a new one keeps the directory at TRANSCRIPT_KEEP files."""
+        if self.keep <= 0:
+            return
+        # File names start with the start time, so they sort chronologically
+        paths = sorted(self.directory.glob(f"*{TRANSCRIPT_SUFFIX}"))
+        for path in paths[: max(0, len(paths) - self.keep + 1)]:
+            path.unlink(missing_ok=True)
+
+
+def start_transcript_writer(directory: str, keep: int):
+    global _writer
+    if _writer:
+        return
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    _writer = TranscriptWriter(path, keep)
+    _writer.thread.start()
+    logging.info(f"Session transcripts enabled: {path}")
+
+
+def stop_transcript_writer():
+    """Write the pending lines and close the files."""
+    global _writer
+    if not _writer:
+        return
+    _writer.queue.put(None)
+    _writer.thread.join()
+    _writer = None
+
+
+def transcripts_enabled() -> bool:
+    return _writer is not None
+
+
+class SessionTranscript:
+    """Transcript of one engine session."""
+
+    def __init__(self, session_id: str, engine_id: str, peername, output_format: str = "usi"):
+        self.started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        safe_id = re.sub(r"[^\w.-]", "_", engine_id)
+        self.path = _writer.directory / f"{now:%Y%m%d-%H%M%S}-{session_id}-{safe_id}{TRANSCRIPT_SUFFIX}"
+        header = {
+            "version": TRANSCRIPT_VERSION,
+            "engine": engine_id,
+            "format": output_format,
+            "peer": str(peername),
+            "started": now.isoformat(timespec="seconds"),
+        }
+        self._put("#" + json.dumps(header))
+
+    def _put(self, text: str | None):
+        if _writer:
+            _writer.queue.put((self.path, text))
+
+    def _record(self, direction: str, line: str):
+        self._put(f"{round((time.monotonic() - self.started) * 1000)}\t{direction}\t{line}")
+
+    def client(self, command: str):
+        self._record(CLIENT, command)
+
+    def engine(self, line: str):
+        self._record(ENGINE, line)
+
+    def close(self):
+        self._put(None)
+
+
+def read_transcript(path) -> tuple[dict, list]:
+    """Returns the header and a list of (milliseconds, direction, line)."""
+    header = {}
+    entries = []
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        try:
+            for text in file:
+                text = text.rstrip("\n")
+                if text.startswith("#"):
+                    header = json.loads(text[1:])
+                    continue
+                ms, direction, line = text.split("\t", 2)
+                entries.append((int(ms), direction, line))
+        except EOFError:
+            # The wrapper was killed before the file was closed
+            pass
+    return header, entries
@@ -0,0 +1,90 @@
+"""
+Tokenizer and parsers for USI engine output.
+
+iter_fields() walks a line once and splits it into keyword fields. It is shared by the
+'option' parser of the config editor and by the 'info' parser used for structured output
+('run <id> format=json'), where the wrapper parses each 'info' line once so that the
+clients do not have to.
+"""
+
+import json
+import re
+
+_TOKEN = re.compile(r"\S+")
+
+OPTION_KEYWORDS = frozenset({"name", "type", "default", "min", "max", "var"})
+INFO_KEYWORDS = frozenset({"depth", "seldepth", "time", "nodes", "pv", "multipv", "score", "currmove", "hashfull", "nps"})
+INFO_INT_FIELDS = frozenset({"depth", "seldepth", "time", "nodes", "multipv", "hashfull", "nps"})
+
+# Output formats of a connection: raw USI lines (default) or 'info' lines as JSON frames
+OUTPUT_FORMATS = ("usi", "json")
+
+
+def iter_fields(line: str, keywords: frozenset, rest_keyword: str | None = None):
+    """
+    Yield (keyword, values) for each keyword of a line, values being the tokens up to the
+    next keyword. Tokens before the first keyword are skipped. `rest_keyword` takes the
+    rest of the line verbatim as its only value (e.g. 'info string').
+    """
+    keyword = None
+    values = []
+    for match in _TOKEN.finditer(line):
+        token = match.group()
+        if token == rest_keyword:
+            if keyword is not None:
+                yield keyword, values
+            yield token, [line[match.end() :].strip()]
+            return
+        if token in keywords:
+            if keyword is not None:
+                yield keyword, values
+            keyword, values = token, []
+        elif keyword is not None:
+            values.append(token)
+    if keyword is not None:
+        yield keyword, values
+
+
+def parse_score(values: list) -> dict | None:
+    """'cp 120', 'mate 5', 'mate -3', 'mate +' (distance unknown), optionally followed by 'lowerbound'/'upperbound'."""
+    if len(values) < 2 or values[0] not in ("cp", "mate"):
+        return None
+    kind, value = values[0], values[1]
+    if kind == "mate" and value in ("+", "-"):
+        score = {"mate": value}
+    else:
+        try:
+            score = {kind: int(value)}
+        except ValueError:
+            return None
+    if "lowerbound" in values[2:]:
+        score["bound"] = "lower"
+    elif "upperbound" in values[2:]:
+        score["bound"] = "upper"
+    return score
+
+
+def parse_info(line: str) -> dict:
+    """Parse a USI 'info' line into typed fields. Malformed fields are left out."""
+    info = {}
+    for keyword, values in iter_fields(line, INFO_KEYWORDS, "string"):
+        if keyword in INFO_INT_FIELDS:
+            try:
+                info[keyword] = int(values[0])
+            except (IndexError, ValueError):
+                pass
+        elif keyword == "score":
+            score = parse_score(values)
+            if score:
+                info["score"] = score
+        elif keyword == "pv":
+            info["pv"] = values
+        elif values:
+            # currmove, string
+            info[keyword] = values[0]
+    return info
+
+
+def info_frame(line: str) -> bytes:
+    """One compact JSON line for a USI 'info' line."""
+    return json.dumps({"info": parse_info(line)}, separators=(",", ":")).encode() + b"\n"
@@ -6,6 +6,8 @@ import { WebSocketServer, WebSocket } from "ws";
 import path from "path";
 import { fileURLToPath } from "url";
 import readline from "readline";
+import zlib from "zlib";
+import { PassThrough } from "stream";
 import dotenv from "dotenv";
 import helmet from "helmet";
 import rateLimit from "express-rate-limit";
@@ -214,6 +216,74 @@ const wss = new WebSocketServer({
 
 const REMOTE_ENGINE_HOST = process.env.REMOTE_ENGINE_HOST || "localhost";
 const REMOTE_ENGINE_PORT = parseInt(process.env.REMOTE_ENGINE_PORT || "4082", 10);
+// Unix domain socket of a co-located engine-wrapper (LISTEN_UNIX). Takes precedence over host/port.
+const REMOTE_ENGINE_SOCKET = process.env.REMOTE_ENGINE_SOCKET || "";
+const REMOTE_ENGINE_ADDRESS = REMOTE_ENGINE_SOCKET || `${REMOTE_ENGINE_HOST}:${REMOTE_ENGINE_PORT}`;
+
+// WRAPPER_OUTPUT_FORMAT=json asks the wrapper for pre-parsed 'info' frames (format=json).
+// The default keeps the raw USI lines.
+const WRAPPER_OUTPUT_FORMAT = process.env.WRAPPER_OUTPUT_FORMAT === "json" ? "json" : "usi";
+// WRAPPER_COMPRESS=zlib asks the wrapper to compress its output (compress=zlib), for a wrapper on
+// another host. Off by default: on the same host it costs CPU and saves nothing.
+const WRAPPER_COMPRESS = process.env.WRAPPER_COMPRESS === "zlib";
+const WRAPPER_RUN_OPTIONS =
+  (WRAPPER_OUTPUT_FORMAT === "json" ? " format=json" : "") +
+  (WRAPPER_COMPRESS ? " compress=zlib" : "");
+
+/**
+ * Output of a wrapper connection that uses compress=zlib. The wrapper compresses everything it
+ * sends after the 'run' command, which is everything after 'auth_ok' when authentication is used.
+ * The lines up to 'auth_ok' are passed through as they are and the rest is inflated. The wrapper
+ * ends each line with a sync flush, so every complete line comes out as soon as it is received.
+ */
+function inflateWrapperOutput(socket: net.Socket, authenticated: boolean): NodeJS.ReadableStream {
+  const output = new PassThrough();
+  const inflate = zlib.createInflate({ finishFlush: zlib.constants.Z_SYNC_FLUSH });
+  inflate.on("error", (err) => {
+    console.error("Failed to inflate wrapper output:", err);
+    socket.destroy();
+  });
+  inflate.pipe(output);
+  // Plain text received before 'auth_ok' (null once the compressed stream has started)
+  let plain: Buffer | null = authenticated ? Buffer.alloc(0) : null;
+  socket.on("data", (chunk: Buffer) => {
+    if (plain === null) {
+      inflate.write(chunk);
+      return;
+    }
+    plain = Buffer.concat([plain, chunk]);
+    let start = 0;
+    for (let end = plain.indexOf(0x0a); end !== -1; end = plain.indexOf(0x0a, start)) {
+      const line = plain.subarray(start, end + 1);
+      start = end + 1;
+      output.write(line);
+      if (line.toString().startsWith("auth_ok")) {
+        const rest = plain.subarray(start);
+        plain = null;
+        if (rest.length > 0) inflate.write(rest);
+        return;
+      }
+    }
+    plain = plain.subarray(start);
+  });
+  socket.on("end", () => inflate.end());
+  return output;
+}
+
+function connectToWrapper(socket: net.Socket) {
+  if (REMOTE_ENGINE_SOCKET) {
+    socket.connect(REMOTE_ENGINE_SOCKET);
+  } else {
+    socket.connect(REMOTE_ENGINE_PORT, REMOTE_ENGINE_HOST);
+  }
+}
+// Interval of the websocket pings that measure the RTT to the browser (0 disables them). Each
+// result is sent to the wrapper as 'client_rtt <ms>', which adds it to the network time margin of
+// timed 'go' commands (NETWORK_TIME_MARGIN_MS); the wrapper never forwards it to the engine.
+const CLIENT_RTT_PROBE_INTERVAL = parseInt(process.env.CLIENT_RTT_PROBE_INTERVAL_MS || "2000", 10);
+// Payload prefix that tells an RTT probe pong from a keep-alive pong
+const CLIENT_RTT_PROBE_PREFIX = "rtt:";
+
 const CONNECTION_PROTECTION_TIMEOUT =
   parseInt(process.env.ENGINE_CONNECTION_PROTECTION_TIMEOUT || "60", 10) * 1000;
 
@@ -514,24 +584,61 @@ type EngineHandle = {
   removeAllListeners: (event?: string) => void;
 };
 
+// A USI 'info' line parsed by the wrapper (format=json), forwarded to the browser as `infoFrame`
+type WrapperInfoFrame = Record<string, unknown>;
+
+// Search info messages are thinned out while the browser is disconnected
+function isSearchInfoMessage(data: unknown): boolean {
+  if (typeof data !== "object" || data === null) return false;
+  if ("infoFrame" in data) return true;
+  return "info" in data && (data as { info: string }).info.startsWith("info");
+}
+
 // Custom type for WebSocket with isAlive property
 interface ExtendedWebSocket extends WebSocket {
   isAlive?: boolean;
 }
 
+// Single-use session tickets issued by the wrapper. A ticket lets the next connection send its
+// first command together with the authentication (one round trip instead of two).
+const wrapperTickets: string[] = [];
+const MAX_WRAPPER_TICKETS = 8;
+
+/**
+ * Authenticate with the wrapper. When `firstCommand` is given it has been sent to the wrapper
+ * once the promise resolves (with a session ticket, already together with the authentication).
+ * `input` replaces the socket as the source of lines (see inflateWrapperOutput()).
+ */
 async function authenticateSocket(
   socket: net.Socket,
   accessToken: string,
+  firstCommand?: string,
+  input: NodeJS.ReadableStream = socket,
 ): Promise<readline.Interface> {
   return new Promise((resolve, reject) => {
-    const rl = readline.createInterface({ input: socket });
+    const rl = readline.createInterface({ input });
+    const hmac = (message: string) =>
+      crypto.createHmac("sha256", accessToken).update(message).digest("hex");
+    const ticket = firstCommand ? wrapperTickets.pop() : undefined;
+    let nonce: string | null = null;
+    if (ticket) {
+      socket.write(`resume ${ticket} ${hmac(ticket)} ${firstCommand}\n`);
+    }
     const onLine = (line: string) => {
       const msg = line.trim();
       if (msg.startsWith("auth_cram_sha256 ")) {
-        const nonce = msg.substring("auth_cram_sha256 ".length).trim();
-        const digest = crypto.createHmac("sha256", accessToken).update(nonce).digest("hex");
-        socket.write(`auth ${digest}\n`);
-      } else if (msg === "auth_ok") {
+        nonce = msg.substring("auth_cram_sha256 ".length).trim();
+        if (!ticket) socket.write(`auth ${hmac(nonce)} ticket\n`);
+      } else if (msg === "auth_ticket_rejected" && nonce) {
+        // The wrapper still runs the command of the resume line
+        socket.write(`auth ${hmac(nonce)} ticket\n`);
+      } else if (msg === "auth_ok" || msg.startsWith("auth_ok ")) {
+        const newTicket = msg.substring("auth_ok".length).trim();
+        if (newTicket) {
+          wrapperTickets.push(newTicket);
+          if (wrapperTickets.length > MAX_WRAPPER_TICKETS) wrapperTickets.shift();
+        }
+        if (firstCommand && !ticket) socket.write(`${firstCommand}\n`);
         rl.off("line", onLine);
         resolve(rl);
       } else if (msg.includes("WRAPPER_ERROR:")) {
@@ -600,6 +707,7 @@ class EngineSession {
 
     ws.on("message", (message) => this.handleMessage(message.toString()));
     ws.on("close", () => this.handleDisconnect(ws));
+    ws.on("pong", (data) => this.handleClientPong(ws, data));
 
     // Send initial state to client
     this.sendState();
@@ -637,6 +745,29 @@ class EngineSession {
     this.sendToClient({ state: stateStr });
   }
 
+  /** Pings the browser with a timestamp while an engine is connected (see handleClientPong). */
+  probeClientRtt() {
+    if (!this.ws || this.ws.readyState !== WebSocket.OPEN || !this.engineHandle) {
+      return;
+    }
+    this.ws.ping(`${CLIENT_RTT_PROBE_PREFIX}${performance.now().toFixed(3)}`);
+  }
+
+  private handleClientPong(socket: ExtendedWebSocket, data: Buffer) {
+    const payload = data.toString();
+    if (this.ws !== socket || !payload.startsWith(CLIENT_RTT_PROBE_PREFIX)) {
+      return;
+    }
+    const rtt = performance.now() - Number(payload.slice(CLIENT_RTT_PROBE_PREFIX.length));
+    if (!Number.isFinite(rtt) || rtt < 0) {
+      return;
+    }
+    if (this.engineHandle && this.engineState !== EngineState.TERMINATING) {
+      // Not a USI command: consumed by the wrapper's network time margin
+      this.engineHandle.write(`client_rtt ${rtt.toFixed(1)}\n`);
+    }
+  }
+
   private handleDisconnect(socket: ExtendedWebSocket) {
     if (this.ws !== socket) {
       console.log(`Ignoring disconnect for session ${this.sessionId} (socket replaced)`);
@@ -698,28 +829,13 @@ class EngineSession {
     } else {
       // Buffer messages during disconnection
       // For 'info' messages, we only keep the latest few to avoid memory issues
-      if (typeof data === "object" && data !== null && "info" in data) {
-        const info = (data as { info: string }).info;
-        if (info.startsWith("info")) {
-          // Keep only the last 10 info messages if disconnected
-          const infoCount = this.messageBuffer.filter(
-            (m) =>
-              typeof m.data === "object" &&
-              m.data !== null &&
-              "info" in m.data &&
-              (m.data as { info: string }).info.startsWith("info"),
-          ).length;
-          if (infoCount >= 10) {
-            const firstInfoIndex = this.messageBuffer.findIndex(
-              (m) =>
-                typeof m.data === "object" &&
-                m.data !== null &&
-                "info" in m.data &&
-                (m.data as { info: string }).info.startsWith("info"),
-            );
-            if (firstInfoIndex !== -1) {
-              this.messageBuffer.splice(firstInfoIndex, 1);
-            }
+      if (isSearchInfoMessage(data)) {
+        // Keep only the last 10 info messages if disconnected
+        const infoCount = this.messageBuffer.filter((m) => isSearchInfoMessage(m.data)).length;
+        if (infoCount >= 10) {
+          const firstInfoIndex = this.messageBuffer.findIndex((m) => isSearchInfoMessage(m.data));
+          if (firstInfoIndex !== -1) {
+            this.messageBuffer.splice(firstInfoIndex, 1);
           }
         }
       }
@@ -855,6 +971,19 @@ class EngineSession {
   private setupEngineHandlers(stream: NodeJS.ReadableStream, rl?: readline.Interface) {
     const interface_ = rl || readline.createInterface({ input: stream });
     interface_.on("line", (line) => {
+      if (line.startsWith("{")) {
+        // Pre-parsed 'info' line (format=json): passed on to the browser without re-parsing
+        let frame: { info?: WrapperInfoFrame } | null = null;
+        try {
+          frame = JSON.parse(line);
+        } catch {
+          console.warn(`Malformed info frame from wrapper (${this.sessionId}): ${line}`);
+        }
+        if (frame?.info) {
+          this.sendToClient({ sfen: this.pendingGoSfen, infoFrame: frame.info });
+        }
+        return;
+      }
       if (!line.startsWith("info")) {
         console.log(`Engine output (${this.sessionId}): ${line}`);
       }
@@ -962,7 +1091,7 @@ class EngineSession {
     this.engineState = EngineState.STARTING;
     this.currentEngineId = engineId;
 
-    console.log(`Connecting to remote engine at ${REMOTE_ENGINE_HOST}:${REMOTE_ENGINE_PORT}`);
+    console.log(`Connecting to remote engine at ${REMOTE_ENGINE_ADDRESS}`);
     const socket = new net.Socket();
     this.connectingSocket = socket;
 
@@ -980,9 +1109,11 @@ class EngineSession {
       console.log(`Connected to remote engine. Specifying engine ID: ${engineId}`);
 
       const accessToken = process.env.WRAPPER_ACCESS_TOKEN;
+      const input = WRAPPER_COMPRESS ? inflateWrapperOutput(socket, !!accessToken) : socket;
 
       const setup = (rl?: readline.Interface) => {
-        socket.write(`run ${engineId}\n`);
+        // With authentication, 'run' has been sent by authenticateSocket()
+        if (!rl) socket.write(`run ${engineId}${WRAPPER_RUN_OPTIONS}\n`);
 
         this.engineState = EngineState.WAITING_USIOK;
         this.engineHandle = {
@@ -992,7 +1123,7 @@ class EngineSession {
           off: (e, l) => socket.off(e, l),
           removeAllListeners: (e) => socket.removeAllListeners(e),
         };
-        this.setupEngineHandlers(socket, rl);
+        this.setupEngineHandlers(input, rl);
         this.engineHandle.on("close", () => this.onEngineClose());
         this.engineHandle.on("error", (err) => {
           console.error("Remote engine connection error:", err);
@@ -1004,7 +1135,12 @@ class EngineSession {
 
       if (accessToken) {
         try {
-          const rl = await authenticateSocket(socket, accessToken);
+          const rl = await authenticateSocket(
+            socket,
+            accessToken,
+            `run ${engineId}${WRAPPER_RUN_OPTIONS}`,
+            input,
+          );
           setup(rl);
         } catch (err: unknown) {
           const message = err instanceof Error ? err.message : String(err);
@@ -1032,7 +1168,7 @@ class EngineSession {
       }
     });
 
-    socket.connect(REMOTE_ENGINE_PORT, REMOTE_ENGINE_HOST);
+    connectToWrapper(socket);
   }
 
   private handleMessage(command: string) {
@@ -1198,12 +1334,100 @@ class SessionManager {
   removeSession(sessionId: string) {
     this.sessions.delete(sessionId);
   }
+
+  probeClientRtt() {
+    this.sessions.forEach((session) => session.probeClientRtt());
+  }
 }
 
 const sessionManager = new SessionManager();
 
+type EngineListEntry = { id: string } & Record<string, unknown>;
+type EngineListDelta = {
+  added: EngineListEntry[];
+  changed: EngineListEntry[];
+  removed: string[];
+  order: string[];
+};
+
+// Engine list kept up to date by a long-lived 'watch' connection to the wrapper, opened on the
+// first request. null while that connection is down; getEngineList() then asks with 'list'.
+let engineListCache: EngineListEntry[] | null = null;
+let engineListWatchStarted = false;
+let engineListWatchActive = false;
+const ENGINE_LIST_WATCH_RETRY_MS = 5000;
+
+function applyEngineListDelta(list: EngineListEntry[], delta: EngineListDelta): EngineListEntry[] {
+  const byId = new Map(list.map((engine) => [engine.id, engine]));
+  for (const id of delta.removed) byId.delete(id);
+  for (const engine of [...delta.added, ...delta.changed]) byId.set(engine.id, engine);
+  return delta.order
+    .map((id) => byId.get(id))
+    .filter((engine): engine is EngineListEntry => engine !== undefined);
+}
+
+const watchEngineList = () => {
+  const socket = new net.Socket();
+  const accessToken = process.env.WRAPPER_ACCESS_TOKEN;
+
+  socket.on("connect", async () => {
+    try {
+      const rl = accessToken
+        ? await authenticateSocket(socket, accessToken)
+        : readline.createInterface({ input: socket });
+      socket.write("watch\n");
+      rl.on("line", (line) => {
+        const str = line.trim();
+        if (str === "") return;
+        try {
+          const message = JSON.parse(str);
+          if (Array.isArray(message)) {
+            engineListCache = message;
+            if (!engineListWatchActive) console.log("Watching the engine list of the wrapper.");
+            engineListWatchActive = true;
+          } else if (engineListCache) {
+            engineListCache = applyEngineListDelta(engineListCache, message as EngineListDelta);
+            console.log("Engine list updated by the wrapper.");
+          }
+        } catch {
+          // e.g. WRAPPER_ERROR from a wrapper without 'watch'
+          console.warn(`Unexpected message on the engine list watch: ${str.substring(0, 100)}`);
+          socket.destroy();
+        }
+      });
+    } catch (err: unknown) {
+      const message = err instanceof Error ? err.message : String(err);
+      console.error(`Failed to watch the engine list: ${message}`);
+      socket.destroy();
+    }
+  });
+
+  socket.on("error", () => {
+    // Reported by 'close'; the wrapper may simply not be running yet
+  });
+
+  socket.on("close", () => {
+    if (engineListWatchActive) console.warn("Engine list watch closed. Reconnecting.");
+    engineListWatchActive = false;
+    engineListCache = null;
+    setTimeout(watchEngineList, ENGINE_LIST_WATCH_RETRY_MS);
+  });
+
+  connectToWrapper(socket);
+};
+
 const getEngineList = (ws: WebSocket) => {
-  console.log(`Fetching engine list from ${REMOTE_ENGINE_HOST}:${REMOTE_ENGINE_PORT}`);
+  if (!engineListWatchStarted) {
+    engineListWatchStarted = true;
+    watchEngineList();
+  }
+  if (engineListCache) {
+    if (ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ engineList: engineListCache }));
+    }
+    return;
+  }
+  console.log(`Fetching engine list from ${REMOTE_ENGINE_ADDRESS}`);
   const socket = new net.Socket();
   let data = "";
   const accessToken = process.env.WRAPPER_ACCESS_TOKEN;
@@ -1258,7 +1482,7 @@ const getEngineList = (ws: WebSocket) => {
     console.error("Failed to get engine list:", err);
   });
 
-  socket.connect(REMOTE_ENGINE_PORT, REMOTE_ENGINE_HOST);
+  connectToWrapper(socket);
 };
 
 // Add a keep-alive mechanism
@@ -1273,8 +1497,14 @@ const interval = setInterval(function ping() {
   });
 }, 20000);
 
+const clientRttInterval =
+  CLIENT_RTT_PROBE_INTERVAL > 0
+    ? setInterval(() => sessionManager.probeClientRtt(), CLIENT_RTT_PROBE_INTERVAL)
+    : null;
+
 wss.on("close", function close() {
   clearInterval(interval);
+  if (clientRttInterval) clearInterval(clientRttInterval);
 });
 
 wss.on("connection", (ws: ExtendedWebSocket, req) => {
@@ -31,6 +31,21 @@ export function setOnStartSearchHandlerForLan(
   onStartSearch = handler;
 }
 
+// An 'info' line parsed by the engine wrapper ('run <id> format=json')
+type InfoFrame = {
+  depth?: number;
+  seldepth?: number;
+  time?: number;
+  nodes?: number;
+  nps?: number;
+  hashfull?: number;
+  multipv?: number;
+  score?: { cp?: number; mate?: number | "+" | "-"; bound?: "lower" | "upper" };
+  currmove?: string;
+  string?: string;
+  pv?: string[];
+};
+
 const lanPlayers: { [sessionID: number]: LanPlayer } = {};
 
 export function isActiveLanPlayerSession(sessionID: number): boolean {
@@ -302,7 +317,12 @@ export class LanPlayer implements Player {
         return;
       }
 
-      if (data.info) {
+      if (data.infoFrame) {
+        // 'info' line already parsed by the engine wrapper (WRAPPER_OUTPUT_FORMAT=json)
+        if (this.position) {
+          this.updateInfo(this.infoCommandFromFrame(data.infoFrame), data.sfen);
+        }
+      } else if (data.info) {
         const infoStr = data.info as string;
         if (infoStr.startsWith("bestmove")) {
           if (this.stopPromiseResolver || data.sfen === this.currentSfen) {
@@ -424,6 +444,26 @@ export class LanPlayer implements Player {
     return result;
   }
 
+  private infoCommandFromFrame(frame: InfoFrame): USIInfoCommand {
+    const result: USIInfoCommand = {
+      depth: frame.depth,
+      seldepth: frame.seldepth,
+      timeMs: frame.time,
+      nodes: frame.nodes,
+      multipv: frame.multipv,
+      nps: frame.nps,
+      hashfullPerMill: frame.hashfull,
+      currmove: frame.currmove,
+      string: frame.string,
+      pv: frame.pv,
+    };
+    if (frame.score?.cp !== undefined) result.scoreCP = frame.score.cp;
+    if (typeof frame.score?.mate === "number") result.scoreMate = frame.score.mate;
+    if (frame.score?.bound === "lower") result.lowerbound = true;
+    if (frame.score?.bound === "upper") result.upperbound = true;
+    return result;
+  }
+
   private updateInfo(infoCommand: USIInfoCommand, sfen?: string) {
     if (!this.position || !this.onSearchInfo) return;
 
@@ -243,6 +243,33 @@ describe("LanPlayer", () => {
     expect(dispatchUSIInfoUpdate).toBeCalled();
   });
 
+  it("updateInfo should accept info frames parsed by the wrapper", async () => {
+    const onSearchInfo = vi.fn();
+    const player = new LanPlayer("test-session", "test-engine", "Test Engine", onSearchInfo);
+
+    await launchPlayer(player);
+
+    const usi = "position startpos";
+    const record = Record.newByUSI(usi) as Record;
+    await player.startResearch(record.position, usi);
+
+    messageHandler(
+      JSON.stringify({
+        sfen: usi,
+        infoFrame: { depth: 12, multipv: 1, score: { cp: 150 }, nodes: 5000, pv: ["7g7f"] },
+      }),
+    );
+    expect(dispatchUSIInfoUpdate).toBeCalledWith(
+      expect.anything(),
+      expect.anything(),
+      "Test Engine",
+      expect.objectContaining({ depth: 12, scoreCP: 150, nodes: 5000, pv: ["7g7f"] }),
+    );
+
+    vi.advanceTimersByTime(500);
+    expect(onSearchInfo).toBeCalledWith(expect.objectContaining({ depth: 12, score: 150 }));
+  });
+
   it("should resolve launch and set isThinking to true when re-attaching to a thinking engine", async () => {
     const player = new LanPlayer("test-session", "test-engine", "Test Engine");
     await launchPlayer(player, { state: "thinking" });